@@ -12,6 +12,16 @@ const api = axios.create({
   }
 });
 
+// Send the Supabase access token with every request; the analysis routes require it
+api.interceptors.request.use(async (config) => {
+  const { data } = await supabase.auth.getSession();
+  const token = data.session?.access_token;
+  if (token) {
+    config.headers.Authorization = `Bearer ${token}`;
+  }
+  return config;
+});
+
 // Interface for ATM analysis data
 export interface ATMAnalysis {
   id?: string;
@@ -110,6 +120,21 @@ export const ATMAnalysisAPI = {
     
     const { data } = await api.get(`/analysis/v1/user-analyses/${userId}`);
     return data.data || [];
+  },
+
+  // Get chart-ready statistics of the user's analyses, computed by the server
+  getInsights: async (params: { top?: number; bins?: number; areas?: number; budget?: number } = {}): Promise<any> => {
+    const userId = await getUserId();
+    if (!userId) throw new Error('User not authenticated');
+    
+    const { data } = await api.get(`/analysis/v1/insights/${userId}`, { params });
+    return data.data || null;
+  },
+
+  // Download the user's analyses as CSV, Parquet or an Arrow IPC stream
+  exportAnalyses: async (format: 'csv' | 'parquet' | 'arrow' = 'csv'): Promise<Blob> => {
+    const { data } = await api.get('/analysis/v1/export', { params: { format }, responseType: 'blob' });
+    return data;
   }
 };
 
@@ -244,7 +244,9 @@ const AnalysisTool = () => {
       console.log("Sending test data:", testData);
       
       // Send to Flask backend
-      const response = await axios.post('http://localhost:8080/analysis/v1/save', testData);
+      const response = await axios.post('http://localhost:8080/analysis/v1/save', testData, {
+        headers: { Authorization: `Bearer ${data.session?.access_token}` }
+      });
       
       console.log("Server response:", response.data);
       
@@ -1,5 +1,4 @@
 import { useState, useEffect } from "react";
-import axios from "axios";
 import NavBar from "@/components/NavBar";
 import {
     Card,
@@ -14,6 +13,7 @@ import { Button } from "@/components/ui/button";
 import { Slider } from "@/components/ui/slider";
 import { Progress } from "@/components/ui/progress";
 import { supabase } from "@/lib/supabaseClient";
+import { ATMAnalysisAPI } from "@/lib/api";
 import { toast } from "@/hooks/use-toast";
 // Import Recharts components
 import {
@@ -64,123 +64,34 @@ interface ATMLocation {
         trafficFlow: number;
         publicTransport: number;
     };
+    efficiency: number; // Score points per 10,000 of land rate
     isSelected: boolean;
     created_at?: string;
     is_favorite?: boolean;
 }
 
-// Knapsack algorithm implementation
-const solveKnapsack = (
-    locations: ATMLocation[],
-    capacity: number
-): {
-    selectedLocations: ATMLocation[];
-    totalValue: number;
-    usedBudget: number;
-} => {
-    // Sort locations by value-to-weight ratio (score / landRate) for greedy approach
-    const sortedLocations = [...locations].sort(
-        (a, b) =>
-            b.metrics.score / b.metrics.landRate -
-            a.metrics.score / a.metrics.landRate
-    );
-
-    const selectedLocations: ATMLocation[] = [];
-    let totalValue = 0;
-    let usedBudget = 0;
-
-    for (const location of sortedLocations) {
-        if (usedBudget + location.metrics.landRate <= capacity) {
-            selectedLocations.push({ ...location, isSelected: true });
-            totalValue += location.metrics.score;
-            usedBudget += location.metrics.landRate;
-        }
-    }
-
-    return { selectedLocations, totalValue, usedBudget };
-};
-
-// Generate a formatted location name from coordinates
-const formatLocationName = (lat: number, lng: number): string => {
-    const direction = {
-        lat: lat > 13.07 ? "North" : "South",
-        lng: lng > 80.24 ? "East" : "West",
-    };
-
-    return `${direction.lat}${direction.lng} Location (${lat.toFixed(
-        4
-    )}, ${lng.toFixed(4)})`;
-};
-
-// Fetch ATM locations from Flask API
-const fetchAtmLocations = async (): Promise<ATMLocation[]> => {
-    // Get the current user ID from Supabase
-    const { data } = await supabase.auth.getSession();
-    const userId = data.session?.user?.id;
-
-    if (!userId) {
-        throw new Error("User not authenticated");
-    }
-
-    try {
-        // Fetch from your Flask backend
-        const response = await axios.get(
-            `http://localhost:8080/analysis/v1/user-analyses/${userId}`
-        );
-
-        if (response.data.success) {
-            return response.data.data;
-        } else {
-            throw new Error(
-                response.data.error || "Failed to fetch ATM locations"
-            );
-        }
-    } catch (error) {
-        console.error("Error fetching ATM locations:", error);
-        throw error;
-    }
-};
-
-// Add this function to prepare data for cost-benefit chart
-const prepareCostBenefitData = (selectedLocations: ATMLocation[]) => {
-    // Sort locations by efficiency (best value first)
-    const sortedLocations = [...selectedLocations].sort(
-        (a, b) =>
-            b.metrics.score / b.metrics.landRate -
-            a.metrics.score / a.metrics.landRate
-    );
-
-    // Create accumulating data for the chart
-    const data = [];
-    let accumulatedCost = 0;
-    let accumulatedScore = 0;
-
-    // Add a zero point for the chart
-    data.push({
-        name: "Start",
-        cost: 0,
-        score: 0,
-        location: "Initial",
-        efficiency: 0,
-    });
+// Most efficient analyses listed on the locations tab
+const TOP_LOCATIONS = 30;
 
-    // Add each location's cumulative contribution
-    sortedLocations.forEach((location, index) => {
-        accumulatedCost += location.metrics.landRate;
-        accumulatedScore += location.metrics.score;
-
-        data.push({
-            name: `ATM ${index + 1}`,
-            cost: accumulatedCost,
-            score: accumulatedScore,
-            location: `Location ${location.number}`,
-            efficiency:
-                (location.metrics.score / location.metrics.landRate) * 10000,
-        });
-    });
-
-    return data;
-};
+// Convert an analysis ranked by the insights endpoint into an ATM location
+const toATMLocation = (row: any): ATMLocation => ({
+    id: row.id,
+    number: row.rank,
+    location: row.location,
+    metrics: {
+        score: row.score,
+        landRate: row.land_rate,
+        populationDensity: row.factors.population_density,
+        competingATMs: row.factors.competing_atms,
+        commercialActivity: row.factors.commercial_activity,
+        trafficFlow: row.factors.traffic_flow,
+        publicTransport: row.factors.public_transport,
+    },
+    efficiency: row.efficiency,
+    isSelected: false,
+    created_at: row.created_at,
+    is_favorite: row.is_favorite,
+});
 
 // Add this formatter for tooltips
 const formatTooltipValue = (value: number, name: string) => {
@@ -200,6 +111,7 @@ const DataInsights = () => {
     const { user } = useAuth(); // Replace useUserProfile with useAuth
 
     const [locations, setLocations] = useState<ATMLocation[]>([]);
+    const [totalAnalyses, setTotalAnalyses] = useState<number>(0);
     const [budget, setBudget] = useState<number>(200000);
     const [isLoading, setIsLoading] = useState<boolean>(true);
     const [isOptimizing, setIsOptimizing] = useState<boolean>(false);
@@ -207,6 +119,7 @@ const DataInsights = () => {
         selectedLocations: ATMLocation[];
         totalValue: number;
         usedBudget: number;
+        points: { cost: number; score: number; efficiency: number }[];
     } | null>(null);
     const [activeTab, setActiveTab] = useState<string>("locations");
     const [error, setError] = useState<string | null>(null);
@@ -234,8 +147,14 @@ const DataInsights = () => {
         setError(null);
 
         try {
-            const data = await fetchAtmLocations();
-            setLocations(data);
+            const insights = await ATMAnalysisAPI.getInsights({
+                top: TOP_LOCATIONS,
+                areas: 0,
+            });
+            setLocations(
+                (insights?.top_efficiency || []).map(toATMLocation)
+            );
+            setTotalAnalyses(insights?.statistics.analyses || 0);
         } catch (err: any) {
             console.error("Failed to load ATM locations:", err);
             setError(
@@ -260,23 +179,35 @@ const DataInsights = () => {
         setOptimizedResult(null);
     };
 
-    const handleOptimize = () => {
+    const handleOptimize = async () => {
         setIsOptimizing(true);
 
-        // Simulate optimization processing time
-        setTimeout(() => {
-            try {
-                const result = solveKnapsack(locations, budget);
-                setOptimizedResult(result);
-                // Switch to results tab
-                setActiveTab("results");
-            } catch (err) {
-                console.error("Optimization failed:", err);
-                setError("Failed to optimize ATM locations. Please try again.");
-            } finally {
-                setIsOptimizing(false);
-            }
-        }, 1500);
+        try {
+            // The server picks the portfolio from all of the user's analyses
+            const insights = await ATMAnalysisAPI.getInsights({
+                top: 0,
+                areas: 0,
+                budget,
+            });
+            const portfolio = insights.cost_benefit;
+            setOptimizedResult({
+                selectedLocations: portfolio.locations.map((row: any) => ({
+                    ...toATMLocation(row),
+                    isSelected: true,
+                })),
+                totalValue: portfolio.total_score,
+                usedBudget: portfolio.total_cost,
+                points: portfolio.points,
+            });
+            setTotalAnalyses(insights.statistics.analyses);
+            // Switch to results tab
+            setActiveTab("results");
+        } catch (err) {
+            console.error("Optimization failed:", err);
+            setError("Failed to optimize ATM locations. Please try again.");
+        } finally {
+            setIsOptimizing(false);
+        }
     };
 
     const handleGenerateReport = () => {
@@ -328,11 +259,6 @@ const DataInsights = () => {
         return "text-red-600";
     };
 
-    // Calculate efficiency ratio (score per 10,000 land rate)
-    const calculateEfficiency = (score: number, landRate: number): number => {
-        return (score / landRate) * 10000;
-    };
-
     return (
         <div className="min-h-screen bg-background">
             <NavBar />
@@ -424,7 +350,7 @@ const DataInsights = () => {
                                     </p>
                                 </div>
                             </div>
-                        ) : locations.length === 0 ? (
+                        ) : totalAnalyses === 0 ? (
                             <div className="flex flex-col items-center justify-center h-64 text-center">
                                 <div className="bg-muted rounded-full p-3 mb-3">
                                     <MapPin className="h-6 w-6 text-muted-foreground" />
@@ -446,6 +372,11 @@ const DataInsights = () => {
                                 </Button>
                             </div>
                         ) : (
+                            <>
+                            <p className="text-xs sm:text-sm text-muted-foreground mb-4">
+                                Showing the {locations.length} most efficient
+                                of your {totalAnalyses} analyses
+                            </p>
                             <div className="grid grid-cols-1 md:grid-cols-2 xl:grid-cols-3 gap-4 sm:gap-6">
                                 {locations.map((location) => (
                                     <Card
@@ -524,12 +455,7 @@ const DataInsights = () => {
                                                     </div>
                                                     <div className="font-medium flex items-center gap-1 text-sm sm:text-base">
                                                         <Calculator className="h-3 w-3 sm:h-4 sm:w-4 text-muted-foreground" />
-                                                        {calculateEfficiency(
-                                                            location.metrics
-                                                                .score,
-                                                            location.metrics
-                                                                .landRate
-                                                        ).toFixed(1)}
+                                                        {location.efficiency.toFixed(1)}
                                                     </div>
                                                 </div>
                                             </div>
@@ -586,6 +512,7 @@ const DataInsights = () => {
                                     </Card>
                                 ))}
                             </div>
+                            </>
                         )}
                     </TabsContent>
 
@@ -662,7 +589,7 @@ const DataInsights = () => {
                                             onClick={handleOptimize}
                                             disabled={
                                                 isOptimizing ||
-                                                locations.length === 0
+                                                totalAnalyses === 0
                                             }
                                         >
                                             {isOptimizing ? (
@@ -789,7 +716,7 @@ const DataInsights = () => {
                                                 ATMs
                                             </div>
                                             <p className="text-xs sm:text-sm text-muted-foreground">
-                                                Selected from {locations.length}{" "}
+                                                Selected from {totalAnalyses}{" "}
                                                 available locations
                                             </p>
                                         </CardContent>
@@ -967,16 +894,7 @@ const DataInsights = () => {
                                                                         </span>
                                                                     </td>
                                                                     <td className="py-2 sm:py-3 px-2 sm:px-4 text-right font-medium text-xs sm:text-sm">
-                                                                        {calculateEfficiency(
-                                                                            location
-                                                                                .metrics
-                                                                                .score,
-                                                                            location
-                                                                                .metrics
-                                                                                .landRate
-                                                                        ).toFixed(
-                                                                            1
-                                                                        )}
+                                                                        {location.efficiency.toFixed(1)}
                                                                     </td>
                                                                     <td className="py-2 sm:py-3 px-2 sm:px-4 text-right hidden md:table-cell text-xs sm:text-sm">
                                                                         {location.metrics.populationDensity.toFixed(
@@ -1017,9 +935,7 @@ const DataInsights = () => {
                                                 height="100%"
                                             >
                                                 <ComposedChart
-                                                    data={prepareCostBenefitData(
-                                                        optimizedResult.selectedLocations
-                                                    )}
+                                                    data={optimizedResult.points}
                                                     margin={{
                                                         top: 20,
                                                         right: 30,
@@ -1,21 +1,85 @@
-from flask import Flask
+import os
+import time
 import logging
-from app.routes.atm_routes import atm_bp
-from app.routes.analysis_routes import analysis_bp
-from app.utils.db_loader import initialize_cache
+from flask import Flask
+
+# Browser origins allowed to call the API unless CORS_ORIGINS overrides them
+DEFAULT_CORS_ORIGINS = ("http://localhost:5173", "http://localhost:3000")
 
 logger = logging.getLogger(__name__)
 
-def create_app():
+def create_app(warmup=None):
+    """
+    Create the Flask application
+    
+    Importing the app package does no I/O: storage clients are created on
+    first use and the location cache is warmed here, according to warmup:
+    "background" (default) loads it in a thread so the worker serves at once,
+    "eager" blocks until it is loaded, and "off" skips it (tests, CLI tools).
+    The CACHE_WARMUP env var supplies the default.
+    """
+    started = time.perf_counter()
+    
+    from flask_cors import CORS
+    from app.routes.atm_routes import atm_bp, refresh_location
+    from app.routes.analysis_routes import analysis_bp
+    from app.routes.metrics_routes import metrics_bp
+    from app.routes.admin_routes import admin_bp
+    from app.routes.health_routes import health_bp
+    from app.routes.shard_routes import shard_bp
+    from app.utils.profiling import RequestProfiler
+    from app.utils.refresher import CacheRefresher
+    from app.utils.serialization import install_json_provider, ResponseCompressor
+    from app.utils.db_loader import run_warmup, start_background_warmup, warmup_state
+    from app.utils.sharding import get_shard_router
+    
     app = Flask(__name__)
+    install_json_provider(app)
+    app.config["CACHE_WARMUP"] = (warmup or os.environ.get("CACHE_WARMUP", "background")).lower()
+    
+    origins = os.environ.get("CORS_ORIGINS")
+    CORS(app, resources={
+        r"/*": {
+            "origins": [o.strip() for o in origins.split(",")] if origins else list(DEFAULT_CORS_ORIGINS)
+        }
+    })
     
     # Register blueprints
     app.register_blueprint(atm_bp)
     app.register_blueprint(analysis_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(health_bp)
+    app.register_blueprint(shard_bp)
+    
+    # Negotiated gzip/brotli compression (RESPONSE_COMPRESSION=off disables it)
+    compressor = ResponseCompressor.from_env()
+    if compressor is not None:
+        compressor.init_app(app)
+    
+    # Opt-in request profiling (PROFILE_REQUESTS=1)
+    profiler = RequestProfiler.from_env()
+    if profiler is not None:
+        profiler.init_app(app)
+    
+    # Opt-in refresh-ahead of popular and stale cache entries (CACHE_REFRESH=1)
+    refresher = CacheRefresher.from_env(refresh_location)
+    if refresher is not None:
+        refresher.init_app(app)
+    
+    # Fail at startup, not on the first request, when SHARD_* is misconfigured
+    get_shard_router()
     
-    # Initialize cache when app is created (only in production)
-    if app.config.get('ENV') != 'development':
-        logger.info("Production environment detected, initializing cache...")
-        initialize_cache()
+    # Warm the location cache
+    if app.config["CACHE_WARMUP"] == "eager":
+        run_warmup()
+    elif app.config["CACHE_WARMUP"] == "background":
+        start_background_warmup()
+    else:
+        warmup_state["status"] = "skipped"
     
+    logger.info(
+        f"App created in {time.perf_counter() - started:.3f}s "
+        f"(cache warmup: {app.config['CACHE_WARMUP']})"
+    )
     return app
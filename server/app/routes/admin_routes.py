@@ -0,0 +1,96 @@
+import os
+import hmac
+from functools import wraps
+from itertools import chain
+from flask import Blueprint, Response, current_app, jsonify, request
+from app.services.storage import get_storage, ANALYSIS_COLUMNS, DEFAULT_PAGE_SIZE
+from app.utils.export import export_response, export_format_error, paged
+
+admin_bp = Blueprint("admin", __name__, url_prefix='/admin')
+
+def requires_admin(f):
+    """Require the X-Admin-Token header to match ADMIN_TOKEN; refused when none is configured"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        expected = os.environ.get('ADMIN_TOKEN')
+        if not expected:
+            return jsonify({"error": "Admin routes require ADMIN_TOKEN to be configured"}), 403
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), expected):
+            return jsonify({"error": "Admin token is missing or invalid"}), 401
+        return f(*args, **kwargs)
+
+    return decorated
+
+def get_profiler():
+    return current_app.extensions.get("request_profiler")
+
+@admin_bp.route('/profiles', methods=['GET'])
+@requires_admin
+def list_profiles():
+    """List the stored request profiles, newest first"""
+    profiler = get_profiler()
+    if profiler is None:
+        return jsonify({"error": "Request profiling is disabled; set PROFILE_REQUESTS=1"}), 404
+
+    return jsonify({
+        "success": True,
+        "sample_rate": profiler.sample_rate,
+        "slow_ms": profiler.slow_ms,
+        "data": profiler.recent()
+    })
+
+@admin_bp.route('/profiles/<profile_id>', methods=['GET'])
+@requires_admin
+def get_profile(profile_id):
+    """Return one profile as JSON, or its call statistics as text with ?format=text"""
+    profiler = get_profiler()
+    if profiler is None:
+        return jsonify({"error": "Request profiling is disabled; set PROFILE_REQUESTS=1"}), 404
+
+    profile = profiler.get(profile_id)
+    if profile is None:
+        return jsonify({"error": "Profile not found"}), 404
+
+    if request.args.get('format') == 'text':
+        lines = [f"{profile.method} {profile.path} -> {profile.status} in {profile.duration_ms:.1f} ms", ""]
+        for entry in profile.spans:
+            attrs = " ".join(f"{key}={value}" for key, value in entry.get("attrs", {}).items())
+            lines.append(
+                f"{'  ' * entry['depth']}{entry['name']:<24} "
+                f"+{entry['offset_ms']:9.1f} ms  {entry.get('duration_ms', 0):9.1f} ms  {attrs}".rstrip()
+            )
+        if profile.stats:
+            lines += ["", profile.stats]
+        return Response("\n".join(lines), mimetype="text/plain")
+
+    return jsonify({"success": True, "data": profile.to_dict()})
+
+@admin_bp.route('/profiles', methods=['DELETE'])
+@requires_admin
+def clear_profiles():
+    """Discard every stored profile"""
+    profiler = get_profiler()
+    if profiler is None:
+        return jsonify({"error": "Request profiling is disabled; set PROFILE_REQUESTS=1"}), 404
+
+    profiler.clear()
+    return jsonify({"success": True})
+
+@admin_bp.route('/export', methods=['GET'])
+@requires_admin
+def export_all_analyses():
+    """Stream every user's analyses as a file (?format=csv, parquet or arrow)"""
+    format_name = request.args.get('format', 'csv').lower()
+    error = export_format_error(format_name)
+    if error:
+        return jsonify({"error": error}), 400
+
+    records = get_storage().iter_analysis_records(",".join(ANALYSIS_COLUMNS), DEFAULT_PAGE_SIZE)
+    pages = paged(records, DEFAULT_PAGE_SIZE)
+    # Read the first page up front so storage errors still get a proper status
+    try:
+        first = next(pages, [])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    return export_response(chain([first], pages), format_name, "locacash-all-analyses")
@@ -1,17 +1,51 @@
+from itertools import chain
 from flask import Blueprint, request, jsonify
-from app.services.supabase_service import (
-    save_atm_analysis, 
-    get_user_analyses, 
-    get_analysis_by_id,
-    toggle_favorite,
-    supabase
-)
+from app.services.storage import get_storage, DEFAULT_PAGE_SIZE, ANALYSIS_COLUMNS, INSIGHTS_COLUMNS, SUMMARY_COLUMNS
+from app.utils.db_loader import load_records_into_bptree
+from app.utils.response_cache import analysis_cache, cached_per_user
+from app.utils.serialization import get_request_payload, negotiated_response
+from app.utils.auth import requires_auth, is_current_user
+from app.utils.insights import insights_cache
+from app.utils.export import export_response, export_format_error
 
 analysis_bp = Blueprint("analysis", __name__, url_prefix='/analysis/v1')
 
+# Maximum number of analyses accepted by a single /save_batch request
+MAX_BATCH_SIZE = 5000
+
+# Upper bounds on the list and histogram sizes /insights accepts
+MAX_INSIGHTS_TOP = 100
+MAX_INSIGHTS_BINS = 50
+MAX_INSIGHTS_AREAS = 200
+
+def get_page_args():
+    """
+    Read optional ?limit=&cursor= pagination arguments from the query string
+    
+    Returns:
+        tuple: (limit, cursor, paginated) where paginated is False when the
+        caller asked for neither, or (None, None, error message) when invalid
+    """
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    
+    if limit is None and cursor is None:
+        return None, None, False
+    
+    try:
+        limit = int(limit) if limit is not None else DEFAULT_PAGE_SIZE
+    except ValueError:
+        return None, None, "limit must be an integer"
+    
+    if limit < 1 or limit > DEFAULT_PAGE_SIZE:
+        return None, None, f"limit must be between 1 and {DEFAULT_PAGE_SIZE}"
+    
+    return limit, cursor, True
+
 @analysis_bp.route('/save', methods=['POST'])
+@requires_auth
 def save_analysis():
-    """Save ATM analysis data to Supabase"""
+    """Save ATM analysis data to storage"""
     data = request.get_json()
     
     # Extract user_id from the request
@@ -19,23 +53,85 @@ def save_analysis():
     if not user_id:
         return jsonify({"error": "User ID is required"}), 400
     
+    if not is_current_user(user_id):
+        return jsonify({"error": "Token does not belong to this user"}), 403
+    
     # Remove user_id from the data before saving
     analysis_data = {k: v for k, v in data.items() if k != 'user_id'}
     
-    result = save_atm_analysis(user_id, analysis_data)
+    result = get_storage().save_atm_analysis(user_id, analysis_data)
     
     if isinstance(result, dict) and "error" in result:
         return jsonify({"error": result["error"]}), 500
     
+    analysis_cache.invalidate(user_id)
+    if result:
+        insights_cache.add(user_id, [result])
+    
     return jsonify({"success": True, "data": result}), 201
 
+@analysis_bp.route('/save_batch', methods=['POST'])
+@requires_auth
+def save_analysis_batch():
+    """
+    Save many ATM analyses to storage in chunked bulk inserts
+    
+    Accepts and returns MessagePack as well as JSON (Content-Type / Accept).
+    """
+    data = get_request_payload()
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be an object"}), 400
+    
+    user_id = data.get('user_id')
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+    
+    if not is_current_user(user_id):
+        return jsonify({"error": "Token does not belong to this user"}), 403
+    
+    analyses = data.get('analyses')
+    if not isinstance(analyses, list) or not analyses:
+        return jsonify({"error": "analyses must be a non-empty list"}), 400
+    
+    if len(analyses) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"A batch may contain at most {MAX_BATCH_SIZE} analyses"}), 413
+    
+    result = get_storage().save_atm_analyses_batch(user_id, analyses)
+    
+    # Make every saved location available to the cache in a single pass
+    if result["saved"]:
+        analysis_cache.invalidate(user_id)
+        insights_cache.add(user_id, result["saved"])
+        load_records_into_bptree(result["saved"], cache_source="database_batch")
+    
+    status = 201 if result["saved"] else 400
+    return negotiated_response({
+        "success": not result["errors"],
+        "saved_count": len(result["saved"]),
+        "error_count": len(result["errors"]),
+        "data": result["saved"],
+        "errors": result["errors"]
+    }, status)
+
 @analysis_bp.route('/history/<user_id>', methods=['GET'])
+@requires_auth
+@cached_per_user
 def get_history(user_id):
     """Get analysis history for a specific user"""
     if not user_id:
         return jsonify({"error": "User ID is required"}), 400
     
-    result = get_user_analyses(user_id)
+    limit, cursor, paginated = get_page_args()
+    if isinstance(paginated, str):
+        return jsonify({"error": paginated}), 400
+    
+    if paginated:
+        page = get_storage().get_user_analyses_page(user_id, limit, cursor)
+        if "error" in page:
+            return jsonify({"error": page["error"]}), 400 if page["error"] == "Invalid cursor" else 500
+        return jsonify({"success": True, "data": page["data"], "next_cursor": page["next_cursor"]}), 200
+    
+    result = get_storage().get_user_analyses(user_id)
     
     if isinstance(result, dict) and "error" in result:
         return jsonify({"error": result["error"]}), 500
@@ -43,19 +139,96 @@ def get_history(user_id):
     return jsonify({"success": True, "data": result}), 200
 
 @analysis_bp.route('/detail/<analysis_id>/<user_id>', methods=['GET'])
+@requires_auth
+@cached_per_user
 def get_analysis_detail(analysis_id, user_id):
     """Get a specific analysis by ID"""
     if not analysis_id or not user_id:
         return jsonify({"error": "Analysis ID and User ID are required"}), 400
     
-    result = get_analysis_by_id(analysis_id, user_id)
+    result = get_storage().get_analysis_by_id(analysis_id, user_id)
     
     if isinstance(result, dict) and "error" in result:
         return jsonify({"error": result["error"]}), 404 if result["error"] == "Analysis not found" else 500
     
     return jsonify({"success": True, "data": result}), 200
 
+def user_pages(user_id, columns):
+    """Yield a user's analyses page by page, newest first, raising RuntimeError on storage errors"""
+    cursor = None
+    while True:
+        page = get_storage().get_user_analyses_page(user_id, DEFAULT_PAGE_SIZE, cursor, columns)
+        if "error" in page:
+            raise RuntimeError(page["error"])
+        yield page["data"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            return
+
+@analysis_bp.route('/insights/<user_id>', methods=['GET'])
+@requires_auth
+@cached_per_user
+def get_insights(user_id):
+    """
+    Get chart-ready statistics of a user's analyses for the Data Insights dashboard
+    
+    Optional query arguments: top (most efficient analyses to list),
+    bins (land rate histogram bins), areas (areas to summarize) and
+    budget (land rate budget for the cost-benefit portfolio).
+    """
+    try:
+        top = int(request.args.get('top', 10))
+        bins = int(request.args.get('bins', 10))
+        areas = int(request.args.get('areas', 20))
+        budget = request.args.get('budget')
+        budget = float(budget) if budget is not None else None
+    except ValueError:
+        return jsonify({"error": "top, bins and areas must be integers and budget a number"}), 400
+    
+    if not 0 <= top <= MAX_INSIGHTS_TOP:
+        return jsonify({"error": f"top must be between 0 and {MAX_INSIGHTS_TOP}"}), 400
+    if not 1 <= bins <= MAX_INSIGHTS_BINS:
+        return jsonify({"error": f"bins must be between 1 and {MAX_INSIGHTS_BINS}"}), 400
+    if not 0 <= areas <= MAX_INSIGHTS_AREAS:
+        return jsonify({"error": f"areas must be between 0 and {MAX_INSIGHTS_AREAS}"}), 400
+    if budget is not None and not budget >= 0:
+        return jsonify({"error": "budget must be a non-negative number"}), 400
+    
+    try:
+        insights = insights_cache.get(user_id, lambda: user_pages(user_id, SUMMARY_COLUMNS))
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 500
+    
+    with insights.lock:
+        summary = insights.summary(top=top, land_rate_bins=bins, areas=areas, budget=budget)
+    
+    return jsonify({"success": True, "data": summary}), 200
+
+@analysis_bp.route('/export', methods=['GET'])
+@requires_auth
+def export_analyses():
+    """
+    Stream the authenticated user's analyses as a file
+    
+    ?format=csv (default), parquet or arrow (an Arrow IPC stream). Rows are
+    read from storage a page at a time while the response is sent.
+    """
+    format_name = request.args.get('format', 'csv').lower()
+    error = export_format_error(format_name)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    # Read the first page up front so storage errors still get a proper status
+    pages = user_pages(request.user['sub'], ",".join(ANALYSIS_COLUMNS))
+    try:
+        first = next(pages)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 500
+    
+    return export_response(chain([first], pages), format_name, "locacash-analyses")
+
 @analysis_bp.route('/favorite', methods=['POST'])
+@requires_auth
 def update_favorite():
     """Toggle favorite status for an analysis"""
     data = request.get_json()
@@ -66,46 +239,69 @@ def update_favorite():
     if not analysis_id or not user_id:
         return jsonify({"error": "Analysis ID and User ID are required"}), 400
     
-    result = toggle_favorite(analysis_id, user_id, is_favorite)
+    if not is_current_user(user_id):
+        return jsonify({"error": "Token does not belong to this user"}), 403
+    
+    result = get_storage().toggle_favorite(analysis_id, user_id, is_favorite)
     
     if isinstance(result, dict) and "error" in result:
         return jsonify({"error": result["error"]}), 500
     
+    analysis_cache.invalidate(user_id)
+    insights_cache.set_favorite(user_id, analysis_id, is_favorite)
+    
     return jsonify({"success": True, "data": result}), 200
 
 @analysis_bp.route('/supabase-test', methods=['GET'])
 def test_supabase():
-    """Test Supabase connection"""
-    try:
-        # Try a simple query to test the connection
-        result = supabase.table('profiles').select('*').limit(1).execute()
-        return jsonify({
-            "success": True, 
-            "message": "Supabase connection successful",
-            "data": result.data
-        }), 200
-    except Exception as e:
-        print(f"Error connecting to Supabase: {str(e)}")
+    """Test the storage backend connection"""
+    storage = get_storage()
+    result = storage.check_connection()
+    
+    if "error" in result:
         return jsonify({
             "success": False,
-            "error": str(e)
+            "error": result["error"]
         }), 500
+    
+    return jsonify({
+        "success": True, 
+        "message": f"{storage.label} connection successful",
+        "data": result["data"]
+    }), 200
 
 @analysis_bp.route('/user-analyses/<user_id>', methods=['GET'])
+@requires_auth
+@cached_per_user
 def get_user_analyses_endpoint(user_id):
     """Get all ATM analyses for a specific user"""
     if not user_id:
         return jsonify({"error": "User ID is required"}), 400
     
+    limit, cursor, paginated = get_page_args()
+    if isinstance(paginated, str):
+        return jsonify({"success": False, "error": paginated}), 400
+    
     try:
-        result = get_user_analyses(user_id)
+        next_cursor = None
+        offset = 0
+        if paginated:
+            page = get_storage().get_user_analyses_page(user_id, limit, cursor, INSIGHTS_COLUMNS)
+            if "error" in page:
+                status = 400 if page["error"] == "Invalid cursor" else 500
+                return jsonify({"success": False, "error": page["error"]}), status
+            result = page["data"]
+            next_cursor = page["next_cursor"]
+            offset = page["offset"]
+        else:
+            result = get_storage().get_user_analyses(user_id, INSIGHTS_COLUMNS)
         
         if isinstance(result, dict) and "error" in result:
             return jsonify({"success": False, "error": result["error"]}), 500
         
         # Transform the data into a format expected by the frontend
         transformed_data = []
-        for i, analysis in enumerate(result):
+        for i, analysis in enumerate(result, start=offset):
             transformed_data.append({
                 "id": analysis.get('id'),
                 "number": i + 1,  # Auto-number the ATMs
@@ -127,7 +323,10 @@ def get_user_analyses_endpoint(user_id):
                 "is_favorite": analysis.get('is_favorite', False)
             })
         
-        return jsonify({"success": True, "data": transformed_data}), 200
+        response = {"success": True, "data": transformed_data}
+        if paginated:
+            response["next_cursor"] = next_cursor
+        return jsonify(response), 200
     except Exception as e:
         import traceback
         print(f"Error in get_user_analyses_endpoint: {str(e)}")
@@ -1,83 +1,220 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from app.utils import factors
-from app.utils.bptree import bptree, BPlusTree
-from app.utils.score import calculate_scores
-from app.services.supabase_service import supabase
+from app.utils.bptree import bptree
+from app.utils.score import calculate_scores, valid_weights, DEFAULT_WEIGHTS
+from app.utils.db_loader import run_warmup, warmup_state, load_cache_snapshot
+from app.utils.redis_cache import get_l2_cache
+from app.utils.metrics import cache_lookups, time_stage
+from app.utils.profiling import span
+from app.utils.serialization import get_request_payload, negotiated_response
+from app.utils.geokey import canonical_coords, encode_key
+from app.utils.overpass import INTERACTIVE, BATCH, BACKGROUND, UpstreamBusy
+from app.utils.atm_index import get_atm_index, DEFAULT_COMPETITION_RADIUS, DEFAULT_HALF_DISTANCE
+from app.utils.sharding import get_shard_router, shard_requests
 import time
 import logging
+import requests
 
 atm_bp = Blueprint("atm", __name__, url_prefix='/atm/v1')
 
+# Maximum number of locations accepted by a single /fetch_details_batch request
+MAX_BATCH_LOCATIONS = 50
+
+# Proximity match radius: 0.0001 degrees, roughly 11 meters
+PROXIMITY_DEGREES = 0.0001
+PROXIMITY_METERS = PROXIMITY_DEGREES * 111000
+
 # Initialize logger
 logger = logging.getLogger(__name__)
 
-def init_cache_from_database():
-    """Load all previously analyzed ATM locations from Supabase into the B+ Tree cache"""
-    start_time = time.time()
-    loaded_count = 0
+def normalize_coordinates(coords):
+    """Normalize coordinates to the canonical key precision every cache tier uses"""
+    return canonical_coords(coords)
+
+def get_radius_arg(data):
+    """
+    Read the optional radius (meters) of a fetch request
     
-    try:
-        # Fetch all ATM analysis records from the database
-        response = supabase.table('atm_analysis').select('*').execute()
-        
-        logger.info(f"Starting cache initialization from database...")
-        
-        if not hasattr(response, 'data') or not response.data:
-            logger.warning("No data found in database for cache initialization")
-            return 0
-            
-        for record in response.data:
-            # Extract location coordinates
-            lat = record.get('location_lat')
-            lng = record.get('location_lng')
-            
-            if lat is not None and lng is not None:
-                try:
-                    # Create a key for the B+ tree (rounded coordinates tuple)
-                    coords = (float(lat), float(lng))
-                    
-                    # Create a data structure similar to what calculate_location_data returns
-                    location_data = {
-                        "coords": [float(f"{round(lat, 3):.3f}"), float(f"{round(lng, 3):.3f}")],
-                        "population_density": record.get('population_density'),
-                        "competing_atms": record.get('competing_atms'),
-                        "commercial_activity": record.get('commercial_activity'),
-                        "traffic_flow": record.get('traffic_flow'),
-                        "public_transport": record.get('public_transport'),
-                        "land_rate": record.get('land_rate'),
-                        "cached": True,
-                        "cache_source": "database",
-                        "timestamp": record.get('created_at')
-                    }
-                    
-                    # Insert into B+ Tree
-                    bptree.insert(coords, location_data)
-                    loaded_count += 1
-                except Exception as e:
-                    logger.error(f"Error adding record to cache: {str(e)}")
-                    continue
-        
-        duration = time.time() - start_time
-        logger.info(f"Cache initialized with {loaded_count} locations in {duration:.2f} seconds")
-        
-        # Print cache statistics
-        logger.info(f"B+ Tree Stats:")
-        logger.info(f"Total entries: {bptree.size()}")
+    Returns:
+        tuple: (radius or None for the default, error message or None)
+    """
+    radius = data.get('radius')
+    if radius is None:
+        return None, None
+    if radius not in factors.FACTOR_RADII:
+        return None, f"radius must be one of {', '.join(str(r) for r in factors.FACTOR_RADII)}"
+    return radius, None
+
+def has_radius(entry, radius):
+    """Whether a cached entry (record or dict) holds the factors for radius"""
+    if radius is None or radius == entry.get('radius', factors.DEFAULT_RADIUS):
+        return True
+    return str(radius) in (entry.get('radius_factors') or {})
+
+def select_radius(result, radius):
+    """Overlay the factors computed for radius onto a response dict"""
+    if radius is None or radius == result.get('radius', factors.DEFAULT_RADIUS):
+        return result
+    # Entries cached before radius_factors existed keep their base factors
+    radius_factors = (result.get('radius_factors') or {}).get(str(radius))
+    if radius_factors is None:
+        return result
+    result.update(radius_factors)
+    result['radius'] = radius
+    return result
+
+def lookup_l2_cache(coords):
+    """
+    Consult the shared Redis tier for coords, promoting hits into the B+ tree
+    
+    Returns:
+        dict: Response data with hit metadata, or None on a miss
+    """
+    l2_cache = get_l2_cache()
+    if l2_cache is None:
+        return None
+    
+    with time_stage("cache_lookup"), span("l2_lookup"):
+        record = l2_cache.get(coords)
+        match = l2_cache.nearest(coords, PROXIMITY_METERS) if record is None else None
+    
+    if record is not None:
+        cache_lookups.inc(result="l2_hit")
+        bptree.insert(coords, record)
+        result = record.to_dict()
+        result["cache_mechanism"] = "Redis"
+    else:
+        if match is None:
+            return None
+        cache_lookups.inc(result="l2_proximity_hit")
+        matched_coords, record, distance = match
+        bptree.insert(matched_coords, record)
+        result = record.to_dict()
+        result["original_request"] = coords
+        result["matched_coords"] = matched_coords
+        result["distance_meters"] = distance
+        result["cache_mechanism"] = "Redis Proximity Match"
+    
+    logger.info(f"📦 L2 cache hit for {coords} ({result['cache_mechanism']})")
+    result["cache_hit"] = True
+    result["cache_accessed_at"] = time.time()
+    return result
+
+def note_hit(coords, result):
+    """
+    Report a cache hit to the background refresher, if enabled
+    
+    Entries older than CACHE_MAX_AGE are still served, flagged "stale",
+    while the refresher fetches them again.
+    """
+    refresher = current_app.extensions.get("cache_refresher")
+    if refresher is not None and refresher.observe(tuple(coords), result.get("timestamp")):
+        result["stale"] = True
+
+def fetch_and_cache(coords, priority=INTERACTIVE):
+    """
+    Fetch a location from the Overpass API and store it in every cache tier
+    
+    The fallback factors returned when Overpass fails are served but never
+    cached, so the next request for the location tries Overpass again.
+    """
+    # Fetch from Overpass API
+    with time_stage("overpass"):
+        result = factors.calculate_location_data(coords[0], coords[1], priority=priority)
+    
+    # Add miss metadata
+    result["cache_hit"] = False
+    result["timestamp"] = time.time()
+    if result.get("fallback"):
+        logger.warning(f"No Overpass data for {coords}, serving default factors uncached")
+        result["cache_source"] = "fallback"
+        result["cache_mechanism"] = "Fallback"
+        return result
+    
+    result["cache_source"] = "api"
+    result["cache_mechanism"] = "API Direct"
+    cache_location(coords, result)
+    return result
+
+def refresh_location(coords):
+    """
+    Fetch a cached location again for the background refresher
+    
+    Raises instead of caching the fallback factors when Overpass fails, so
+    the entry being refreshed is kept.
+    """
+    result = factors.calculate_location_data(coords[0], coords[1], priority=BACKGROUND)
+    if result.get("fallback"):
+        raise RuntimeError("no data from the Overpass API")
+    
+    result["cache_source"] = "refresh"
+    result["timestamp"] = time.time()
+    cache_location(coords, result)
+    return result
+
+def cache_location(coords, result):
+    """Store fetched location data in the B+ tree and the shared tier"""
+    with span("cache_insert"):
+        bptree.insert(coords, result)
+        logger.info(f"➕ Added new location to B+ Tree cache: {coords}")
         
-        return loaded_count
-    except Exception as e:
-        logger.error(f"Failed to initialize cache from database: {str(e)}")
-        import traceback
-        logger.error(traceback.format_exc())
-        return 0
+        l2_cache = get_l2_cache()
+        if l2_cache is not None:
+            l2_cache.set(coords, result)
 
-# Initialize the cache when this module is imported
-cache_size = init_cache_from_database()
+def forward_lookup(router, coords, radius=None):
+    """
+    Send a lookup to the node owning its cell and relay the answer
+    
+    Returns:
+        Response: The owner's response, or None when the owner is unreachable
+        and the lookup should be served here instead
+    """
+    owner = router.owner(coords)
+    payload = {"Location": list(coords)}
+    if radius is not None:
+        payload["radius"] = radius
+    try:
+        with time_stage("shard_forward"):
+            upstream = router.post(owner, "/internal/v1/shard/lookup", payload)
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Shard owner {owner} unreachable for {coords}, serving locally: {e}")
+        shard_requests.inc(route="fallback")
+        return None
+    
+    shard_requests.inc(route="forwarded")
+    response = current_app.response_class(
+        upstream.content,
+        status=upstream.status_code,
+        content_type=upstream.headers.get("Content-Type", "application/json")
+    )
+    if "Retry-After" in upstream.headers:
+        response.headers["Retry-After"] = upstream.headers["Retry-After"]
+    response.headers["X-Shard-Node"] = owner
+    return response
 
-def normalize_coordinates(coords):
-    """Normalize coordinates to ensure consistent formatting across operations"""
-    # Always use the same rounding precision as in BPlusTree insert/search
-    return tuple(round(float(x), 4) for x in coords)
+def forward_batch(router, owner, coords_list, radius=None):
+    """
+    Send a batch of lookups to the node owning all of their cells
+    
+    Returns:
+        list: One result per location, or None when the owner is unreachable
+    """
+    payload = {"Locations": [list(coords) for coords in coords_list]}
+    if radius is not None:
+        payload["radius"] = radius
+    try:
+        with time_stage("shard_forward"):
+            upstream = router.post(owner, "/internal/v1/shard/lookup_batch", payload)
+        upstream.raise_for_status()
+        results = upstream.json()["data"]
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        logger.warning(f"Shard owner {owner} failed a batch of {len(coords_list)}, serving locally: {e}")
+        shard_requests.inc(len(coords_list), route="fallback")
+        return None
+    
+    shard_requests.inc(len(coords_list), route="forwarded")
+    return results
 
 @atm_bp.route('/fetch_details', methods=['POST'])
 def get_data():
@@ -86,6 +223,10 @@ def get_data():
 
     if not location or len(location) != 2:
         return jsonify({"error": "Invalid location input"}), 400
+    
+    radius, error = get_radius_arg(data)
+    if error:
+        return jsonify({"error": error}), 400
 
     # Normalize coordinates using the helper function
     coords = normalize_coordinates(location)
@@ -94,76 +235,89 @@ def get_data():
     logger.info(f"Original coordinates: {location}")
     logger.info(f"Normalized coordinates: {coords}")
     
-    # Check if already in B+ Tree
-    result = bptree.search(coords)
-    if result is not None:
+    # With a sharded cache, locations in another node's cells are served by that node
+    router = get_shard_router()
+    if router is not None:
+        if not router.is_local(coords):
+            response = forward_lookup(router, coords, radius)
+            if response is not None:
+                return response
+        else:
+            shard_requests.inc(route="local")
+    
+    return serve_location(coords, radius)
+
+def serve_location(coords, radius=None):
+    """Answer a lookup from this node's cache tiers, fetching from Overpass on a miss"""
+    # Check if already in B+ Tree, then for similar coordinates
+    with time_stage("cache_lookup"):
+        record = bptree.search(coords)
+        # Find the closest match within 10 meters (approximately 0.0001 degrees)
+        match = bptree.nearest(coords, PROXIMITY_DEGREES) if record is None else None
+    
+    # Entries cached without the requested radius are fetched again
+    if record is not None and not has_radius(record, radius):
+        record = None
+    if match and not has_radius(match[1], radius):
+        match = None
+    
+    if record is not None:
+        cache_lookups.inc(result="exact_hit")
+        
+        # Materialise the response dict from the compact cache record
+        result = record.to_dict()
+        
         # Enhanced detailed cache hit logging with B+ Tree usage indicator
         hit_source = result.get('cache_source', 'unknown')
         hit_time = result.get('timestamp', 'N/A')
         
         # Print B+ Tree cache hit message
-        logger.info("=" * 60)
-        logger.info(f"🔍 B+ TREE CACHE HIT 🔍")
-        logger.info(f"🚀 Coordinates {coords} found in B+ tree cache")
-        logger.info(f"  └─ Source: {hit_source}")
-        logger.info(f"  └─ Original timestamp: {hit_time}")
-        logger.info(f"  └─ Data: Population Density={result.get('population_density')}, " +
-                   f"Competing ATMs={result.get('competing_atms')}, " +
-                   f"Commercial Activity={result.get('commercial_activity')}")
-        logger.info("=" * 60)
-        
-        # Update hit counter for statistics
-        bptree._hit_count += 1
+        with span("hit_logging"):
+            logger.info("=" * 60)
+            logger.info(f"🔍 B+ TREE CACHE HIT 🔍")
+            logger.info(f"🚀 Coordinates {coords} found in B+ tree cache")
+            logger.info(f"  └─ Source: {hit_source}")
+            logger.info(f"  └─ Original timestamp: {hit_time}")
+            logger.info(f"  └─ Data: Population Density={result.get('population_density')}, " +
+                       f"Competing ATMs={result.get('competing_atms')}, " +
+                       f"Commercial Activity={result.get('commercial_activity')}")
+            logger.info("=" * 60)
         
         # Add hit metadata
         result["cache_hit"] = True
         result["cache_accessed_at"] = time.time()
         result["cache_mechanism"] = "B+ Tree"
-        return jsonify(result)
-
-    # If we get here, we need to check for similar coordinates
-    # Find closest matches within a small radius
-    close_matches = []
-    closest_match = None
-    min_distance = float('inf')
-    
-    if bptree.root and bptree.root.keys:
-        for k in bptree.root.keys:
-            # Calculate distance between points
-            dist = ((k[0] - coords[0])**2 + (k[1] - coords[1])**2)**0.5
-            
-            # If within 10 meters (approximately 0.0001 degrees)
-            if dist < 0.0001:
-                close_matches.append((k, dist))
-                
-                # Track the closest match
-                if dist < min_distance:
-                    min_distance = dist
-                    closest_match = k
+        note_hit(coords, result)
+        return jsonify(select_radius(result, radius))
+
+    # If we get here, use a similar cached location if there is one
+    if match:
+        cache_lookups.inc(result="proximity_hit")
+        closest_match, record, min_distance = match
+        result = record.to_dict()
+        logger.info("=" * 60)
+        logger.info(f"📍 B+ TREE PROXIMITY MATCH 📍")
+        logger.info(f"📡 Found nearby location in cache: {closest_match}")
+        logger.info(f"  └─ Distance: {min_distance * 111000:.2f} meters (approx)")
+        logger.info(f"  └─ Original request: {coords}")
+        logger.info(f"  └─ Source: {result.get('cache_source', 'unknown')}")
+        logger.info("=" * 60)
         
-        # Use the closest match if found
-        if closest_match:
-            result = bptree.search(closest_match)
-            if result:
-                logger.info("=" * 60)
-                logger.info(f"📍 B+ TREE PROXIMITY MATCH 📍")
-                logger.info(f"📡 Found nearby location in cache: {closest_match}")
-                logger.info(f"  └─ Distance: {min_distance * 111000:.2f} meters (approx)")
-                logger.info(f"  └─ Original request: {coords}")
-                logger.info(f"  └─ Source: {result.get('cache_source', 'unknown')}")
-                logger.info("=" * 60)
-                
-                # Update hit counter for statistics
-                bptree._hit_count += 1
-                
-                # Add hit metadata
-                result["cache_hit"] = True
-                result["original_request"] = coords
-                result["matched_coords"] = closest_match
-                result["distance_meters"] = min_distance * 111000  # Rough conversion to meters
-                result["cache_accessed_at"] = time.time()
-                result["cache_mechanism"] = "B+ Tree Proximity Match"
-                return jsonify(result)
+        # Add hit metadata
+        result["cache_hit"] = True
+        result["original_request"] = coords
+        result["matched_coords"] = closest_match
+        result["distance_meters"] = min_distance * 111000  # Rough conversion to meters
+        result["cache_accessed_at"] = time.time()
+        result["cache_mechanism"] = "B+ Tree Proximity Match"
+        note_hit(closest_match, result)
+        return jsonify(select_radius(result, radius))
+
+    # Next, consult the shared second-level cache
+    result = lookup_l2_cache(coords)
+    if result is not None and has_radius(result, radius):
+        note_hit(result.get("matched_coords", coords), result)
+        return jsonify(select_radius(result, radius))
 
     try:
         # Log cache miss with B+ Tree indicator
@@ -172,50 +326,207 @@ def get_data():
         logger.info(f"⚡ Coordinates {coords} not in cache, fetching from API")
         logger.info("=" * 60)
         
-        bptree._miss_count += 1
-        
-        # Fetch from Overpass API
-        result = factors.calculate_location_data(coords[0], coords[1])
-        
-        # Add miss metadata
-        result["cache_hit"] = False
-        result["cache_source"] = "api"
-        result["timestamp"] = time.time()
-        result["cache_mechanism"] = "API Direct"
-        
-        # Insert into cache
-        bptree.insert(coords, result)
-        logger.info(f"➕ Added new location to B+ Tree cache: {coords}")
+        cache_lookups.inc(result="miss")
         
-        return jsonify(result)
+        return jsonify(select_radius(fetch_and_cache(coords), radius))
+    except UpstreamBusy as e:
+        logger.warning(f"Overpass request for {coords} turned away: {e}")
+        response = jsonify({"error": str(e)})
+        if e.retry_after:
+            response.headers["Retry-After"] = str(int(e.retry_after) + 1)
+        return response, 503
     except Exception as e:
         logger.error(f"Failed to analyze location {coords}: {str(e)}")
         return jsonify({"error": f"Failed to analyze location: {str(e)}"}), 500
 
+@atm_bp.route('/fetch_details_batch', methods=['POST'])
+def get_data_batch():
+    """
+    Fetch details for several locations, reading every cache tier in bulk
+    
+    Accepts and returns MessagePack as well as JSON (Content-Type / Accept).
+    """
+    data = get_request_payload()
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be an object"}), 400
+    locations = data.get('Locations')
+    
+    if not isinstance(locations, list) or not locations:
+        return jsonify({"error": "Locations must be a non-empty list"}), 400
+    if len(locations) > MAX_BATCH_LOCATIONS:
+        return jsonify({"error": f"A batch may contain at most {MAX_BATCH_LOCATIONS} locations"}), 413
+    if any(not isinstance(location, list) or len(location) != 2 for location in locations):
+        return jsonify({"error": "Invalid location input"}), 400
+    
+    radius, error = get_radius_arg(data)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    coords_list = [normalize_coordinates(location) for location in locations]
+    
+    router = get_shard_router()
+    if router is None:
+        return negotiated_response({"success": True, "data": serve_batch(coords_list, radius)})
+    
+    # Group the locations by the node owning their cell, one request per node
+    by_owner = {}
+    for i, coords in enumerate(coords_list):
+        by_owner.setdefault(router.owner(coords), []).append(i)
+    
+    results = [None] * len(coords_list)
+    for owner, indices in by_owner.items():
+        owned = [coords_list[i] for i in indices]
+        owner_results = None
+        if owner != router.self_url:
+            owner_results = forward_batch(router, owner, owned, radius)
+        else:
+            shard_requests.inc(len(indices), route="local")
+        if owner_results is None:
+            owner_results = serve_batch(owned, radius)
+        for i, result in zip(indices, owner_results):
+            results[i] = result
+    
+    return negotiated_response({"success": True, "data": results})
+
+def serve_batch(coords_list, radius=None):
+    """
+    Answer several lookups from this node's cache tiers, in bulk
+    
+    Returns:
+        list: One result per location; failed lookups are {"error": ...}
+    """
+    results = [None] * len(coords_list)
+    
+    # In-process tree first
+    with time_stage("cache_lookup"):
+        records = [bptree.search(coords) for coords in coords_list]
+    for i, record in enumerate(records):
+        if record is not None and has_radius(record, radius):
+            cache_lookups.inc(result="exact_hit")
+            results[i] = record.to_dict()
+            results[i]["cache_mechanism"] = "B+ Tree"
+    
+    # Then one pipelined round trip to the shared tier for the misses
+    l2_cache = get_l2_cache()
+    missing = [i for i, result in enumerate(results) if result is None]
+    if l2_cache is not None and missing:
+        with time_stage("cache_lookup"):
+            records = l2_cache.get_many([coords_list[i] for i in missing])
+        for i, record in zip(missing, records):
+            if record is not None and has_radius(record, radius):
+                cache_lookups.inc(result="l2_hit")
+                bptree.insert(coords_list[i], record)
+                results[i] = record.to_dict()
+                results[i]["cache_mechanism"] = "Redis"
+    
+    for coords, result in zip(coords_list, results):
+        if result is not None:
+            result["cache_hit"] = True
+            result["cache_accessed_at"] = time.time()
+            note_hit(coords, result)
+    
+    # Finally fetch whatever is left from the Overpass API
+    for i, result in enumerate(results):
+        if result is None:
+            cache_lookups.inc(result="miss")
+            try:
+                results[i] = fetch_and_cache(coords_list[i], BATCH)
+            except UpstreamBusy as e:
+                results[i] = {"error": str(e)}
+            except Exception as e:
+                logger.error(f"Failed to analyze location {coords_list[i]}: {str(e)}")
+                results[i] = {"error": f"Failed to analyze location: {str(e)}"}
+    
+    for i, result in enumerate(results):
+        if "error" in result:
+            continue
+        try:
+            results[i] = select_radius(result, radius)
+        except Exception as e:
+            logger.error(f"Failed to analyze location {coords_list[i]}: {str(e)}")
+            results[i] = {"error": f"Failed to analyze location: {str(e)}"}
+    
+    return results
+
 @atm_bp.route('/get_score', methods=['POST'])
 def get_score():
-    data = request.get_json()
+    data = request.get_json() or {}
     location_data = data.get('location_data')
     weights = data.get('weights')
 
     if not location_data:
         return jsonify({"error": "Missing location data"}), 400
+    if weights is not None and not valid_weights(weights):
+        return jsonify({
+            "error": f"weights must map each of {', '.join(DEFAULT_WEIGHTS)} to a non-negative number, not all zero"
+        }), 400
 
-    scores = calculate_scores(location_data, weights)
+    with time_stage("scoring"):
+        scores = calculate_scores(location_data, weights)
     return jsonify(scores)
 
+@atm_bp.route('/competition', methods=['POST'])
+def competition():
+    """
+    Distance-decayed competition around a point, from the ATM index alone
+    
+    Never queries Overpass. "covered" is false when no earlier fetch
+    downloaded the whole radius, in which case nearby ATMs may be missing.
+    """
+    data = request.get_json() or {}
+    location = data.get('Location')
+    if not location or len(location) != 2:
+        return jsonify({"error": "Invalid location input"}), 400
+
+    radius = data.get('radius', DEFAULT_COMPETITION_RADIUS)
+    half_distance = data.get('half_distance', DEFAULT_HALF_DISTANCE)
+    if not isinstance(radius, (int, float)) or not 0 < radius <= 5000:
+        return jsonify({"error": "radius must be between 0 and 5000 meters"}), 400
+    if not isinstance(half_distance, (int, float)) or half_distance <= 0:
+        return jsonify({"error": "half_distance must be positive"}), 400
+
+    index = get_atm_index()
+    if index is None:
+        return jsonify({"error": "ATM index is disabled"}), 503
+
+    lat, lng = normalize_coordinates(location)
+    with time_stage("competition"):
+        result = index.competition(lat, lng, radius, half_distance)
+    result.update({"coords": [lat, lng], "radius": radius, "half_distance": half_distance})
+    return jsonify(result)
+
 @atm_bp.route('/cache-status', methods=['GET'])
 def cache_status():
     """Return statistics about the B+ tree cache"""
     try:
         # Get cache statistics
+        lookups = {
+            outcome: cache_lookups.value(result=outcome)
+            for outcome in ("exact_hit", "proximity_hit", "l2_hit", "l2_proximity_hit", "miss")
+        }
+        total_lookups = sum(lookups.values())
         stats = {
             "total_cached_locations": bptree.size(),
-            "database_loaded_locations": cache_size,
-            "memory_usage_estimate": bptree.size() * 1024,  # Rough estimate in bytes
-            "hit_ratio": bptree.get_hit_ratio() if hasattr(bptree, 'get_hit_ratio') else None,
+            "database_loaded_locations": warmup_state["loaded"],
+            "warmup_status": warmup_state["status"],
+            "memory_usage_bytes": bptree.memory_usage(),
+            "lookups": lookups,
+            "hit_ratio": (total_lookups - lookups["miss"]) / total_lookups if total_lookups else 0,
+            "exact_hit_ratio": bptree.get_hit_ratio(),
             "cache_initialized_at": bptree.created_at if hasattr(bptree, 'created_at') else None
         }
+        l2_cache = get_l2_cache()
+        if l2_cache is not None:
+            stats["l2_cache"] = l2_cache.stats()
+        refresher = current_app.extensions.get("cache_refresher")
+        if refresher is not None:
+            stats["refresher"] = refresher.stats()
+        atm_index = get_atm_index()
+        if atm_index is not None:
+            stats["indexed_atms"] = atm_index.size()
+        router = get_shard_router()
+        if router is not None:
+            stats["shard"] = router.stats()
         return jsonify({"success": True, "stats": stats})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -254,41 +565,54 @@ def debug_key():
     if not location or len(location) != 2:
         return jsonify({"error": "Invalid location input"}), 400
 
-    # Format the key in different ways to check
+    # Every cache tier stores the same canonical key
     raw_coords = tuple(location)
-    rounded_3 = tuple(round(float(x), 3) for x in location)
-    rounded_4 = tuple(round(float(x), 4) for x in location)
-    rounded_6 = tuple(round(float(x), 6) for x in location)
-    
-    # Check if any key format exists in tree
-    results = {
-        "raw": str(raw_coords) in str(bptree.root.keys),
-        "rounded_3": str(rounded_3) in str(bptree.root.keys),
-        "rounded_4": str(rounded_4) in str(bptree.root.keys),
-        "rounded_6": str(rounded_6) in str(bptree.root.keys),
-        "exact_match": False,
-        "closest_keys": [],
-    }
-    
-    # Check for direct equality with each key
-    for k in bptree.root.keys:
-        if k == rounded_4:
-            results["exact_match"] = True
-        
-        # Find closest keys
-        if abs(k[0] - rounded_4[0]) < 0.01 and abs(k[1] - rounded_4[1]) < 0.01:
-            results["closest_keys"].append(str(k))
+    coords = normalize_coordinates(location)
+    
+    cache_keys = bptree.keys()
+    closest_keys = [
+        str(k) for k in cache_keys
+        if abs(k[0] - coords[0]) < 0.01 and abs(k[1] - coords[1]) < 0.01
+    ]
     
     return jsonify({
         "search_key": {
             "raw": raw_coords,
-            "rounded_3": rounded_3,
-            "rounded_4": rounded_4,
-            "rounded_6": rounded_6
+            "canonical": coords,
+            "code": encode_key(coords)
+        },
+        "results": {
+            "exact_match": coords in set(cache_keys),
+            "closest_keys": closest_keys
         },
-        "results": results,
-        "cache_keys_sample": [str(k) for k in bptree.root.keys[:10]],
-        "total_keys": len(bptree.root.keys)
+        "cache_keys_sample": [str(k) for k in cache_keys[:10]],
+        "total_keys": len(cache_keys)
+    })
+
+@atm_bp.route('/merge-snapshot', methods=['POST'])
+def merge_snapshot():
+    """
+    Merge the CACHE_SNAPSHOT_PATH snapshot into the cache, keeping every entry
+    
+    Use this, not reinitialize-cache, to pick up a prefetch run: clearing
+    would drop the locations this worker fetched since its last snapshot.
+    With the per-process cache only the worker serving the request merges;
+    LOCATION_CACHE=shared or REDIS_URL make prefetched locations visible to
+    every worker without it.
+    """
+    try:
+        loaded = load_cache_snapshot()
+    except Exception as e:
+        logger.error(f"Failed to merge cache snapshot: {str(e)}")
+        return jsonify({"success": False, "error": str(e)}), 500
+    
+    return jsonify({
+        "success": True,
+        "message": f"Merged {loaded} snapshot entries into the cache",
+        "stats": {
+            "total_cached_locations": bptree.size(),
+            "hit_ratio": bptree.get_hit_ratio()
+        }
     })
 
 @atm_bp.route('/reinitialize-cache', methods=['POST'])
@@ -296,12 +620,10 @@ def reinitialize_cache():
     """Force reinitialization of the cache"""
     try:
         # Clear existing cache
-        global bptree
-        bptree = BPlusTree()  # Create a new instance
+        bptree.clear()
         
         # Reinitialize
-        global cache_size
-        cache_size = init_cache_from_database()
+        cache_size = run_warmup()
         
         return jsonify({
             "success": True,
@@ -313,4 +635,4 @@ def reinitialize_cache():
         })
     except Exception as e:
         logger.error(f"Failed to reinitialize cache: {str(e)}")
-        return jsonify({"success": False, "error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"success": False, "error": str(e)}), 500
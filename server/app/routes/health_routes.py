@@ -0,0 +1,24 @@
+from flask import Blueprint, jsonify
+from app.utils.bptree import bptree
+from app.utils.db_loader import warmup_state
+
+health_bp = Blueprint("health", __name__)
+
+# Warmup states in which the worker can serve traffic with a useful cache
+READY_STATES = ("ready", "skipped")
+
+@health_bp.route('/healthz', methods=['GET'])
+def liveness():
+    """Liveness probe: the worker process is up and answering requests"""
+    return jsonify({"status": "ok"})
+
+@health_bp.route('/readyz', methods=['GET'])
+def readiness():
+    """Readiness probe: 200 once the location cache warmup has finished, 503 before"""
+    ready = warmup_state["status"] in READY_STATES
+    return jsonify({
+        "status": "ready" if ready else "not_ready",
+        "warmup": warmup_state["status"],
+        "cache_entries": bptree.size(),
+        "error": warmup_state["error"]
+    }), 200 if ready else 503
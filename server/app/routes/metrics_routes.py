@@ -0,0 +1,14 @@
+from flask import Blueprint, Response
+from app.utils.bptree import bptree
+from app.utils.metrics import registry
+
+metrics_bp = Blueprint("metrics", __name__)
+
+registry.gauge("locacash_cache_entries", "Locations held in the location cache", bptree.size)
+registry.gauge("locacash_cache_memory_bytes", "Bytes held by location cache keys and records", bptree.memory_usage)
+registry.gauge("locacash_cache_exact_hit_ratio", "Exact-key hit ratio of the location cache", bptree.get_hit_ratio)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose metrics in the Prometheus text exposition format"""
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,104 @@
+import logging
+from functools import wraps
+from flask import Blueprint, jsonify, request
+from app.utils.bptree import bptree
+from app.utils.geokey import canonical_coords
+from app.utils.sharding import get_shard_router, TOKEN_HEADER
+from app.utils.serialization import negotiated_response
+from app.routes.atm_routes import serve_location, serve_batch, get_radius_arg, MAX_BATCH_LOCATIONS
+
+shard_bp = Blueprint("shard", __name__, url_prefix='/internal/v1/shard')
+
+logger = logging.getLogger(__name__)
+
+def requires_shard_token(f):
+    """Only serve other nodes: 404 when sharding is off, 401 without the shared X-Shard-Token"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        router = get_shard_router()
+        if router is None:
+            return jsonify({"error": "Sharding is disabled; set SHARD_NODES"}), 404
+        if not router.check_token(request.headers.get(TOKEN_HEADER)):
+            return jsonify({"error": "Shard token is missing or invalid"}), 401
+        return f(router, *args, **kwargs)
+
+    return decorated
+
+@shard_bp.route('/lookup', methods=['POST'])
+@requires_shard_token
+def lookup(router):
+    """Serve a /fetch_details lookup forwarded by another node from this node's cache"""
+    data = request.get_json() or {}
+    location = data.get('Location')
+    if not location or len(location) != 2:
+        return jsonify({"error": "Invalid location input"}), 400
+
+    radius, error = get_radius_arg(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    # Served here even if this node's ring disagrees, so lookups never bounce between nodes
+    return serve_location(canonical_coords(location), radius)
+
+@shard_bp.route('/lookup_batch', methods=['POST'])
+@requires_shard_token
+def lookup_batch(router):
+    """Serve the part of a /fetch_details_batch request whose cells this node owns"""
+    data = request.get_json() or {}
+    locations = data.get('Locations')
+    if not isinstance(locations, list) or not locations or len(locations) > MAX_BATCH_LOCATIONS:
+        return jsonify({"error": f"Locations must be a list of 1 to {MAX_BATCH_LOCATIONS} locations"}), 400
+    if any(not isinstance(location, list) or len(location) != 2 for location in locations):
+        return jsonify({"error": "Invalid location input"}), 400
+
+    radius, error = get_radius_arg(data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    results = serve_batch([canonical_coords(location) for location in locations], radius)
+    return negotiated_response({"success": True, "data": results})
+
+@shard_bp.route('/ingest', methods=['POST'])
+@requires_shard_token
+def ingest(router):
+    """Store cache entries handed over by a node that no longer owns their cells"""
+    data = request.get_json() or {}
+    entries = data.get('entries')
+    if not isinstance(entries, list):
+        return jsonify({"error": "entries must be a list"}), 400
+
+    try:
+        items = [(canonical_coords(entry["coords"]), entry["data"]) for entry in entries]
+    except (KeyError, TypeError, ValueError, IndexError):
+        return jsonify({"error": "Each entry needs coords and data"}), 400
+
+    count = bptree.insert_many(items)
+    logger.info(f"Took over {count} cache entries from {request.headers.get('X-Shard-Forwarded', 'another node')}")
+    return jsonify({"success": True, "stored": count})
+
+@shard_bp.route('/nodes', methods=['GET'])
+@requires_shard_token
+def get_nodes(router):
+    """Return this node's view of the ring"""
+    return jsonify({"success": True, "data": router.stats()})
+
+@shard_bp.route('/nodes', methods=['PUT'])
+@requires_shard_token
+def set_nodes(router):
+    """
+    Replace the ring's membership when a node joins or leaves
+
+    Send the new node list to every node, including one that is leaving.
+    Each hands the entries it no longer owns to their new owners in the
+    background; poll GET /nodes for the rebalance progress of every worker.
+    """
+    data = request.get_json() or {}
+    nodes = data.get('nodes')
+    if not isinstance(nodes, list) or not all(isinstance(node, str) and node for node in nodes):
+        return jsonify({"error": "nodes must be a list of node URLs"}), 400
+
+    if router.set_nodes(nodes):
+        logger.info(f"Shard membership changed to {router.ring.nodes}, rebalancing")
+        router.start_rebalance(bptree)
+
+    return jsonify({"success": True, "data": router.stats()}), 202
@@ -0,0 +1,182 @@
+import json
+import uuid
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from app.services.storage import StorageBackend, ANALYSIS_COLUMNS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS atm_analysis (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    location_lat REAL NOT NULL,
+    location_lng REAL NOT NULL,
+    population_density REAL,
+    competing_atms INTEGER,
+    commercial_activity INTEGER,
+    traffic_flow INTEGER,
+    public_transport INTEGER,
+    land_rate REAL,
+    overall_score REAL,
+    population_density_score REAL,
+    competing_atms_score REAL,
+    commercial_activity_score REAL,
+    traffic_flow_score REAL,
+    public_transport_score REAL,
+    land_rate_score REAL,
+    population_density_weight REAL,
+    competing_atms_weight REAL,
+    commercial_activity_weight REAL,
+    traffic_flow_weight REAL,
+    public_transport_weight REAL,
+    land_rate_weight REAL,
+    recommendations TEXT,
+    created_at TEXT NOT NULL,
+    is_favorite INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_atm_analysis_user_created
+    ON atm_analysis (user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_atm_analysis_created_at
+    ON atm_analysis (created_at);
+CREATE INDEX IF NOT EXISTS idx_atm_analysis_location
+    ON atm_analysis (location_lat, location_lng);
+"""
+
+class SQLiteStorage(StorageBackend):
+    """
+    Local SQLite storage backend for offline development and load tests
+
+    The database runs in WAL mode so readers never block the writer, and each
+    thread gets its own connection since sqlite3 connections cannot be
+    shared across threads.
+    """
+
+    name = "sqlite"
+    label = "SQLite"
+
+    def __init__(self, path="locacash.db"):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self.connection.executescript(SCHEMA)
+
+    @property
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """Close every connection opened by this backend"""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    @staticmethod
+    def select_clause(columns):
+        """Validate a comma-separated projection against the table's columns"""
+        if columns == '*':
+            return ", ".join(ANALYSIS_COLUMNS)
+
+        names = [name.strip() for name in columns.split(",") if name.strip()]
+        unknown = [name for name in names if name not in ANALYSIS_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+        return ", ".join(names)
+
+    @staticmethod
+    def to_record(row):
+        """Convert a sqlite3.Row into the dict shape Supabase returns"""
+        record = dict(row)
+        if record.get("recommendations") is not None:
+            record["recommendations"] = json.loads(record["recommendations"])
+        if "is_favorite" in record:
+            record["is_favorite"] = bool(record["is_favorite"])
+        return record
+
+    def insert_rows(self, rows):
+        created_at = datetime.now(timezone.utc).isoformat()
+        records = []
+        for row in rows:
+            record = {column: row.get(column) for column in ANALYSIS_COLUMNS}
+            record["id"] = str(uuid.uuid4())
+            record["created_at"] = created_at
+            record["is_favorite"] = bool(row.get("is_favorite", False))
+            records.append(record)
+
+        placeholders = ", ".join("?" for _ in ANALYSIS_COLUMNS)
+        with self.connection as conn:
+            conn.executemany(
+                f"INSERT INTO atm_analysis ({', '.join(ANALYSIS_COLUMNS)}) VALUES ({placeholders})",
+                [
+                    tuple(
+                        json.dumps(record[column]) if column == "recommendations" else record[column]
+                        for column in ANALYSIS_COLUMNS
+                    )
+                    for record in records
+                ]
+            )
+
+        return records
+
+    def fetch_user_page(self, user_id, limit, position, columns):
+        sql = f"SELECT {self.select_clause(columns)} FROM atm_analysis WHERE user_id = ?"
+        params = [user_id]
+
+        if position:
+            sql += " AND (created_at < ? OR (created_at = ? AND id < ?))"
+            params += [position.get("created_at"), position.get("created_at"), position.get("id")]
+
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+
+        return [self.to_record(row) for row in self.connection.execute(sql, params)]
+
+    def fetch_analysis(self, analysis_id, user_id):
+        row = self.connection.execute(
+            f"SELECT {self.select_clause('*')} FROM atm_analysis WHERE id = ? AND user_id = ? LIMIT 1",
+            (analysis_id, user_id)
+        ).fetchone()
+
+        return self.to_record(row) if row else None
+
+    def update_favorite(self, analysis_id, user_id, is_favorite):
+        with self.connection as conn:
+            cursor = conn.execute(
+                "UPDATE atm_analysis SET is_favorite = ? WHERE id = ? AND user_id = ?",
+                (int(is_favorite), analysis_id, user_id)
+            )
+
+        if cursor.rowcount == 0:
+            return None
+        return self.fetch_analysis(analysis_id, user_id)
+
+    def fetch_records_after(self, last_id, columns, page_size):
+        sql = f"SELECT {self.select_clause(columns)} FROM atm_analysis"
+        params = []
+
+        if last_id is not None:
+            sql += " WHERE id > ?"
+            params.append(last_id)
+
+        sql += " ORDER BY id LIMIT ?"
+        params.append(page_size)
+
+        return [self.to_record(row) for row in self.connection.execute(sql, params)]
+
+    def fetch_latest_created_at(self):
+        return self.connection.execute("SELECT MAX(created_at) FROM atm_analysis").fetchone()[0]
+
+    def ping(self):
+        return [dict(row) for row in self.connection.execute("SELECT COUNT(*) AS analyses FROM atm_analysis")]
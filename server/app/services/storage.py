@@ -0,0 +1,458 @@
+import os
+import json
+import base64
+import threading
+from functools import wraps
+from dotenv import load_dotenv
+from app.utils.metrics import time_stage
+
+load_dotenv()
+
+# Page size used for keyset-paginated reads from atm_analysis
+DEFAULT_PAGE_SIZE = 1000
+
+# Upper bound on rows sent in a single bulk insert request
+BATCH_INSERT_CHUNK_SIZE = 500
+
+# Every column of the atm_analysis table, in schema order
+ANALYSIS_COLUMNS = (
+    "id", "user_id", "location_lat", "location_lng",
+    "population_density", "competing_atms", "commercial_activity",
+    "traffic_flow", "public_transport", "land_rate",
+    "overall_score", "population_density_score", "competing_atms_score",
+    "commercial_activity_score", "traffic_flow_score",
+    "public_transport_score", "land_rate_score",
+    "population_density_weight", "competing_atms_weight",
+    "commercial_activity_weight", "traffic_flow_weight",
+    "public_transport_weight", "land_rate_weight",
+    "recommendations", "created_at", "is_favorite"
+)
+
+# Column projections for each consumer of atm_analysis, so reads never pull
+# score, weight or recommendations columns they do not use
+CACHE_COLUMNS = (
+    "id,location_lat,location_lng,population_density,competing_atms,"
+    "commercial_activity,traffic_flow,public_transport,land_rate,"
+    "overall_score,created_at"
+)
+INSIGHTS_COLUMNS = (
+    "id,location_lat,location_lng,overall_score,population_density,"
+    "competing_atms,commercial_activity,traffic_flow,public_transport,"
+    "created_at,is_favorite"
+)
+SUMMARY_COLUMNS = (
+    "id,location_lat,location_lng,overall_score,land_rate,created_at,is_favorite,"
+    "population_density,competing_atms,commercial_activity,traffic_flow,public_transport"
+)
+
+def encode_cursor(values):
+    """Encode a keyset position as an opaque URL-safe cursor string"""
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor, or return None if invalid"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return values if isinstance(values, dict) else None
+    except (ValueError, TypeError):
+        return None
+
+def build_analysis_row(user_id, analysis_data):
+    """
+    Build an atm_analysis table row from submitted analysis data
+
+    Args:
+        user_id (str): The authenticated user ID
+        analysis_data (dict): Analysis data with location, factors, scores and weights
+
+    Returns:
+        dict: Row ready to insert into atm_analysis
+    """
+    # Convert recommendations if it's a string to parse it as JSON
+    recommendations = analysis_data.get("recommendations", [])
+    if isinstance(recommendations, str):
+        try:
+            recommendations = json.loads(recommendations)
+        except:
+            # If parsing fails, keep as is
+            pass
+
+    return {
+        "user_id": user_id,
+        "location_lat": analysis_data.get("location_lat"),
+        "location_lng": analysis_data.get("location_lng"),
+
+        # Raw factors from analysis
+        "population_density": analysis_data.get("population_density"),
+        "competing_atms": analysis_data.get("competing_atms"),
+        "commercial_activity": analysis_data.get("commercial_activity"),
+        "traffic_flow": analysis_data.get("traffic_flow"),
+        "public_transport": analysis_data.get("public_transport"),
+        "land_rate": analysis_data.get("land_rate"),
+
+        # Score data
+        "overall_score": analysis_data.get("overall_score"),
+        "population_density_score": analysis_data.get("population_density_score"),
+        "competing_atms_score": analysis_data.get("competing_atms_score"),
+        "commercial_activity_score": analysis_data.get("commercial_activity_score"),
+        "traffic_flow_score": analysis_data.get("traffic_flow_score"),
+        "public_transport_score": analysis_data.get("public_transport_score"),
+        "land_rate_score": analysis_data.get("land_rate_score"),
+
+        # Weights used for calculation
+        "population_density_weight": analysis_data.get("population_density_weight"),
+        "competing_atms_weight": analysis_data.get("competing_atms_weight"),
+        "commercial_activity_weight": analysis_data.get("commercial_activity_weight"),
+        "traffic_flow_weight": analysis_data.get("traffic_flow_weight"),
+        "public_transport_weight": analysis_data.get("public_transport_weight"),
+        "land_rate_weight": analysis_data.get("land_rate_weight"),
+
+        # Recommendations as JSON
+        "recommendations": recommendations
+    }
+
+def validate_analysis_data(analysis_data):
+    """
+    Check that submitted analysis data can be stored
+
+    Args:
+        analysis_data (dict): Analysis data with location, factors, scores and weights
+
+    Returns:
+        str: Error message, or None if the data is valid
+    """
+    if not isinstance(analysis_data, dict):
+        return "Analysis must be an object"
+
+    for field in ("location_lat", "location_lng"):
+        value = analysis_data.get(field)
+        if value is None:
+            return f"{field} is required"
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return f"{field} must be a number"
+
+    if not -90 <= analysis_data["location_lat"] <= 90:
+        return "location_lat must be between -90 and 90"
+    if not -180 <= analysis_data["location_lng"] <= 180:
+        return "location_lng must be between -180 and 180"
+
+    return None
+
+def with_cursor_columns(columns):
+    """Extend a column projection with the id and created_at keyset columns"""
+    if columns == '*':
+        return columns
+    return ",".join(dict.fromkeys(columns.split(",") + ["id", "created_at"]))
+
+def timed_storage(f):
+    """Record a storage method's duration under the "storage" request stage"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        with time_stage("storage"):
+            return f(*args, **kwargs)
+    
+    return decorated
+
+class StorageBackend:
+    """
+    Interface for persisting ATM analyses
+
+    Backends implement the small set of primitive operations below; the
+    public methods shared by every backend (validation, chunking, cursor
+    handling and the {"error": ...} convention used by the routes) are
+    implemented here on top of them.
+    """
+
+    name = "base"
+    label = "Base"
+
+    # Primitive operations implemented by each backend
+
+    def insert_rows(self, rows):
+        """Insert prepared rows and return the stored records"""
+        raise NotImplementedError
+
+    def fetch_user_page(self, user_id, limit, position, columns):
+        """Return up to limit rows for a user, newest first, after the keyset position"""
+        raise NotImplementedError
+
+    def fetch_analysis(self, analysis_id, user_id):
+        """Return one analysis record, or None if it does not exist"""
+        raise NotImplementedError
+
+    def update_favorite(self, analysis_id, user_id, is_favorite):
+        """Set the favorite flag and return the updated record, or None"""
+        raise NotImplementedError
+
+    def fetch_records_after(self, last_id, columns, page_size):
+        """Return up to page_size rows of any user ordered by id, after last_id"""
+        raise NotImplementedError
+
+    def fetch_latest_created_at(self):
+        """Return the newest created_at of any row, or None when the table is empty"""
+        raise NotImplementedError
+
+    def ping(self):
+        """Run a trivial query to check that the backend is reachable, returning sample rows"""
+        raise NotImplementedError
+
+    # Public API used by routes and loaders
+
+    @timed_storage
+    def save_atm_analysis(self, user_id, analysis_data):
+        """
+        Store ATM analysis data
+
+        Args:
+            user_id (str): The authenticated user ID
+            analysis_data (dict): Analysis data with location, factors, scores and weights
+
+        Returns:
+            dict: The saved record or error message
+        """
+        try:
+            print(f"Attempting to save analysis for user: {user_id}")
+
+            saved = self.insert_rows([build_analysis_row(user_id, analysis_data)])
+            saved = saved[0] if saved else None
+
+            print(f"Success! Saved analysis {saved.get('id') if saved else None}")
+            return saved
+        except Exception as e:
+            print(f"Error saving analysis: {str(e)}")
+            # Print more debugging info
+            import traceback
+            traceback.print_exc()
+            return {"error": str(e)}
+
+    @timed_storage
+    def save_atm_analyses_batch(self, user_id, analyses, chunk_size=BATCH_INSERT_CHUNK_SIZE):
+        """
+        Validate and store many ATM analyses using chunked bulk inserts
+
+        Invalid rows are reported and skipped; a failing chunk marks only its
+        own rows as errored so the rest of the batch is still saved.
+
+        Args:
+            user_id (str): The authenticated user ID
+            analyses (list): Analysis data dicts, as accepted by save_atm_analysis
+            chunk_size (int): Maximum rows per insert request
+
+        Returns:
+            dict: {"saved": records, "errors": [{"index": int, "error": str}]}
+        """
+        saved = []
+        errors = []
+        pending = []
+
+        for index, analysis_data in enumerate(analyses):
+            error = validate_analysis_data(analysis_data)
+            if error:
+                errors.append({"index": index, "error": error})
+            else:
+                pending.append((index, build_analysis_row(user_id, analysis_data)))
+
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            try:
+                saved.extend(self.insert_rows([row for _, row in chunk]))
+            except Exception as e:
+                print(f"Error saving analysis chunk at row {chunk[0][0]}: {str(e)}")
+                errors.extend({"index": index, "error": str(e)} for index, _ in chunk)
+
+        print(f"Batch save for user {user_id}: {len(saved)} saved, {len(errors)} failed")
+        return {"saved": saved, "errors": errors}
+
+    @timed_storage
+    def get_user_analyses_page(self, user_id, limit=DEFAULT_PAGE_SIZE, cursor=None, columns='*'):
+        """
+        Get one page of a user's ATM analyses, newest first
+
+        Uses keyset pagination on (created_at, id) so every page costs the
+        same regardless of how deep into the history the cursor points.
+
+        Args:
+            user_id (str): The authenticated user ID
+            limit (int): Maximum number of rows to return
+            cursor (str, optional): Cursor returned with the previous page
+            columns (str): Comma-separated column projection
+
+        Returns:
+            dict: {"data": rows, "next_cursor": str or None, "offset": int} or error message
+        """
+        try:
+            position = decode_cursor(cursor)
+            if cursor and position is None:
+                return {"error": "Invalid cursor"}
+
+            rows = self.fetch_user_page(user_id, limit, position, with_cursor_columns(columns))
+
+            offset = position.get("offset", 0) if position else 0
+            next_cursor = None
+            if len(rows) == limit:
+                next_cursor = encode_cursor({
+                    "created_at": rows[-1].get('created_at'),
+                    "id": rows[-1].get('id'),
+                    "offset": offset + len(rows)
+                })
+
+            return {"data": rows, "next_cursor": next_cursor, "offset": offset}
+        except Exception as e:
+            print(f"Error fetching analyses page: {str(e)}")
+            return {"error": str(e)}
+
+    def get_user_analyses(self, user_id, columns='*'):
+        """
+        Get all ATM analyses for a specific user
+
+        Args:
+            user_id (str): The authenticated user ID
+            columns (str): Comma-separated column projection
+
+        Returns:
+            list: List of ATM analyses
+        """
+        analyses = []
+        cursor = None
+        while True:
+            page = self.get_user_analyses_page(user_id, DEFAULT_PAGE_SIZE, cursor, columns)
+            if "error" in page:
+                return page
+
+            analyses.extend(page["data"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                return analyses
+
+    @timed_storage
+    def get_analysis_by_id(self, analysis_id, user_id):
+        """
+        Get a specific analysis by ID
+
+        Args:
+            analysis_id (str): The analysis ID
+            user_id (str): The authenticated user ID
+
+        Returns:
+            dict: The analysis record or error message
+        """
+        try:
+            record = self.fetch_analysis(analysis_id, user_id)
+            if not record:
+                return {"error": "Analysis not found"}
+
+            return record
+        except Exception as e:
+            print(f"Error fetching analysis: {str(e)}")
+            return {"error": str(e)}
+
+    @timed_storage
+    def toggle_favorite(self, analysis_id, user_id, is_favorite):
+        """
+        Toggle favorite status for an analysis
+
+        Args:
+            analysis_id (str): The analysis ID
+            user_id (str): The authenticated user ID
+            is_favorite (bool): The new favorite status
+
+        Returns:
+            dict: The updated record or error message
+        """
+        try:
+            return self.update_favorite(analysis_id, user_id, bool(is_favorite))
+        except Exception as e:
+            print(f"Error updating favorite status: {str(e)}")
+            return {"error": str(e)}
+
+    def iter_analysis_records(self, columns=CACHE_COLUMNS, page_size=DEFAULT_PAGE_SIZE):
+        """
+        Stream every atm_analysis row, one keyset page at a time
+
+        Pages are ordered by primary key so each request resumes after the
+        last id seen, keeping memory flat no matter how large the table grows.
+
+        Args:
+            columns (str): Comma-separated column projection (must include id)
+            page_size (int): Number of rows fetched per round trip
+
+        Yields:
+            dict: One atm_analysis row
+        """
+        last_id = None
+        while True:
+            with time_stage("storage"):
+                rows = self.fetch_records_after(last_id, columns, page_size)
+            yield from rows
+
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1]['id']
+
+    @timed_storage
+    def latest_analysis_time(self):
+        """
+        Return when the newest analysis was saved, so caches loaded from
+        storage can tell whether it has changed since
+
+        Returns:
+            str: ISO 8601 created_at of the newest row, or None if there are none
+        """
+        return self.fetch_latest_created_at()
+
+    @timed_storage
+    def check_connection(self):
+        """
+        Test the storage connection
+
+        Returns:
+            dict: {"success": True, "data": sample rows} or error message
+        """
+        try:
+            return {"success": True, "data": self.ping()}
+        except Exception as e:
+            print(f"Error connecting to {self.name} storage: {str(e)}")
+            return {"error": str(e)}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def create_storage(backend=None):
+    """
+    Create the storage backend named by backend or the STORAGE_BACKEND env var
+
+    Args:
+        backend (str, optional): "supabase" (default) or "sqlite"
+
+    Returns:
+        StorageBackend: A new backend instance
+    """
+    backend = (backend or os.environ.get("STORAGE_BACKEND", "supabase")).lower()
+
+    if backend == "sqlite":
+        from app.services.sqlite_service import SQLiteStorage
+        return SQLiteStorage(os.environ.get("SQLITE_PATH", "locacash.db"))
+    if backend == "supabase":
+        from app.services.supabase_service import SupabaseStorage
+        return SupabaseStorage()
+
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+def get_storage():
+    """Return the process-wide storage backend, creating it on first use"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+    return _storage
+
+def set_storage(storage):
+    """Replace the process-wide storage backend (used by tools and benchmarks)"""
+    global _storage
+    with _storage_lock:
+        _storage = storage
@@ -0,0 +1,255 @@
+import os
+import math
+import time
+import sqlite3
+import logging
+import threading
+from app.utils.geokey import KEY_SCALE, quantize
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS atm_points (
+    osm_id TEXT PRIMARY KEY,
+    lat REAL NOT NULL,
+    lng REAL NOT NULL,
+    lat_key INTEGER NOT NULL,
+    lng_key INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_atm_points_location ON atm_points (lat_key, lng_key);
+CREATE TABLE IF NOT EXISTS atm_coverage (
+    lat_key INTEGER NOT NULL,
+    lng_key INTEGER NOT NULL,
+    radius REAL NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (lat_key, lng_key)
+) WITHOUT ROWID;
+"""
+
+# File name of the index when its location is derived from other settings
+DEFAULT_INDEX_FILE = "atm_index.db"
+
+# Meters per degree of latitude, for local distance approximations
+METERS_PER_DEGREE = 111320
+
+# Competition counts ATMs within this many meters...
+DEFAULT_COMPETITION_RADIUS = 1500
+# ...each weighted 0.5 ** (distance / half distance), so an ATM 500 m away counts half
+DEFAULT_HALF_DISTANCE = 500
+
+# Fetches centered further away than this are not considered when checking coverage
+COVERAGE_SEARCH_RADIUS = 5000
+
+def distance_meters(lat1, lng1, lat2, lng2):
+    """Equirectangular distance, accurate to well under 1% at city scale"""
+    d_lat = (lat2 - lat1) * METERS_PER_DEGREE
+    d_lng = (lng2 - lng1) * METERS_PER_DEGREE * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.hypot(d_lat, d_lng)
+
+def decayed_competition(atms, radius, half_distance=DEFAULT_HALF_DISTANCE):
+    """
+    Sum 0.5 ** (distance / half_distance) over the ATMs within radius meters
+
+    One ATM next door counts about 1 and one at the edge of a 1.5 km radius
+    about 0.125, so a cluster far away weighs less than a single ATM nearby.
+
+    Args:
+        atms (list): (distance in meters, ...) tuples, as returned by ATMIndex.nearby
+    """
+    return round(sum(0.5 ** (atm[0] / half_distance) for atm in atms if atm[0] <= radius), 3)
+
+def atm_points(elements):
+    """Yield (osm id, lat, lng) for every ATM in Overpass elements, using way centers"""
+    for element in elements:
+        tags = element.get("tags")
+        if not tags or tags.get("amenity") != "atm":
+            continue
+        point = element if "lat" in element else element.get("center")
+        if point is None or "lat" not in point:
+            continue
+        yield f"{element.get('type', 'node')}/{element.get('id')}", point["lat"], point["lon"]
+
+class ATMIndex:
+    """
+    Persistent index of every ATM seen in a fetched Overpass payload
+
+    Points are deduplicated by OSM id and kept in SQLite with a fixed-point
+    (lat_key, lng_key) index, so nearby ATMs are a range query. The areas
+    each payload covered are recorded too: re-downloading an area replaces
+    its ATMs (dropping ones removed from OSM), and competition around a
+    point can be answered locally once a fetch has covered it.
+
+    Connections are opened lazily per thread and per process, like
+    SharedLocationCache, so gunicorn workers can share one index file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        if getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    @staticmethod
+    def box(lat, lng, radius):
+        """Fixed-point key bounds of the square enclosing a circle"""
+        lat_key, lng_key = quantize((lat, lng))
+        lat_span = int(radius / METERS_PER_DEGREE * KEY_SCALE) + 1
+        lng_span = int(radius / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)) * KEY_SCALE) + 1
+        return lat_key - lat_span, lat_key + lat_span, lng_key - lng_span, lng_key + lng_span
+
+    def update_area(self, lat, lng, radius, elements):
+        """
+        Replace the ATMs within radius meters of a point with those in a fresh payload
+
+        Args:
+            lat (float): Latitude the payload was fetched around
+            lng (float): Longitude the payload was fetched around
+            radius (float): Radius in meters the payload was fetched with
+            elements (list): Elements from the Overpass API response
+
+        Returns:
+            int: Number of ATMs in the payload
+        """
+        now = time.time()
+        points = {osm_id: (atm_lat, atm_lng) for osm_id, atm_lat, atm_lng in atm_points(elements)}
+        conn = self.connection
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # ATMs inside the downloaded circle but missing from it were removed from OSM
+            stale = [
+                osm_id for osm_id, atm_lat, atm_lng in conn.execute(
+                    "SELECT osm_id, lat, lng FROM atm_points "
+                    "WHERE lat_key BETWEEN ? AND ? AND lng_key BETWEEN ? AND ?",
+                    self.box(lat, lng, radius)
+                )
+                if osm_id not in points and distance_meters(lat, lng, atm_lat, atm_lng) < radius
+            ]
+            conn.executemany("DELETE FROM atm_points WHERE osm_id = ?", [(osm_id,) for osm_id in stale])
+            conn.executemany(
+                "INSERT OR REPLACE INTO atm_points (osm_id, lat, lng, lat_key, lng_key, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (osm_id, atm_lat, atm_lng, *quantize((atm_lat, atm_lng)), now)
+                    for osm_id, (atm_lat, atm_lng) in points.items()
+                ]
+            )
+            conn.execute(
+                "INSERT INTO atm_coverage (lat_key, lng_key, radius, fetched_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (lat_key, lng_key) DO UPDATE SET "
+                "radius = max(radius, excluded.radius), fetched_at = excluded.fetched_at",
+                (*quantize((lat, lng)), radius, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return len(points)
+
+    def is_covered(self, lat, lng, radius):
+        """Whether a single earlier fetch covered the whole circle around a point"""
+        # A covering fetch's center is less than its own radius from this point
+        for fetch_lat_key, fetch_lng_key, fetch_radius in self.connection.execute(
+            "SELECT lat_key, lng_key, radius FROM atm_coverage "
+            "WHERE lat_key BETWEEN ? AND ? AND lng_key BETWEEN ? AND ?",
+            self.box(lat, lng, COVERAGE_SEARCH_RADIUS)
+        ):
+            fetch_lat, fetch_lng = fetch_lat_key / KEY_SCALE, fetch_lng_key / KEY_SCALE
+            if distance_meters(lat, lng, fetch_lat, fetch_lng) + radius <= fetch_radius:
+                return True
+        return False
+
+    def nearby(self, lat, lng, radius):
+        """
+        Return the indexed ATMs within radius meters of a point
+
+        Returns:
+            list: (distance in meters, osm id, lat, lng) tuples, nearest first
+        """
+        results = []
+        for osm_id, atm_lat, atm_lng in self.connection.execute(
+            "SELECT osm_id, lat, lng FROM atm_points "
+            "WHERE lat_key BETWEEN ? AND ? AND lng_key BETWEEN ? AND ?",
+            self.box(lat, lng, radius)
+        ):
+            distance = distance_meters(lat, lng, atm_lat, atm_lng)
+            if distance <= radius:
+                results.append((distance, osm_id, atm_lat, atm_lng))
+        results.sort()
+        return results
+
+    def competition(self, lat, lng, radius=DEFAULT_COMPETITION_RADIUS, half_distance=DEFAULT_HALF_DISTANCE):
+        """
+        Distance-decayed competition around a point, from the index alone
+
+        Returns:
+            dict: competition_index, competing_atms (plain count), nearest_atm_meters
+                  and covered (whether a fetch covered the whole radius)
+        """
+        atms = self.nearby(lat, lng, radius)
+        return {
+            "competition_index": decayed_competition(atms, radius, half_distance),
+            "competing_atms": len(atms),
+            "nearest_atm_meters": round(atms[0][0], 1) if atms else None,
+            "covered": self.is_covered(lat, lng, radius)
+        }
+
+    def size(self):
+        """Return the number of indexed ATMs"""
+        return self.connection.execute("SELECT COUNT(*) FROM atm_points").fetchone()[0]
+
+_atm_index = None
+_atm_index_lock = threading.Lock()
+_atm_index_checked = False
+
+def default_index_path():
+    """
+    atm_index.db next to the SQLite storage file or the cache snapshot,
+    whichever is configured, or None when neither is
+    """
+    anchor = None
+    if os.environ.get("STORAGE_BACKEND", "").lower() == "sqlite":
+        anchor = os.environ.get("SQLITE_PATH")
+    anchor = anchor or os.environ.get("CACHE_SNAPSHOT_PATH")
+    if not anchor:
+        return None
+    return os.path.join(os.path.dirname(os.path.abspath(anchor)), DEFAULT_INDEX_FILE)
+
+def get_atm_index():
+    """
+    Return the ATM index stored at ATM_INDEX_PATH, or None
+
+    Without ATM_INDEX_PATH the index lives next to the configured storage or
+    snapshot file (see default_index_path), so no process drops a database
+    in its working directory. Set ATM_INDEX_PATH=off to disable the index.
+    """
+    global _atm_index, _atm_index_checked
+    if not _atm_index_checked:
+        with _atm_index_lock:
+            if not _atm_index_checked:
+                path = os.environ.get("ATM_INDEX_PATH") or default_index_path()
+                if path is None:
+                    logger.info("ATM index disabled: set ATM_INDEX_PATH, SQLITE_PATH or CACHE_SNAPSHOT_PATH to enable it")
+                elif path.lower() != "off":
+                    _atm_index = ATMIndex(path)
+                _atm_index_checked = True
+    return _atm_index
+
+def set_atm_index(index):
+    """Replace the ATM index (used by tests and benchmarks)"""
+    global _atm_index, _atm_index_checked
+    with _atm_index_lock:
+        _atm_index = index
+        _atm_index_checked = True
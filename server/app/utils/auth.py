@@ -1,9 +1,14 @@
 import os
 import jwt
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 from functools import wraps
 from flask import request, jsonify
 from datetime import datetime
 from dotenv import load_dotenv
+from app.utils.metrics import registry
 
 load_dotenv()
 
@@ -12,20 +17,95 @@ JWT_SECRET = os.environ.get('SUPABASE_JWT_SECRET')
 SUPABASE_URL = os.environ.get('SUPABASE_URL')
 SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
 
+# Verified tokens kept per process; 0 disables the cache
+DEFAULT_TOKEN_CACHE_SIZE = 1024
+# Seconds a verified token is trusted without re-verifying, even before it expires
+DEFAULT_TOKEN_CACHE_TTL = 300
+
+class TokenCache:
+    """
+    Thread-safe LRU of verified token payloads, keyed by the token's SHA-256
+
+    Entries are kept until the token's exp claim or ttl seconds after
+    verification, whichever comes first, and are checked against the clock
+    on every lookup, so a cached token stops being accepted at the same
+    moment jwt.decode would start rejecting it. Tokens that fail
+    verification are never cached. A max_size of 0 disables the cache.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if not self.max_size:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, payload):
+        if not self.max_size:
+            return
+        expires_at = time.time() + self.ttl
+        if 'exp' in payload:
+            expires_at = min(expires_at, float(payload['exp']))
+        with self._lock:
+            self._entries[key] = (expires_at, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+token_cache = TokenCache(
+    int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', DEFAULT_TOKEN_CACHE_SIZE)),
+    float(os.environ.get('AUTH_TOKEN_CACHE_TTL', DEFAULT_TOKEN_CACHE_TTL))
+)
+
+registry.counter_callback(
+    "locacash_auth_token_cache_lookups",
+    "Verified token cache lookups by result (hit, miss)",
+    ("result",),
+    lambda: {("hit",): token_cache.hits, ("miss",): token_cache.misses}
+)
+
 def get_token_from_header():
     """Extract the JWT token from the Authorization header"""
     auth_header = request.headers.get('Authorization')
     if not auth_header:
         return None
-    
+
     parts = auth_header.split()
     if parts[0].lower() != 'bearer' or len(parts) != 2:
         return None
-    
+
     return parts[1]
 
 def decode_token(token):
-    """Decode and verify the JWT token"""
+    """Decode and verify the JWT token, reusing earlier verifications until expiry"""
+    key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(key)
+    if payload is not None:
+        return payload
+
     try:
         # For Supabase JWT validation
         payload = jwt.decode(
@@ -34,28 +114,42 @@ def decode_token(token):
             algorithms=['HS256'],
             options={"verify_signature": True}
         )
-        return payload
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
 
+    token_cache.set(key, payload)
+    return payload
+
+def is_current_user(user_id):
+    """Whether user_id is the authenticated user of the current request"""
+    return user_id is not None and user_id == request.user.get('sub')
+
 def requires_auth(f):
-    """Decorator to require authentication for routes"""
+    """
+    Decorator to require authentication for routes
+
+    Routes taking a user_id URL parameter only serve the token's own user.
+    Apply it above cached_per_user so cached responses are checked too.
+    """
     @wraps(f)
     def decorated(*args, **kwargs):
         token = get_token_from_header()
-        
+
         if not token:
             return jsonify({"error": "Authorization token is missing"}), 401
-        
+
         payload = decode_token(token)
         if not payload:
             return jsonify({"error": "Invalid or expired token"}), 401
-        
+
         # Add the user info to the Flask request object
         request.user = payload
-        
+
+        if 'user_id' in kwargs and not is_current_user(kwargs['user_id']):
+            return jsonify({"error": "Token does not belong to this user"}), 403
+
         return f(*args, **kwargs)
-    
-    return decorated
\ No newline at end of file
+
+    return decorated
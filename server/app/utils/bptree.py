@@ -1,120 +1,251 @@
-import logging
-import time
-
-class BPlusTreeNode:
-    def __init__(self, leaf=True):  # Default to leaf=True for simplicity
-        self.leaf = leaf
-        self.keys = []
-        self.children = []
-        self.next_leaf = None  # For leaf node traversal
-
-class BPlusTree:
-    def __init__(self):
-        # Initialize with an empty root node (leaf node)
-        self.root = BPlusTreeNode(leaf=True)
-        self.created_at = time.time()
-        self._hit_count = 0
-        self._miss_count = 0
-
-    def key_match(self, key1, key2):
-        """Check if two keys match, accounting for floating point precision issues"""
-        if len(key1) != len(key2):
-            return False
-        
-        # Compare with a small epsilon for floating point precision
-        epsilon = 1e-6
-        for i in range(len(key1)):
-            if abs(key1[i] - key2[i]) > epsilon:
-                return False
-        return True
-
-    def insert(self, key, value):
-        if not self.root:
-            self.root = BPlusTreeNode(leaf=True)
-            
-        key = tuple(round(float(k), 4) for k in key)
-        node = self.root
-
-        # Check if key already exists
-        for i, k in enumerate(node.keys):
-            if k == key:
-                node.children[i] = value
-                return
-
-        node.keys.append(key)
-        node.children.append(value)
-        
-        # Sort keys to maintain order (important for B+ trees)
-        # This is a simple implementation; a production B+ tree would split nodes
-        indices = sorted(range(len(node.keys)), key=lambda i: node.keys[i])
-        node.keys = [node.keys[i] for i in indices]
-        node.children = [node.children[i] for i in indices]
-
-    def search(self, key):
-        if not self.root:
-            self._miss_count += 1
-            return None
-            
-        # Format key exactly the same way as in insert method
-        key = tuple(round(float(k), 4) for k in key)
-        node = self.root
-        
-        # Log all keys for debugging
-        logger = logging.getLogger(__name__)
-        logger.info(f"Searching for key: {key}")
-        logger.info(f"Available keys: {self.root.keys}")
-        
-        # Track cache hits/misses
-        for i, k in enumerate(node.keys):
-            if self.key_match(k, key):  # Use custom key comparison
-                self._hit_count += 1
-                logger.info(f"EXACT MATCH FOUND: {k} ≈ {key}")
-                return node.children[i]
-        
-        self._miss_count += 1
-        return None
-
-    def get_all(self):
-        """Return all key-value pairs in the B+ tree"""
-        result = {}
-        
-        if not self.root:
-            return result
-            
-        # Simple implementation for single-node tree
-        for i in range(len(self.root.keys)):
-            key = self.root.keys[i]
-            value = self.root.children[i]
-            result[key] = value
-            
-        return result
-    
-    def size(self):
-        """Return the number of keys in the tree"""
-        if not self.root:
-            return 0
-        return len(self.root.keys)
-    
-    def get_hit_ratio(self):
-        """Calculate cache hit ratio"""
-        total = self._hit_count + self._miss_count
-        if total == 0:
-            return 0
-        return self._hit_count / total
-    
-    def print_structure(self):
-        """Print a summary of the B+ tree structure"""
-        if not self.root:
-            logging.info("Empty tree")
-            return
-            
-        logging.info(f"Tree Statistics:")
-        logging.info(f"Total Keys: {len(self.root.keys)}")
-        logging.info(f"Hit Count: {self._hit_count}")
-        logging.info(f"Miss Count: {self._miss_count}")
-        if self._hit_count + self._miss_count > 0:
-            hit_ratio = self._hit_count / (self._hit_count + self._miss_count)
-            logging.info(f"Hit Ratio: {hit_ratio:.2f}")
-
-# Create a shared instance
-bptree = BPlusTree()
+import os
+import sys
+import logging
+import time
+import threading
+import weakref
+from bisect import bisect_left
+from app.utils.location_record import LocationRecord
+from app.utils.geokey import KEY_SCALE, quantize, encode_key, decode_key, decode_quantized, morton_from_quantized
+
+# Every live tree, so one fork hook can reset their locks
+_trees = weakref.WeakSet()
+
+def _reset_locks_after_fork():
+    """A fork while another thread held a tree's lock must not leave it held in the child"""
+    for tree in list(_trees):
+        tree._reset_lock()
+
+if hasattr(os, "register_at_fork"):  # POSIX only
+    os.register_at_fork(after_in_child=_reset_locks_after_fork)
+
+class BPlusTreeNode:
+    def __init__(self, leaf=True):  # Default to leaf=True for simplicity
+        self.leaf = leaf
+        self.keys = []
+        self.children = []
+        self.next_leaf = None  # For leaf node traversal
+
+class BPlusTree:
+    """
+    In-process location cache keyed by canonical Morton codes
+    
+    Keys are the integer codes from app.utils.geokey, held in sorted
+    (spatial) order in the leaf with their records alongside, plus a dict
+    from code to record so exact lookups are a single hash probe. Public
+    methods take and return (lat, lng) tuples.
+    
+    Writers (request threads, the warmup, the refresher, shard ingest) hold
+    a lock, so the leaf's keys and records never fall out of step. Exact
+    lookups read the dict without it.
+    """
+    
+    def __init__(self):
+        # Initialize with an empty root node (leaf node)
+        self.root = BPlusTreeNode(leaf=True)
+        self._entries = {}
+        self.created_at = time.time()
+        self._hit_count = 0
+        self._miss_count = 0
+        self._lock = threading.Lock()
+        _trees.add(self)
+    
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    def insert(self, key, value):
+        """Insert or replace a location; dict values are stored as compact LocationRecords"""
+        if isinstance(value, dict):
+            value = LocationRecord.from_dict(value)
+        
+        code = encode_key(key)
+        with self._lock:
+            node = self.root
+            i = bisect_left(node.keys, code)
+            
+            if i < len(node.keys) and node.keys[i] == code:
+                node.children[i] = value
+            else:
+                node.keys.insert(i, code)
+                node.children.insert(i, value)
+            self._entries[code] = value
+
+    def insert_many(self, items):
+        """Insert or replace (key, value) pairs, re-sorting the keys only once
+        
+        Returns:
+            int: Number of pairs inserted
+        """
+        pairs = [
+            (encode_key(key), LocationRecord.from_dict(value) if isinstance(value, dict) else value)
+            for key, value in items
+        ]
+        with self._lock:
+            self._entries.update(pairs)
+            node = self.root
+            node.keys = sorted(self._entries)
+            node.children = [self._entries[code] for code in node.keys]
+        return len(pairs)
+
+    def delete_many(self, keys):
+        """Remove keys, re-sorting the tree only once
+        
+        Returns:
+            int: Number of keys that were present
+        """
+        codes = [encode_key(key) for key in keys]
+        with self._lock:
+            count = sum(1 for code in codes if self._entries.pop(code, None) is not None)
+            node = self.root
+            node.keys = sorted(self._entries)
+            node.children = [self._entries[code] for code in node.keys]
+        return count
+
+    def search(self, key):
+        """Return the LocationRecord stored for a key, or None"""
+        code = encode_key(key)
+        
+        # Formatting the key is only paid at DEBUG level
+        logger = logging.getLogger(__name__)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Searching for key: {key} (code {code})")
+        
+        # Track cache hits/misses
+        record = self._entries.get(code)
+        if record is None:
+            self._miss_count += 1
+            return None
+        
+        self._hit_count += 1
+        return record
+
+    def keys(self):
+        """Return every key, in Morton (spatial) order"""
+        return [decode_key(code) for code in self.root.keys]
+
+    def nearest(self, key, max_distance):
+        """
+        Find the stored location closest to key within max_distance degrees
+        
+        Small radii probe every grid cell in range by hash; radii covering
+        more cells than the cache holds scan the entries instead.
+        
+        Returns:
+            tuple: (matched key, LocationRecord, distance) or None
+        """
+        lat_key, lng_key = quantize(key)
+        limit = max_distance * KEY_SCALE + 1e-9
+        span = int(limit)
+        
+        # clear() swaps the dict and writers resize it, so bind it once and
+        # keep the record found rather than indexing it again
+        entries = self._entries
+        best = None
+        if (2 * span + 1) ** 2 <= len(entries):
+            for d_lat in range(-span, span + 1):
+                for d_lng in range(-span, span + 1):
+                    dist = (d_lat * d_lat + d_lng * d_lng) ** 0.5
+                    if dist > limit or (best is not None and dist >= best[0]):
+                        continue
+                    code = morton_from_quantized(lat_key + d_lat, lng_key + d_lng)
+                    record = entries.get(code)
+                    if record is not None:
+                        best = (dist, code, record)
+        else:
+            with self._lock:
+                items = list(entries.items())
+            for code, record in items:
+                other_lat, other_lng = decode_quantized(code)
+                dist = ((other_lat - lat_key) ** 2 + (other_lng - lng_key) ** 2) ** 0.5
+                if dist <= limit and (best is None or dist < best[0]):
+                    best = (dist, code, record)
+        
+        if best is None:
+            return None
+        dist, code, record = best
+        return decode_key(code), record, dist / KEY_SCALE
+
+    def clear(self):
+        """Remove every entry and reset the hit/miss statistics"""
+        with self._lock:
+            self.root = BPlusTreeNode(leaf=True)
+            self._entries = {}
+        self.created_at = time.time()
+        self._hit_count = 0
+        self._miss_count = 0
+
+    def get_all(self):
+        """Return all key-value pairs in the B+ tree"""
+        with self._lock:
+            pairs = list(zip(self.root.keys, self.root.children))
+        return {decode_key(code): value for code, value in pairs}
+    
+    def size(self):
+        """Return the number of keys in the tree"""
+        return len(self._entries)
+    
+    def memory_usage(self, sample_size=1000):
+        """
+        Estimate the bytes held by keys and records in the tree
+        
+        Sizes every key and record (including their field values) exactly for
+        small trees; larger trees are measured on an evenly spaced sample of
+        sample_size entries and scaled up, to keep scrapes cheap.
+        """
+        keys = self.root.keys
+        if not keys:
+            return 0
+        
+        step = max(1, len(keys) // sample_size)
+        sampled = range(0, len(keys), step)
+        
+        sample_bytes = 0
+        for i in sampled:
+            sample_bytes += sys.getsizeof(keys[i])
+            record = self.root.children[i]
+            sample_bytes += sys.getsizeof(record)
+            if isinstance(record, LocationRecord):
+                for slot in LocationRecord.__slots__:
+                    value = getattr(record, slot)
+                    # None, bools and interned source labels are shared objects
+                    if value is not None and not isinstance(value, bool) and slot != "cache_source":
+                        sample_bytes += sys.getsizeof(value)
+        
+        container_bytes = sys.getsizeof(keys) + sys.getsizeof(self.root.children) + sys.getsizeof(self._entries)
+        return int(sample_bytes * len(keys) / len(sampled)) + container_bytes
+
+    def get_hit_ratio(self):
+        """Calculate cache hit ratio"""
+        total = self._hit_count + self._miss_count
+        if total == 0:
+            return 0
+        return self._hit_count / total
+    
+    def print_structure(self):
+        """Print a summary of the B+ tree structure"""
+        if not self.root:
+            logging.info("Empty tree")
+            return
+            
+        logging.info(f"Tree Statistics:")
+        logging.info(f"Total Keys: {len(self.root.keys)}")
+        logging.info(f"Hit Count: {self._hit_count}")
+        logging.info(f"Miss Count: {self._miss_count}")
+        if self._hit_count + self._miss_count > 0:
+            hit_ratio = self._hit_count / (self._hit_count + self._miss_count)
+            logging.info(f"Hit Ratio: {hit_ratio:.2f}")
+
+def create_location_cache():
+    """
+    Create the location cache selected by the LOCATION_CACHE env var
+    
+    "local" (default) keeps a BPlusTree in each process; "shared" keeps one
+    SharedLocationCache file that every worker process on the host uses.
+    """
+    if os.environ.get("LOCATION_CACHE", "local").lower() == "shared":
+        from app.utils.shared_cache import SharedLocationCache
+        return SharedLocationCache(os.environ.get("SHARED_CACHE_PATH") or None)
+    return BPlusTree()
+
+# Create a shared instance
+bptree = create_location_cache()
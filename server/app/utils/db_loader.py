@@ -1,97 +1,116 @@
+import os
+import json
 import logging
 import time
-from app.services.supabase_service import supabase
+import threading
+from app.services.storage import get_storage, CACHE_COLUMNS
 from app.utils.bptree import bptree
+from app.utils.sharding import get_shard_router
 
 logger = logging.getLogger(__name__)
 
+# Progress of the cache warmup, reported by /atm/v1/cache-status
+warmup_state = {
+    "status": "pending",
+    "loaded": 0,
+    "started_at": None,
+    "finished_at": None,
+    "error": None
+}
+_warmup_lock = threading.Lock()
+
+# Shared cache metadata recording the sources of the last completed warmup
+WARMUP_MARKER = "warmup_generation"
+
 def print_database_records():
-    """Fetch and print all ATM analysis records from Supabase"""
+    """Stream and print all ATM analysis records from storage, page by page"""
+    record_count = 0
     try:
-        # Fetch all records from the atm_analysis table
-        response = supabase.table('atm_analysis').select('*').execute()
+        logger.info("===== DATABASE RECORDS =====")
         
-        if hasattr(response, 'data') and response.data:
-            record_count = len(response.data)
-            logger.info(f"===== DATABASE RECORDS ({record_count} total) =====")
-            
-            # Print a header for the table format
-            logger.info(f"{'ID':<8} | {'Latitude':<10} | {'Longitude':<10} | {'Score':<5} | {'Land Rate':<10} | {'Pop Density':<10} | {'ATMs':<4}")
-            logger.info("-" * 80)
-            
-            # Print each record in a tabular format
-            for record in response.data:
-                logger.info(
-                    f"{str(record.get('id', ''))[:7]:<8} | "
-                    f"{record.get('location_lat', ''):<10.6f} | "
-                    f"{record.get('location_lng', ''):<10.6f} | "
-                    f"{record.get('overall_score', ''):<5.1f} | "
-                    f"{record.get('land_rate', ''):<10} | "
-                    f"{record.get('population_density', ''):<10.2f} | "
-                    f"{record.get('competing_atms', ''):<4}"
-                )
-            
-            logger.info("=" * 80)
+        # Print a header for the table format
+        logger.info(f"{'ID':<8} | {'Latitude':<10} | {'Longitude':<10} | {'Score':<5} | {'Land Rate':<10} | {'Pop Density':<10} | {'ATMs':<4}")
+        logger.info("-" * 80)
+        
+        # Print each record in a tabular format
+        for record in get_storage().iter_analysis_records(CACHE_COLUMNS):
+            logger.info(
+                f"{str(record.get('id', ''))[:7]:<8} | "
+                f"{record.get('location_lat', ''):<10.6f} | "
+                f"{record.get('location_lng', ''):<10.6f} | "
+                f"{record.get('overall_score', ''):<5.1f} | "
+                f"{record.get('land_rate', ''):<10} | "
+                f"{record.get('population_density', ''):<10.2f} | "
+                f"{record.get('competing_atms', ''):<4}"
+            )
+            record_count += 1
+        
+        logger.info("=" * 80)
+        if record_count:
             logger.info(f"Total records: {record_count}")
-            
-            # Return the data for potential further processing
-            return response.data
         else:
             logger.warning("No records found in the database.")
-            return []
+        
+        return record_count
     except Exception as e:
         logger.error(f"Error fetching database records: {str(e)}")
         import traceback
         logger.error(traceback.format_exc())
-        return []
+        return record_count
+
+def iter_location_data(records, cache_source):
+    """Convert atm_analysis records into (coords, location data) cache entries"""
+    for record in records:
+        # Extract location coordinates
+        lat = record.get('location_lat')
+        lng = record.get('location_lng')
+        
+        if lat is not None and lng is not None:
+            # Create a key for the B+ tree
+            coords = (float(lat), float(lng))
+            
+            # Create a data structure for B+ tree storage
+            location_data = {
+                "coords": [float(lat), float(lng)],
+                "population_density": record.get('population_density'),
+                "competing_atms": record.get('competing_atms'),
+                "commercial_activity": record.get('commercial_activity'),
+                "traffic_flow": record.get('traffic_flow'),
+                "public_transport": record.get('public_transport'),
+                "land_rate": record.get('land_rate'),
+                "overall_score": record.get('overall_score'),
+                "cached": True,
+                "cache_source": cache_source,
+                "timestamp": record.get('created_at')
+            }
+            
+            yield coords, location_data
 
-def load_records_into_bptree(records=None):
+def owned_entries(entries):
+    """Keep only the (coords, data) entries whose cell this node owns, when sharded"""
+    router = get_shard_router()
+    if router is None:
+        return entries
+    return ((coords, data) for coords, data in entries if router.is_local(coords))
+
+def load_records_into_bptree(records=None, cache_source="database_startup"):
     """
     Load records into the B+ tree cache
-    If records is None, fetch them from the database first
+    If records is None, stream them from the database in keyset-paginated
+    pages so only one page is held in memory at a time
     """
     start_time = time.time()
     loaded_count = 0
     
     try:
-        # If records not provided, fetch them from the database
+        # If records not provided, stream them from the database
         if records is None:
-            response = supabase.table('atm_analysis').select('*').execute()
-            if hasattr(response, 'data'):
-                records = response.data
-            else:
-                logger.warning("No data returned from database")
-                return 0
+            records = get_storage().iter_analysis_records(CACHE_COLUMNS)
         
-        logger.info(f"Loading {len(records)} records into B+ tree cache...")
+        logger.info("Loading records into B+ tree cache...")
         
-        for record in records:
-            # Extract location coordinates
-            lat = record.get('location_lat')
-            lng = record.get('location_lng')
-            
-            if lat is not None and lng is not None:
-                # Create a key for the B+ tree
-                coords = (float(lat), float(lng))
-                
-                # Create a data structure for B+ tree storage
-                location_data = {
-                    "coords": [float(lat), float(lng)],
-                    "population_density": record.get('population_density'),
-                    "competing_atms": record.get('competing_atms'),
-                    "commercial_activity": record.get('commercial_activity'),
-                    "traffic_flow": record.get('traffic_flow'),
-                    "public_transport": record.get('public_transport'),
-                    "land_rate": record.get('land_rate'),
-                    "overall_score": record.get('overall_score'),
-                    "cached": True,
-                    "cache_source": "database_startup",
-                    "timestamp": record.get('created_at')
-                }
-                
-                # Insert into B+ Tree
-                bptree.insert(coords, location_data)
-                loaded_count += 1
+        # Insert everything in one pass so the tree is only re-sorted once
+        loaded_count = bptree.insert_many(owned_entries(iter_location_data(records, cache_source)))
         
         duration = time.time() - start_time
         logger.info(f"✅ B+ tree cache initialized with {loaded_count} locations in {duration:.2f} seconds")
@@ -101,8 +120,8 @@ def load_records_into_bptree(records=None):
             logger.info(f"B+ tree size: {bptree.size()} entries")
         
         # Print sample keys
-        if hasattr(bptree, 'root') and bptree.root and bptree.root.keys:
-            sample_keys = bptree.root.keys[:3]
+        sample_keys = bptree.keys()[:3]
+        if sample_keys:
             logger.info(f"Sample keys in B+ tree: {sample_keys}")
         
         return loaded_count
@@ -114,13 +133,14 @@ def load_records_into_bptree(records=None):
 
 def verify_cache_operation():
     """Test the B+ tree cache with a sample key"""
-    if not hasattr(bptree, 'root') or not bptree.root or not bptree.root.keys:
+    cache_keys = bptree.keys()
+    if not cache_keys:
         logger.warning("B+ tree is empty, skipping verification")
         return False
     
     try:
         # Get a sample key from the cache
-        sample_key = bptree.root.keys[0]
+        sample_key = cache_keys[0]
         logger.info(f"Testing cache with sample key: {sample_key}")
         
         # Try to search for this exact key
@@ -136,16 +156,151 @@ def verify_cache_operation():
         logger.error(f"Error verifying cache operation: {str(e)}")
         return False
 
+def get_snapshot_path():
+    """Cache snapshot file configured by CACHE_SNAPSHOT_PATH, or None when disabled"""
+    return os.environ.get("CACHE_SNAPSHOT_PATH") or None
+
+def save_cache_snapshot(path=None):
+    """
+    Merge the cache entries that are not in storage into the snapshot file
+    
+    Locations loaded from the database are reloaded from it on startup, so
+    only entries fetched from Overpass since then are worth keeping. Each
+    worker process merges its own entries under a file lock on shutdown, and
+    the file is replaced atomically so a crash never leaves it half written.
+    
+    Returns:
+        int: Number of entries in the snapshot after merging
+    """
+    path = path or get_snapshot_path()
+    if not path:
+        return 0
+    
+    entries = {
+        key: record for key, record in bptree.get_all().items()
+        if not str(record.get("cache_source", "")).startswith("database")
+    }
+    
+    with open(path + ".lock", "w") as lock_file:
+        try:
+            import fcntl
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        except ImportError:  # no advisory locks on Windows
+            pass
+        
+        merged = {tuple(key): data for key, data in read_cache_snapshot(path)}
+        for key, record in entries.items():
+            merged[tuple(key)] = record.to_dict() if hasattr(record, "to_dict") else record
+        
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as snapshot:
+            for key, data in merged.items():
+                snapshot.write(json.dumps({"key": list(key), "data": data}, default=str) + "\n")
+        os.replace(temp_path, path)
+    
+    logger.info(f"Saved {len(entries)} cache entries to snapshot {path} ({len(merged)} total)")
+    return len(merged)
+
+def read_cache_snapshot(path):
+    """Yield (key, location data) pairs from a snapshot file, skipping unreadable lines"""
+    try:
+        snapshot = open(path)
+    except FileNotFoundError:
+        return
+    
+    with snapshot:
+        for line in snapshot:
+            try:
+                entry = json.loads(line)
+                yield tuple(entry["key"]), entry["data"]
+            except (ValueError, KeyError, TypeError):
+                logger.warning(f"Skipping unreadable line in cache snapshot {path}")
+
+def load_cache_snapshot(path=None):
+    """
+    Restore entries saved by save_cache_snapshot into the cache
+    
+    Returns:
+        int: Number of entries restored
+    """
+    path = path or get_snapshot_path()
+    if not path or not os.path.exists(path):
+        return 0
+    
+    started = time.time()
+    count = bptree.insert_many(owned_entries(read_cache_snapshot(path)))
+    logger.info(f"Restored {count} cache entries from snapshot {path} in {time.time() - started:.2f} seconds")
+    return count
+
+def warmup_generation():
+    """
+    Describe the sources a warmup loads from: the newest stored analysis,
+    the snapshot file's modification time and the shard ring
+    
+    Returns:
+        str: A value that changes whenever a warmup would load something
+        different, or None when storage cannot say
+    """
+    try:
+        latest = get_storage().latest_analysis_time()
+    except Exception as e:
+        logger.warning(f"Could not read the newest analysis time: {e}")
+        return None
+    
+    path = get_snapshot_path()
+    snapshot = os.stat(path).st_mtime_ns if path and os.path.exists(path) else None
+    router = get_shard_router()
+    return json.dumps({
+        "database": latest,
+        "snapshot": snapshot,
+        "shard_nodes": router.ring.nodes if router else None
+    }, sort_keys=True)
+
 def initialize_cache():
     """Complete initialization of the cache system"""
     logger.info("Initializing ATM location cache...")
-    records = print_database_records()
     
-    if records:
-        cache_size = load_records_into_bptree(records)
+    # A shared cache survives restarts; reuse it only if a warmup completed
+    # from the same database, snapshot and ring
+    shared = getattr(bptree, 'shared', False)
+    generation = warmup_generation() if shared else None
+    if shared:
+        if generation is not None and bptree.get_meta(WARMUP_MARKER) == generation and bptree.size():
+            logger.info(f"Shared cache already holds {bptree.size()} locations warmed from current data, skipping reload")
+            return bptree.size()
+        # Until this warmup completes, no worker may treat the cache as warm
+        bptree.set_meta(WARMUP_MARKER, None)
+    
+    cache_size = load_records_into_bptree() + load_cache_snapshot()
+    
+    if shared and generation is not None:
+        bptree.set_meta(WARMUP_MARKER, generation)
+    
+    if cache_size:
         logger.info(f"Cache now contains {cache_size} records")
         verify_cache_operation()
     else:
         logger.warning("No records available for cache initialization")
     
-    return len(records) if records else 0
\ No newline at end of file
+    return cache_size
+
+def run_warmup():
+    """Warm the cache synchronously, recording progress in warmup_state"""
+    with _warmup_lock:
+        warmup_state.update(status="running", started_at=time.time(), finished_at=None, error=None)
+        try:
+            warmup_state["loaded"] = initialize_cache()
+            warmup_state["status"] = "ready"
+        except Exception as e:
+            logger.error(f"Cache warmup failed: {str(e)}")
+            warmup_state.update(status="failed", error=str(e))
+        finally:
+            warmup_state["finished_at"] = time.time()
+    
+    return warmup_state["loaded"]
+
+def start_background_warmup():
+    """Warm the cache in a daemon thread so the worker can serve immediately"""
+    thread = threading.Thread(target=run_warmup, name="cache-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,181 @@
+import io
+import csv
+import json
+import logging
+from datetime import datetime, timezone
+from flask import Response, stream_with_context
+from app.services.storage import ANALYSIS_COLUMNS
+from app.utils.metrics import registry
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # optional dependency
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+# format -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows")
+}
+
+# Columns exported as text; the rest are numbers, except created_at and is_favorite
+TEXT_COLUMNS = ("id", "user_id", "recommendations")
+
+exported_rows = registry.counter(
+    "locacash_export_rows",
+    "Analyses exported, by format (csv, parquet, arrow)",
+    ("format",)
+)
+
+def export_value(column, value):
+    """Flatten a record value for a tabular file: recommendations become JSON text"""
+    if column == "recommendations" and value is not None and not isinstance(value, str):
+        return json.dumps(value)
+    return value
+
+def arrow_schema():
+    fields = []
+    for column in ANALYSIS_COLUMNS:
+        if column in TEXT_COLUMNS:
+            kind = pyarrow.string()
+        elif column == "created_at":
+            kind = pyarrow.timestamp("us", tz="UTC")
+        elif column == "is_favorite":
+            kind = pyarrow.bool_()
+        else:
+            kind = pyarrow.float64()
+        fields.append(pyarrow.field(column, kind))
+    return pyarrow.schema(fields)
+
+def arrow_batch(records, schema):
+    """Build a record batch from one page of records"""
+    arrays = []
+    for field in schema:
+        values = [export_value(field.name, record.get(field.name)) for record in records]
+        if field.name == "created_at":
+            # Storage returns ISO 8601 text; Arrow parses it into a UTC timestamp
+            arrays.append(pyarrow.array(values, pyarrow.string()).cast(field.type))
+        else:
+            arrays.append(pyarrow.array(values, field.type))
+    return pyarrow.record_batch(arrays, schema=schema)
+
+class ChunkSink:
+    """Write-only file object that hands written bytes back in chunks"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def csv_chunks(pages):
+    """Yield a CSV header, then one chunk of rows per page"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(ANALYSIS_COLUMNS)
+    for records in pages:
+        writer.writerows(
+            [export_value(column, record.get(column)) for column in ANALYSIS_COLUMNS]
+            for record in records
+        )
+        exported_rows.inc(len(records), format="csv")
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def arrow_chunks(pages, format_name):
+    """
+    Yield an Arrow IPC stream or a Parquet file, one record batch per page
+
+    Each page becomes an IPC record batch or a Parquet row group and is sent
+    as soon as it is encoded, so only one page is held in memory at a time.
+    """
+    schema = arrow_schema()
+    sink = ChunkSink()
+    if format_name == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(sink, schema, compression="zstd")
+        write = lambda batch: writer.write_table(pyarrow.Table.from_batches([batch]))
+    else:
+        writer = pyarrow.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+
+    for records in pages:
+        if not records:
+            continue
+        write(arrow_batch(records, schema))
+        exported_rows.inc(len(records), format=format_name)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def export_response(pages, format_name, filename):
+    """
+    Stream pages of atm_analysis records as a downloadable file
+
+    Args:
+        pages (iterable): Lists of records, read lazily while the response is sent
+        format_name (str): One of EXPORT_FORMATS; parquet and arrow need pyarrow
+        filename (str): Download name without an extension
+
+    Returns:
+        Response: A streamed response with a Content-Disposition attachment
+    """
+    mimetype, extension = EXPORT_FORMATS[format_name]
+    chunks = csv_chunks(pages) if format_name == "csv" else arrow_chunks(pages, format_name)
+
+    def generate():
+        try:
+            yield from chunks
+        except Exception as e:
+            # The status is already sent; a truncated file is all we can signal
+            logger.error(f"Export failed part way through: {e}")
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{filename}-{stamp}.{extension}"'}
+    )
+
+def export_format_error(format_name):
+    """Error message for an unusable ?format=, or None when it can be served"""
+    if format_name not in EXPORT_FORMATS:
+        return f"format must be one of {', '.join(EXPORT_FORMATS)}"
+    if format_name != "csv" and pyarrow is None:
+        return f"{format_name} export requires pyarrow (pip install pyarrow)"
+    return None
+
+def paged(rows, size):
+    """Group an iterator of rows into lists of at most size rows"""
+    page = []
+    for row in rows:
+        page.append(row)
+        if len(page) == size:
+            yield page
+            page = []
+    if page:
+        yield page
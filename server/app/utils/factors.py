@@ -1,151 +1,274 @@
-import requests
-import math
-import json
-import os
-
-cache = {}
-
-def overpass_query_executor(query):
-    # Try multiple Overpass API endpoints for better reliability
-    endpoints = [
-        "https://overpass-api.de/api/interpreter",
-        "https://lz4.overpass-api.de/api/interpreter",
-        "https://z.overpass-api.de/api/interpreter"
-    ]
-    
-    for endpoint in endpoints:
-        try:
-            print(f"Trying endpoint: {endpoint}")
-            response = requests.get(
-                endpoint, 
-                params={"data": query}, 
-                timeout=30,
-                headers={'User-Agent': 'LocaCash ATM Analysis Tool'}
-            )
-            
-            if response.status_code == 200:
-                print(f"Success with endpoint: {endpoint}")
-                return response.json()
-            elif response.status_code == 429:
-                print(f"Rate limited on {endpoint}, trying next...")
-                continue
-            else:
-                print(f"HTTP {response.status_code} from {endpoint}")
-                continue
-                
-        except requests.exceptions.Timeout:
-            print(f"Timeout on {endpoint}, trying next...")
-            continue
-        except requests.exceptions.RequestException as e:
-            print(f"Request error on {endpoint}: {e}")
-            continue
-    
-    print("All Overpass API endpoints failed")
-    return None
-
-def fetch_data_from_overpass(lat, lng, radius, tag_filter):
-    query = f"""
-    [out:json];
-    (
-        node(around:{radius},{lat},{lng}){tag_filter};
-        way(around:{radius},{lat},{lng}){tag_filter};
-    );
-    out body;
-    """
-    data = overpass_query_executor(query)
-
-    return data
-
-def fetch_all_location_data(lat, lng, radius):
-    query = f"""
-    [out:json];
-    (
-        node(around:{radius},{lat},{lng})["amenity"];
-        way(around:{radius},{lat},{lng})["amenity"];
-        node(around:{radius},{lat},{lng})["amenity"="atm"];
-        way(around:{radius},{lat},{lng})["amenity"="atm"];
-        node(around:{radius},{lat},{lng})["shop"];
-        way(around:{radius},{lat},{lng})["shop"];
-        node(around:{radius},{lat},{lng})["highway"];
-        way(around:{radius},{lat},{lng})["highway"];
-        node(around:{radius},{lat},{lng})["public_transport"];
-        way(around:{radius},{lat},{lng})["public_transport"];
-    );
-    out body;
-    """
-    
-    data = overpass_query_executor(query)
-
-    return data
-
-def calculate_location_data(lat, lng, radius=1500):
-    try:
-        print(f"Fetching data for coordinates: {lat}, {lng} with radius: {radius}m")
-        all_data = fetch_all_location_data(lat, lng, radius)
-        
-        if not all_data or "elements" not in all_data:
-            print("No data received from Overpass API")
-            # Return default values if API fails
-            return {
-                "coords": [float(f"{round(lat, 3):.3f}"), float(f"{round(lng, 3):.3f}")],
-                "population_density": 10.0,  # Default fallback values
-                "competing_atms": 2,
-                "commercial_activity": 5,
-                "traffic_flow": 3,
-                "public_transport": 1,
-                "land_rate": 5000.0
-            }
-        
-        elements = all_data.get("elements", [])
-        print(f"Received {len(elements)} elements from Overpass API")
-        
-        density_elements = [e for e in elements if "amenity" in e.get("tags", {})]
-        atm_elements = [e for e in elements if e.get("tags", {}).get("amenity") == "atm"]
-        shop_elements = [e for e in elements if "shop" in e.get("tags", {})]
-        highway_elements = [e for e in elements if "highway" in e.get("tags", {})]
-        transport_elements = [e for e in elements if "public_transport" in e.get("tags", {})]
-        
-        population_density = len(density_elements) / (math.pi * (radius / 1000) ** 2)
-        competing_atms = len(atm_elements)
-
-        atm_locations = []
-        for element in atm_elements:
-            if 'lat' in element and 'lon' in element:
-                atm_locations.append({'lat': element['lat'], 'lng': element['lon']})
-
-        commercial_activity = len(shop_elements)
-        traffic_flow = len(highway_elements)
-        public_transport = len(transport_elements)
-
-        base_rate = 2000  # base price per sq.ft. (example)
-        land_rate = base_rate + (population_density * 200) + (commercial_activity * 100) + (traffic_flow * 50)
-
-        result = {
-            # Round the coordinates to 3 decimals and remove trailing zeroes
-            "coords": [float(f"{round(lat, 3):.3f}"), float(f"{round(lng, 3):.3f}")],
-            "population_density": population_density,
-            "competing_atms": competing_atms,
-            "commercial_activity": commercial_activity,
-            "traffic_flow": traffic_flow,
-            "public_transport": public_transport,
-            "land_rate": round(land_rate, 2)
-        }
-
-        print(f"Calculated data: {result}")
-        return result
-        
-    except Exception as e:
-        print(f"Error in calculate_location_data: {e}")
-        # Return default fallback values on any error
-        return {
-            "coords": [float(f"{round(lat, 3):.3f}"), float(f"{round(lng, 3):.3f}")],
-            "population_density": 10.0,
-            "competing_atms": 2,
-            "commercial_activity": 5,
-            "traffic_flow": 3,
-            "public_transport": 1,
-            "land_rate": 5000.0
-        }
-
-if __name__ == "__main__": 
+import math
+import json
+from bisect import bisect_right
+from app.utils.profiling import span
+from app.utils.overpass import INTERACTIVE, UpstreamBusy, get_scheduler
+from app.utils.geokey import canonical_coords
+from app.utils.atm_index import get_atm_index, decayed_competition
+
+# Radius in meters the location factors are reported for by default
+DEFAULT_RADIUS = 1500
+
+# Radii whose factors are computed locally from every fetch, so switching
+# between them never needs another Overpass query
+FACTOR_RADII = (250, 500, 1000, 1500)
+
+# Meters per degree of latitude, for local distance approximations
+METERS_PER_DEGREE = 111320
+
+def overpass_query_executor(query, priority=INTERACTIVE):
+    """Run an Overpass query through the shared scheduler (see app.utils.overpass)"""
+    return get_scheduler().execute(query, priority)
+
+def fetch_data_from_overpass(lat, lng, radius, tag_filter):
+    query = f"""
+    [out:json];
+    (
+        node(around:{radius},{lat},{lng}){tag_filter};
+        way(around:{radius},{lat},{lng}){tag_filter};
+    );
+    out body;
+    """
+    data = overpass_query_executor(query)
+
+    return data
+
+def fetch_all_location_data(lat, lng, radius, priority=INTERACTIVE):
+    query = f"""
+    [out:json];
+    (
+        node(around:{radius},{lat},{lng})["amenity"];
+        way(around:{radius},{lat},{lng})["amenity"];
+        node(around:{radius},{lat},{lng})["amenity"="atm"];
+        way(around:{radius},{lat},{lng})["amenity"="atm"];
+        node(around:{radius},{lat},{lng})["shop"];
+        way(around:{radius},{lat},{lng})["shop"];
+        node(around:{radius},{lat},{lng})["highway"];
+        way(around:{radius},{lat},{lng})["highway"];
+        node(around:{radius},{lat},{lng})["public_transport"];
+        way(around:{radius},{lat},{lng})["public_transport"];
+    );
+    out center;
+    """
+    
+    data = overpass_query_executor(query, priority)
+
+    return data
+
+def factors_from_counts(counts, lat, lng, radius):
+    """Turn per-category element counts within radius meters into location factors"""
+    amenity_count, atm_count, shop_count, highway_count, transport_count = counts
+    
+    population_density = amenity_count / (math.pi * (radius / 1000) ** 2)
+    competing_atms = atm_count
+    commercial_activity = shop_count
+    traffic_flow = highway_count
+    public_transport = transport_count
+
+    base_rate = 2000  # base price per sq.ft. (example)
+    land_rate = base_rate + (population_density * 200) + (commercial_activity * 100) + (traffic_flow * 50)
+
+    return {
+        # Report the coordinates at the cache key precision
+        "coords": list(canonical_coords((lat, lng))),
+        "population_density": population_density,
+        "competing_atms": competing_atms,
+        "commercial_activity": commercial_activity,
+        "traffic_flow": traffic_flow,
+        "public_transport": public_transport,
+        "land_rate": round(land_rate, 2)
+    }
+
+def summarize_elements(elements, lat, lng, radius):
+    """
+    Reduce Overpass elements to the location factors, in a single pass
+    
+    Args:
+        elements (list): Elements from an Overpass API response
+        lat (float): Latitude of the analysed point
+        lng (float): Longitude of the analysed point
+        radius (int): Search radius in meters the elements were fetched with
+    
+    Returns:
+        dict: Location factors as returned by calculate_location_data
+    """
+    amenity_count = 0
+    atm_count = 0
+    shop_count = 0
+    highway_count = 0
+    transport_count = 0
+    
+    for element in elements:
+        tags = element.get("tags")
+        if not tags:
+            continue
+        amenity = tags.get("amenity")
+        if amenity is not None:
+            amenity_count += 1
+            if amenity == "atm":
+                atm_count += 1
+        if "shop" in tags:
+            shop_count += 1
+        if "highway" in tags:
+            highway_count += 1
+        if "public_transport" in tags:
+            transport_count += 1
+    
+    counts = (amenity_count, atm_count, shop_count, highway_count, transport_count)
+    return factors_from_counts(counts, lat, lng, radius)
+
+def summarize_elements_by_radius(elements, lat, lng, radii):
+    """
+    Compute the location factors for several radii from one set of elements
+    
+    Each category's element distances from the point are sorted once, so
+    the count within any radius is a binary search. The elements must have
+    been fetched at the largest radius. Ways without a center, and way centers
+    just outside the circle, are counted at the largest radius only, so its
+    factors match summarize_elements exactly.
+    
+    Args:
+        elements (list): Elements from an Overpass API response
+        lat (float): Latitude of the analysed point
+        lng (float): Longitude of the analysed point
+        radii (iterable): Radii in meters
+    
+    Returns:
+        dict: Location factors keyed by radius
+    """
+    radii = sorted(set(radii))
+    largest = radii[-1]
+    hypot = math.hypot
+    lat_meters = METERS_PER_DEGREE
+    lng_meters = METERS_PER_DEGREE * math.cos(math.radians(lat))
+    
+    # Distances of the elements in each category, in counts order
+    amenity, atm, shop, highway, transport = [], [], [], [], []
+    
+    for element in elements:
+        tags = element.get("tags")
+        if not tags:
+            continue
+        point = element if "lat" in element else element.get("center")
+        if point is None or "lat" not in point:
+            distance = largest
+        else:
+            distance = hypot((point["lat"] - lat) * lat_meters, (point["lon"] - lng) * lng_meters)
+            if distance > largest:
+                distance = largest
+        
+        amenity_tag = tags.get("amenity")
+        if amenity_tag is not None:
+            amenity.append(distance)
+            if amenity_tag == "atm":
+                atm.append(distance)
+        if "shop" in tags:
+            shop.append(distance)
+        if "highway" in tags:
+            highway.append(distance)
+        if "public_transport" in tags:
+            transport.append(distance)
+    
+    categories = (amenity, atm, shop, highway, transport)
+    for distances in categories:
+        distances.sort()
+    
+    return {
+        radius: factors_from_counts(
+            [bisect_right(distances, radius) for distances in categories], lat, lng, radius
+        )
+        for radius in radii
+    }
+
+def add_competition_index(result, elements, lat, lng, fetch_radius):
+    """
+    Record the fetched ATMs in the ATM index and add distance-decayed
+    competition_index values to result and its radius_factors
+
+    The index also holds ATMs from earlier fetches, so ways without a
+    center in this payload do not hide nearby competitors. Index failures
+    are logged and leave the factors without a competition_index.
+    """
+    index = get_atm_index()
+    if index is None:
+        return
+    try:
+        with span("atm_index_update"):
+            index.update_area(lat, lng, fetch_radius, elements)
+            atms = index.nearby(lat, lng, fetch_radius)
+        result["competition_index"] = decayed_competition(atms, result["radius"])
+        for r, factors in result["radius_factors"].items():
+            factors["competition_index"] = decayed_competition(atms, int(r))
+    except Exception as e:
+        print(f"Error updating ATM index: {e}")
+
+def fallback_location_data(lat, lng, radius, radii=FACTOR_RADII):
+    """
+    Default factors returned when Overpass cannot be reached
+
+    The same defaults are reported for every radius in radii. The result is
+    marked "fallback" so callers never cache it as real data.
+    """
+    defaults = {
+        "population_density": 10.0,  # Default fallback values
+        "competing_atms": 2,
+        "commercial_activity": 5,
+        "traffic_flow": 3,
+        "public_transport": 1,
+        "land_rate": 5000.0
+    }
+    return {
+        "coords": list(canonical_coords((lat, lng))),
+        **defaults,
+        "radius": radius,
+        "radius_factors": {str(r): dict(defaults) for r in sorted(set(radii))},
+        "fallback": True
+    }
+
+def calculate_location_data(lat, lng, radius=DEFAULT_RADIUS, radii=FACTOR_RADII, priority=INTERACTIVE):
+    """
+    Fetch the area around a point once and compute its location factors
+    
+    Overpass is queried at the largest of radius and radii. The result holds
+    the factors for radius, plus a radius_factors dict with the factors for
+    every radius in radii (keyed by the radius as a string, for JSON).
+    
+    priority is the request's place in the Overpass scheduler queue; when
+    the scheduler turns the request away, UpstreamBusy is raised rather than
+    returning the fallback factors.
+    """
+    fetch_radius = max((radius, *radii))
+    try:
+        print(f"Fetching data for coordinates: {lat}, {lng} with radius: {fetch_radius}m")
+        all_data = fetch_all_location_data(lat, lng, fetch_radius, priority)
+        
+        if not all_data or "elements" not in all_data:
+            print("No data received from Overpass API")
+            # Return default values if API fails
+            return fallback_location_data(lat, lng, radius, radii)
+        
+        elements = all_data.get("elements", [])
+        print(f"Received {len(elements)} elements from Overpass API")
+        
+        with span("classify_elements", elements=len(elements)):
+            by_radius = summarize_elements_by_radius(elements, lat, lng, (radius, *radii))
+
+        result = by_radius[radius]
+        result["radius"] = radius
+        result["radius_factors"] = {
+            str(r): {key: value for key, value in by_radius[r].items() if key not in ("coords", "radius")}
+            for r in sorted(set(radii))
+        }
+        add_competition_index(result, elements, lat, lng, fetch_radius)
+        print(f"Calculated data: {result}")
+        return result
+        
+    except UpstreamBusy:
+        raise
+    except Exception as e:
+        print(f"Error in calculate_location_data: {e}")
+        # Return default fallback values on any error
+        return fallback_location_data(lat, lng, radius, radii)
+
+if __name__ == "__main__": 
     print(calculate_location_data(13.0639, 80.2416))
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""
+Canonical cache keys for coordinates
+
+Every cache tier quantizes coordinates the same way: to fixed-point
+integers at KEY_PRECISION decimal places (about 11 meters of latitude).
+The in-process tree interleaves the two integers into a single Morton
+(Z-order) code, so keys compare as plain integers, hash for exact lookups
+and sort so that nearby points are mostly adjacent.
+"""
+
+# Decimal places kept in a key; 4 decimals is roughly 11 meters
+KEY_PRECISION = 4
+KEY_SCALE = 10 ** KEY_PRECISION
+
+# Offsets making quantized latitude/longitude non-negative for interleaving
+LAT_OFFSET = 90 * KEY_SCALE
+LNG_OFFSET = 180 * KEY_SCALE
+
+def quantize(key):
+    """
+    Convert a (lat, lng) pair to its fixed-point integer form
+
+    Returns:
+        tuple: (lat_key, lng_key) integers
+    """
+    return int(round(float(key[0]) * KEY_SCALE)), int(round(float(key[1]) * KEY_SCALE))
+
+def dequantize(lat_key, lng_key):
+    """Convert fixed-point integers back to (lat, lng) floats"""
+    return lat_key / KEY_SCALE, lng_key / KEY_SCALE
+
+def canonical_coords(key):
+    """Round a (lat, lng) pair to the precision every cache stores it at"""
+    return dequantize(*quantize(key))
+
+def spread_bits(value):
+    """Spread the low 32 bits of value so there is a zero bit between each"""
+    value &= 0xFFFFFFFF
+    value = (value | (value << 16)) & 0x0000FFFF0000FFFF
+    value = (value | (value << 8)) & 0x00FF00FF00FF00FF
+    value = (value | (value << 4)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value << 2)) & 0x3333333333333333
+    value = (value | (value << 1)) & 0x5555555555555555
+    return value
+
+def compact_bits(value):
+    """Inverse of spread_bits: gather every other bit into the low 32 bits"""
+    value &= 0x5555555555555555
+    value = (value | (value >> 1)) & 0x3333333333333333
+    value = (value | (value >> 2)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value >> 4)) & 0x00FF00FF00FF00FF
+    value = (value | (value >> 8)) & 0x0000FFFF0000FFFF
+    value = (value | (value >> 16)) & 0x00000000FFFFFFFF
+    return value
+
+def morton_from_quantized(lat_key, lng_key):
+    """Interleave fixed-point coordinates into a Morton code (longitude in the low bit)"""
+    return spread_bits(lng_key + LNG_OFFSET) | (spread_bits(lat_key + LAT_OFFSET) << 1)
+
+def encode_key(key):
+    """
+    Canonical integer cache key for a (lat, lng) pair
+
+    Returns:
+        int: Morton code of the quantized coordinates
+    """
+    return morton_from_quantized(*quantize(key))
+
+def decode_quantized(code):
+    """Split a Morton code back into (lat_key, lng_key) integers"""
+    return compact_bits(code >> 1) - LAT_OFFSET, compact_bits(code) - LNG_OFFSET
+
+def decode_key(code):
+    """Convert a Morton code back to canonical (lat, lng) floats"""
+    return dequantize(*decode_quantized(code))
@@ -0,0 +1,320 @@
+import os
+import math
+import time
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+
+# Size of the grid cells analyses are grouped into for per-area summaries (~5.5 km)
+AREA_DEGREES = 0.05
+# Score histogram bins are this many points wide over 0-100
+SCORE_BIN_WIDTH = 10
+# Percentiles reported for the score and land rate distributions
+PERCENTILES = (10, 25, 50, 75, 90)
+# Points kept in the cost-benefit curve; longer curves are sampled evenly
+MAX_CURVE_POINTS = 200
+# Location factors reported with each listed analysis
+FACTOR_COLUMNS = ("population_density", "competing_atms", "commercial_activity", "traffic_flow", "public_transport")
+
+def area_key(lat, lng):
+    """Grid cell of AREA_DEGREES containing a point"""
+    return math.floor(lat / AREA_DEGREES), math.floor(lng / AREA_DEGREES)
+
+def efficiency(score, land_rate):
+    """Score points per 10,000 of land rate, as the dashboard defines it"""
+    return score / land_rate * 10000
+
+def percentile(values, q):
+    """Linearly interpolated percentile of an already sorted list"""
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def histogram(values, edges):
+    """Counts of a sorted list between consecutive edges, the last bin closed"""
+    counts = [bisect_left(values, high) - bisect_left(values, low) for low, high in zip(edges, edges[1:])]
+    if counts:
+        counts[-1] += bisect_right(values, edges[-1]) - bisect_left(values, edges[-1])
+    return counts
+
+def distribution(values):
+    """Summary statistics of a sorted list"""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "min": values[0],
+        "max": values[-1],
+        "mean": round(math.fsum(values) / len(values), 2),
+        "percentiles": {f"p{q}": round(percentile(values, q), 2) for q in PERCENTILES}
+    }
+
+def sample_curve(points):
+    """Keep at most MAX_CURVE_POINTS points of a curve, always including the last"""
+    if len(points) <= MAX_CURVE_POINTS:
+        return points
+    step = (len(points) - 1) / (MAX_CURVE_POINTS - 1)
+    return [points[round(i * step)] for i in range(MAX_CURVE_POINTS)]
+
+class UserInsights:
+    """
+    Aggregates of one user's analyses, updated in place as analyses are saved
+
+    Scores, land rates and efficiencies are kept in sorted lists and areas
+    in running totals, so adding an analysis costs a few insertions and a
+    summary costs binary searches rather than a pass over every row.
+    Efficiency rankings only include analyses with a positive land rate.
+    """
+
+    def __init__(self):
+        # id -> (lat, lng, score, land rate, created_at, factors tuple in FACTOR_COLUMNS order)
+        self.rows = {}
+        self.favorites = set()
+        self.scores = []
+        self.land_rates = []
+        # (-efficiency, id), so the most efficient come first
+        self.ranking = []
+        # area key -> [count, score sum, scored count, max score, land rate sum, land rate count]
+        self.areas = {}
+        self.built_at = time.time()
+        self.lock = threading.Lock()
+
+    def add_many(self, records):
+        """Add stored records, sorting once when there are many of them"""
+        bulk = len(records) > 64
+        for record in records:
+            self.add(record, keep_sorted=not bulk)
+        if bulk:
+            self.scores.sort()
+            self.land_rates.sort()
+            self.ranking.sort()
+
+    def add(self, record, keep_sorted=True):
+        analysis_id = record.get("id")
+        if analysis_id is None or analysis_id in self.rows:
+            return
+        lat, lng = record.get("location_lat"), record.get("location_lng")
+        score, land_rate = record.get("overall_score"), record.get("land_rate")
+        factors = tuple(record.get(column) for column in FACTOR_COLUMNS)
+        self.rows[analysis_id] = (lat, lng, score, land_rate, record.get("created_at"), factors)
+        if record.get("is_favorite"):
+            self.favorites.add(analysis_id)
+
+        append = insort if keep_sorted else list.append
+        if score is not None:
+            append(self.scores, score)
+        if land_rate is not None:
+            append(self.land_rates, land_rate)
+        if score is not None and land_rate is not None and land_rate > 0:
+            append(self.ranking, (-efficiency(score, land_rate), analysis_id))
+
+        if lat is not None and lng is not None:
+            area = self.areas.setdefault(area_key(lat, lng), [0, 0.0, 0, None, 0.0, 0])
+            area[0] += 1
+            if score is not None:
+                area[1] += score
+                area[2] += 1
+                area[3] = score if area[3] is None else max(area[3], score)
+            if land_rate is not None:
+                area[4] += land_rate
+                area[5] += 1
+
+    def set_favorite(self, analysis_id, is_favorite):
+        if analysis_id not in self.rows:
+            return
+        if is_favorite:
+            self.favorites.add(analysis_id)
+        else:
+            self.favorites.discard(analysis_id)
+
+    def summary(self, top=10, land_rate_bins=10, areas=20, budget=None):
+        """
+        Chart-ready summary of the user's analyses
+
+        Args:
+            top (int): Number of most efficient analyses to list
+            land_rate_bins (int): Equal-width bins in the land rate histogram
+            areas (int): Number of areas to summarize, busiest first
+            budget (float, optional): Land rate budget to pick a portfolio for
+
+        Returns:
+            dict: statistics, histograms, areas, top_efficiency and cost_benefit
+        """
+        score_edges = list(range(0, 100 + SCORE_BIN_WIDTH, SCORE_BIN_WIDTH))
+        land_rate_edges = []
+        if self.land_rates:
+            low, high = self.land_rates[0], self.land_rates[-1]
+            width = (high - low) / land_rate_bins
+            land_rate_edges = [low + i * width for i in range(land_rate_bins)] + [high] if width else [low, high]
+
+        efficiencies = [-value for value, _ in self.ranking]
+        return {
+            "statistics": {
+                "analyses": len(self.rows),
+                "favorites": len(self.favorites),
+                "score": distribution(self.scores),
+                "land_rate": distribution(self.land_rates),
+                "efficiency": distribution(efficiencies[::-1])
+            },
+            "histograms": {
+                "score": {"edges": score_edges, "counts": histogram(self.scores, score_edges)},
+                "land_rate": {
+                    "edges": [round(edge, 2) for edge in land_rate_edges],
+                    "counts": histogram(self.land_rates, land_rate_edges)
+                }
+            },
+            "areas": self.area_summaries(areas),
+            "top_efficiency": [self.ranked_row(rank, entry) for rank, entry in enumerate(self.ranking[:top], start=1)],
+            "cost_benefit": self.cost_benefit(budget)
+        }
+
+    def ranked_row(self, rank, entry):
+        negative_efficiency, analysis_id = entry
+        lat, lng, score, land_rate, created_at, factors = self.rows[analysis_id]
+        return {
+            "rank": rank,
+            "id": analysis_id,
+            "location": {"lat": lat, "lng": lng},
+            "score": score,
+            "land_rate": land_rate,
+            "efficiency": round(-negative_efficiency, 2),
+            "factors": dict(zip(FACTOR_COLUMNS, factors)),
+            "created_at": created_at,
+            "is_favorite": analysis_id in self.favorites
+        }
+
+    def area_summaries(self, limit):
+        busiest = sorted(self.areas.items(), key=lambda item: (-item[1][0], item[0]))[:limit]
+        return [
+            {
+                "center": {
+                    "lat": round((lat_cell + 0.5) * AREA_DEGREES, 4),
+                    "lng": round((lng_cell + 0.5) * AREA_DEGREES, 4)
+                },
+                "size_degrees": AREA_DEGREES,
+                "analyses": count,
+                "mean_score": round(score_sum / scored, 2) if scored else None,
+                "max_score": max_score,
+                "mean_land_rate": round(land_rate_sum / priced, 2) if priced else None
+            }
+            for (lat_cell, lng_cell), (count, score_sum, scored, max_score, land_rate_sum, priced) in busiest
+        ]
+
+    def cost_benefit(self, budget=None):
+        """
+        Cumulative cost and score of analyses taken in order of efficiency
+
+        With a budget, analyses that no longer fit are skipped, as the
+        dashboard's greedy portfolio optimizer does, and the selected
+        analyses are listed in full under "locations".
+        """
+        points = [{"cost": 0, "score": 0, "efficiency": 0, "id": None}]
+        selected = []
+        cost = score_total = 0
+        for entry in self.ranking:
+            negative_efficiency, analysis_id = entry
+            score, land_rate = self.rows[analysis_id][2:4]
+            if budget is not None and cost + land_rate > budget:
+                continue
+            if budget is not None:
+                selected.append(self.ranked_row(len(selected) + 1, entry))
+            cost += land_rate
+            score_total += score
+            points.append({
+                "cost": round(cost, 2),
+                "score": round(score_total, 2),
+                "efficiency": round(-negative_efficiency, 2),
+                "id": analysis_id
+            })
+        result = {
+            "budget": budget,
+            "selected": len(points) - 1,
+            "total_cost": round(cost, 2),
+            "total_score": round(score_total, 2),
+            "points": sample_curve(points)
+        }
+        if budget is not None:
+            result["locations"] = selected
+        return result
+
+class InsightsCache:
+    """
+    Per-process LRU of UserInsights aggregates
+
+    A user's aggregate is built from storage on first use and then kept up
+    to date by the routes that write analyses, so dashboards polling the
+    insights endpoint never re-read the user's history. Writes made by other
+    processes are picked up when the aggregate is rebuilt after ttl seconds.
+    """
+
+    def __init__(self, max_users=256, ttl=300):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users = OrderedDict()
+        # user_id -> records saved while that user's aggregate was being built
+        self._building = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, load):
+        """
+        Return a user's aggregate, building it with load() when missing or expired
+
+        Args:
+            load (callable): Returns an iterable of record pages, or raises
+
+        Returns:
+            UserInsights: The aggregate; hold its lock while reading it
+        """
+        with self._lock:
+            insights = self._users.get(user_id)
+            if insights is not None and time.time() - insights.built_at <= self.ttl:
+                self._users.move_to_end(user_id)
+                return insights
+            self._building.setdefault(user_id, [])
+
+        insights = UserInsights()
+        try:
+            for records in load():
+                insights.add_many(records)
+        except Exception:
+            with self._lock:
+                self._building.pop(user_id, None)
+            raise
+
+        with self._lock:
+            insights.add_many(self._building.pop(user_id, []))
+            self._users[user_id] = insights
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return insights
+
+    def add(self, user_id, records):
+        """Fold newly saved records into a user's aggregate, if it is loaded"""
+        with self._lock:
+            if user_id in self._building:
+                self._building[user_id].extend(records)
+            insights = self._users.get(user_id)
+        if insights is not None:
+            with insights.lock:
+                insights.add_many(records)
+
+    def set_favorite(self, user_id, analysis_id, is_favorite):
+        with self._lock:
+            insights = self._users.get(user_id)
+        if insights is not None:
+            with insights.lock:
+                insights.set_favorite(analysis_id, is_favorite)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+# Create a shared instance
+insights_cache = InsightsCache(
+    max_users=int(os.environ.get("INSIGHTS_CACHE_MAX_USERS", 256)),
+    ttl=float(os.environ.get("INSIGHTS_CACHE_TTL", 300))
+)
@@ -0,0 +1,104 @@
+import sys
+
+# Per-response metadata added by the routes; never stored in the cache
+RESPONSE_ONLY_KEYS = frozenset({
+    "cache_hit",
+    "cache_accessed_at",
+    "cache_mechanism",
+    "original_request",
+    "matched_coords",
+    "distance_meters"
+})
+
+# Factor fields stored in their own slot, in response order
+FACTOR_FIELDS = (
+    "population_density",
+    "competing_atms",
+    "commercial_activity",
+    "traffic_flow",
+    "public_transport",
+    "land_rate"
+)
+
+class LocationRecord:
+    """
+    Compact cache entry for one analysed location
+
+    A slotted object holds the fields every entry has in a fixed layout
+    instead of a per-entry dict, and repeated source labels are interned so
+    every entry shares one string. Anything unusual goes in the optional
+    extra dict. The JSON-ready dict is only built by to_dict() when a route
+    actually responds with the entry.
+    """
+
+    __slots__ = (
+        "lat", "lng",
+        "population_density", "competing_atms", "commercial_activity",
+        "traffic_flow", "public_transport", "land_rate",
+        "overall_score", "cached", "cache_source", "timestamp", "extra"
+    )
+
+    def __init__(self, lat, lng, population_density=None, competing_atms=None,
+                 commercial_activity=None, traffic_flow=None, public_transport=None,
+                 land_rate=None, overall_score=None, cached=None,
+                 cache_source=None, timestamp=None, extra=None):
+        self.lat = lat
+        self.lng = lng
+        self.population_density = population_density
+        self.competing_atms = competing_atms
+        self.commercial_activity = commercial_activity
+        self.traffic_flow = traffic_flow
+        self.public_transport = public_transport
+        self.land_rate = land_rate
+        self.overall_score = overall_score
+        self.cached = cached
+        self.cache_source = sys.intern(cache_source) if cache_source else cache_source
+        self.timestamp = timestamp
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from a location data dict, dropping response-only keys"""
+        coords = data.get("coords") or (None, None)
+        extra = {
+            key: value for key, value in data.items()
+            if key not in cls.__slots__ and key != "coords" and key not in RESPONSE_ONLY_KEYS
+        }
+        return cls(
+            coords[0], coords[1],
+            *(data.get(field) for field in FACTOR_FIELDS),
+            overall_score=data.get("overall_score"),
+            cached=data.get("cached"),
+            cache_source=data.get("cache_source"),
+            timestamp=data.get("timestamp"),
+            extra=extra
+        )
+
+    def to_dict(self):
+        """Materialise the JSON-ready dict returned by the API"""
+        result = {"coords": [self.lat, self.lng]}
+        for field in FACTOR_FIELDS:
+            result[field] = getattr(self, field)
+        if self.overall_score is not None:
+            result["overall_score"] = self.overall_score
+        if self.extra:
+            result.update(self.extra)
+        if self.cached is not None:
+            result["cached"] = self.cached
+        if self.cache_source is not None:
+            result["cache_source"] = self.cache_source
+        if self.timestamp is not None:
+            result["timestamp"] = self.timestamp
+        return result
+
+    def get(self, key, default=None):
+        """Dict-style read access to a single field"""
+        if key == "coords":
+            return [self.lat, self.lng]
+        if key in self.__slots__ and key != "extra":
+            value = getattr(self, key)
+            return default if value is None else value
+        return self.extra.get(key, default) if self.extra else default
+
+    def __repr__(self):
+        return f"LocationRecord({self.lat}, {self.lng}, source={self.cache_source!r})"
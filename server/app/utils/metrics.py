@@ -0,0 +1,220 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from app.utils.profiling import span
+
+# Latency buckets in seconds, spanning in-memory lookups to slow Overpass calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonically increasing count, optionally split by labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name + "_total", self.labelnames, key, value) for key, value in items]
+
+class Gauge:
+    """Value sampled when metrics are scraped, via a callback"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = ()
+        self.callback = callback
+
+    def samples(self):
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        return [(self.name, (), (), value)]
+
+class CallbackCounter:
+    """
+    Counter whose values are read from a callback when metrics are scraped
+
+    For hot paths that already keep their own counts under a lock, where
+    a labelled Counter.inc per call would cost more than the work measured.
+    The callback returns {label values tuple: count}.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames, callback):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def samples(self):
+        try:
+            values = self.callback()
+        except Exception:
+            return []
+        return [(self.name + "_total", self.labelnames, key, value) for key, value in sorted(values.items())]
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets, optionally split by labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of a with-block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+
+        samples = []
+        bucket_labels = self.labelnames + ("le",)
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((self.name + "_bucket", bucket_labels, key + (format_value(bound),), cumulative))
+            samples.append((self.name + "_sum", self.labelnames, key, total))
+            samples.append((self.name + "_count", self.labelnames, key, count))
+        return samples
+
+class Registry:
+    """Collection of metrics rendered together in Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, callback):
+        return self.register(Gauge(name, documentation, callback))
+
+    def counter_callback(self, name, documentation, labelnames, callback):
+        return self.register(CallbackCounter(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format (0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labelnames, labelvalues, value in metric.samples():
+                lines.append(f"{name}{format_labels(labelnames, labelvalues)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def process_rss_bytes():
+    """Current resident set size of this process, or None where unavailable"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss is the peak RSS, in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+# Create a shared instance
+registry = Registry()
+
+cache_lookups = registry.counter(
+    "locacash_cache_lookups",
+    "Location lookups by outcome (exact_hit, proximity_hit, l2_hit, l2_proximity_hit, miss)",
+    ("result",)
+)
+stage_duration = registry.histogram(
+    "locacash_stage_duration_seconds",
+    "Time spent in each request stage (cache_lookup, overpass, scoring, storage)",
+    ("stage",)
+)
+upstream_requests = registry.counter(
+    "locacash_upstream_requests",
+    "Overpass API requests by endpoint and outcome",
+    ("endpoint", "status")
+)
+upstream_duration = registry.histogram(
+    "locacash_upstream_request_duration_seconds",
+    "Overpass API request latency by endpoint",
+    ("endpoint",)
+)
+registry.gauge("locacash_process_resident_memory_bytes", "Resident memory of this worker process", process_rss_bytes)
+
+@contextmanager
+def time_stage(stage):
+    """Record the duration of a request stage, and a span when the request is profiled"""
+    with stage_duration.time(stage=stage), span(stage):
+        yield
@@ -0,0 +1,287 @@
+import os
+import time
+import heapq
+import random
+import threading
+import requests
+from itertools import count
+from email.utils import parsedate_to_datetime
+from app.utils.metrics import registry, upstream_requests, upstream_duration
+from app.utils.profiling import span
+
+# Overpass API endpoints tried in order for better reliability. Set
+# OVERPASS_ENDPOINTS (comma-separated) to point at a mirror or at the stub
+# server used for load testing.
+DEFAULT_OVERPASS_ENDPOINTS = (
+    "https://overpass-api.de/api/interpreter",
+    "https://lz4.overpass-api.de/api/interpreter",
+    "https://z.overpass-api.de/api/interpreter"
+)
+
+# Request priorities, most urgent first
+INTERACTIVE = 0   # a user waiting on /fetch_details
+BATCH = 1         # /fetch_details_batch
+BACKGROUND = 2    # cache refreshes and region prefetches
+PRIORITY_NAMES = ("interactive", "batch", "background")
+
+# Requests each endpoint is sent per minute, and how many may go back to back
+DEFAULT_RATE_PER_MINUTE = 20
+DEFAULT_BURST = 2
+# Requests allowed to wait for an endpoint before new ones are turned away
+DEFAULT_QUEUE_DEPTH = 50
+# Seconds a request may wait for an endpoint before it is turned away
+DEFAULT_MAX_WAIT = 30
+# Seconds each retry may wait for an endpoint, counted from the failed attempt
+DEFAULT_RETRY_WAIT = 10
+# Endpoints tried per request
+DEFAULT_MAX_ATTEMPTS = 3
+# Backoff after an endpoint fails without a Retry-After: 2 s doubling up to 5 min
+BACKOFF_BASE = 2
+BACKOFF_MAX = 300
+
+queue_wait = registry.histogram(
+    "locacash_upstream_queue_wait_seconds",
+    "Time Overpass requests waited for an endpoint, by priority",
+    ("priority",)
+)
+rejections = registry.counter(
+    "locacash_upstream_rejections",
+    "Overpass requests turned away by priority and reason (queue_full, deadline)",
+    ("priority", "reason")
+)
+backoffs = registry.counter(
+    "locacash_upstream_backoffs",
+    "Times an Overpass endpoint was backed off, by endpoint",
+    ("endpoint",)
+)
+
+def get_overpass_endpoints():
+    configured = os.environ.get("OVERPASS_ENDPOINTS")
+    if configured:
+        return [endpoint.strip() for endpoint in configured.split(",") if endpoint.strip()]
+    return list(DEFAULT_OVERPASS_ENDPOINTS)
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta seconds or HTTP date), or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class UpstreamBusy(Exception):
+    """Raised when an Overpass request is turned away rather than queued"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class Endpoint:
+    """Token bucket and backoff state of one Overpass endpoint"""
+
+    def __init__(self, url, rate_per_minute, burst):
+        self.url = url
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.failures = 0
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available_at(self, now):
+        """Monotonic time at which this endpoint may next be sent a request"""
+        self.refill(now)
+        ready = now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+        return max(ready, self.blocked_until)
+
+    def take(self, now):
+        self.refill(now)
+        self.tokens -= 1
+
+    def back_off(self, now, retry_after=None):
+        """Block the endpoint for Retry-After, or an exponential delay with jitter"""
+        self.failures += 1
+        if retry_after is None:
+            retry_after = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.failures - 1)) * random.uniform(0.5, 1)
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+        backoffs.inc(endpoint=self.url)
+        return retry_after
+
+class OverpassScheduler:
+    """
+    Admission control for every Overpass API request the server makes
+
+    Each endpoint has a token bucket (rate_per_minute, burst) and is backed
+    off after throttling or failures, for as long as its Retry-After header
+    asks or exponentially otherwise. Requests take a ticket in a priority
+    queue (interactive, then batch, then background, first come first served
+    within each) and only the ticket at the head is sent, to whichever
+    endpoint is available soonest. New requests are rejected at once with
+    UpstreamBusy when max_depth are already waiting, or when they could not
+    be sent within max_wait seconds, so callers fail fast instead of piling up.
+    After a failed attempt, the retry gets its own retry_wait seconds to find
+    an endpoint, since the failure may itself have used up max_wait.
+
+    Waiting happens on the calling thread; there is no dispatcher thread.
+    """
+
+    def __init__(self, endpoints, rate_per_minute=DEFAULT_RATE_PER_MINUTE, burst=DEFAULT_BURST,
+                 max_depth=DEFAULT_QUEUE_DEPTH, max_wait=DEFAULT_MAX_WAIT,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, timeout=30, retry_wait=DEFAULT_RETRY_WAIT):
+        self.endpoints = [Endpoint(url, rate_per_minute, burst) for url in endpoints]
+        self.max_depth = max_depth
+        self.max_wait = max_wait
+        self.retry_wait = retry_wait
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self._waiting = []
+        self._sequence = count()
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_env(cls):
+        """Build a scheduler from OVERPASS_* env vars"""
+        return cls(
+            get_overpass_endpoints(),
+            rate_per_minute=float(os.environ.get("OVERPASS_RATE_PER_MINUTE", DEFAULT_RATE_PER_MINUTE)),
+            burst=float(os.environ.get("OVERPASS_BURST", DEFAULT_BURST)),
+            max_depth=int(os.environ.get("OVERPASS_QUEUE_DEPTH", DEFAULT_QUEUE_DEPTH)),
+            max_wait=float(os.environ.get("OVERPASS_MAX_WAIT", DEFAULT_MAX_WAIT)),
+            max_attempts=int(os.environ.get("OVERPASS_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)),
+            retry_wait=float(os.environ.get("OVERPASS_RETRY_WAIT", DEFAULT_RETRY_WAIT))
+        )
+
+    def queue_length(self):
+        return len(self._waiting)
+
+    def execute(self, query, priority=INTERACTIVE):
+        """
+        Run an Overpass query, waiting for an endpoint as needed
+
+        Returns:
+            dict: The decoded response, or None when every attempt was sent and failed
+
+        Raises:
+            UpstreamBusy: The request, or a retry after a failed attempt, was
+                turned away; no endpoint answered it
+        """
+        deadline = time.monotonic() + self.max_wait
+        # The ticket keeps its place in the queue across retries
+        ticket = (priority, next(self._sequence))
+        for attempt in range(self.max_attempts):
+            if attempt:
+                deadline = time.monotonic() + self.retry_wait
+            endpoint = self._acquire(ticket, deadline)
+            data = self._send(endpoint, query)
+            if data is not None:
+                return data
+        print("All Overpass API endpoints failed")
+        return None
+
+    def _reject(self, ticket, reason, retry_after=None):
+        rejections.inc(priority=PRIORITY_NAMES[ticket[0]], reason=reason)
+        raise UpstreamBusy(f"Overpass API is busy ({reason.replace('_', ' ')})", retry_after)
+
+    def _acquire(self, ticket, deadline):
+        """Wait until ticket is at the head of the queue and an endpoint is free"""
+        with self._condition:
+            if len(self._waiting) >= self.max_depth:
+                self._reject(ticket, "queue_full", self.max_wait)
+            heapq.heappush(self._waiting, ticket)
+            queued_at = time.monotonic()
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._waiting[0] == ticket:
+                        ready_at, endpoint = min(
+                            ((endpoint.available_at(now), i) for i, endpoint in enumerate(self.endpoints))
+                        )
+                        endpoint = self.endpoints[endpoint]
+                        if ready_at <= now:
+                            endpoint.take(now)
+                            heapq.heappop(self._waiting)
+                            queue_wait.observe(now - queued_at, priority=PRIORITY_NAMES[ticket[0]])
+                            self._condition.notify_all()
+                            return endpoint
+                        if ready_at > deadline:
+                            self._reject(ticket, "deadline", ready_at - now)
+                        self._condition.wait(ready_at - now)
+                    else:
+                        if now >= deadline:
+                            self._reject(ticket, "deadline")
+                        self._condition.wait(deadline - now)
+            except BaseException:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._condition.notify_all()
+                raise
+
+    def _send(self, endpoint, query):
+        """Send query to endpoint, backing the endpoint off on failure"""
+        started = time.perf_counter()
+        try:
+            print(f"Trying endpoint: {endpoint.url}")
+            with span("overpass_request", endpoint=endpoint.url):
+                response = requests.get(
+                    endpoint.url,
+                    params={"data": query},
+                    timeout=self.timeout,
+                    headers={'User-Agent': 'LocaCash ATM Analysis Tool'}
+                )
+            upstream_duration.observe(time.perf_counter() - started, endpoint=endpoint.url)
+            upstream_requests.inc(endpoint=endpoint.url, status=str(response.status_code))
+        except requests.exceptions.RequestException as e:
+            upstream_duration.observe(time.perf_counter() - started, endpoint=endpoint.url)
+            timed_out = isinstance(e, requests.exceptions.Timeout)
+            upstream_requests.inc(endpoint=endpoint.url, status="timeout" if timed_out else "error")
+            print(f"Timeout on {endpoint.url}" if timed_out else f"Request error on {endpoint.url}: {e}")
+            with self._condition:
+                endpoint.back_off(time.monotonic())
+            return None
+
+        if response.status_code == 200:
+            print(f"Success with endpoint: {endpoint.url}")
+            with self._condition:
+                endpoint.failures = 0
+            with span("overpass_decode"):
+                return response.json()
+
+        # Throttled (429) or failing: rest the endpoint so retries go to another
+        with self._condition:
+            delay = endpoint.back_off(time.monotonic(), parse_retry_after(response.headers.get("Retry-After")))
+        print(f"HTTP {response.status_code} from {endpoint.url}, backing off {delay:.1f}s")
+        return None
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Return the process-wide scheduler, built from the environment on first use"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = OverpassScheduler.from_env()
+    return _scheduler
+
+def set_scheduler(scheduler):
+    """Replace the scheduler (used by tests and benchmarks)"""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
+
+registry.gauge(
+    "locacash_upstream_queue_length",
+    "Overpass requests waiting for an endpoint",
+    lambda: _scheduler.queue_length() if _scheduler is not None else 0
+)
@@ -0,0 +1,194 @@
+import io
+import os
+import time
+import uuid
+import pstats
+import random
+import cProfile
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Functions listed in a stored profile's call statistics
+PROFILE_STATS_LIMIT = 40
+
+_local = threading.local()
+
+class RequestProfile:
+    """Stage spans, and optionally cProfile statistics, for one request"""
+
+    __slots__ = ("id", "method", "path", "started_at", "started", "spans", "depth",
+                 "profiler", "status", "duration_ms", "stats")
+
+    def __init__(self, method, path, profiler=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+        self.depth = 0
+        self.profiler = profiler
+        self.status = None
+        self.duration_ms = None
+        self.stats = None
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "profiled": self.stats is not None
+        }
+
+    def to_dict(self):
+        result = self.summary()
+        result["spans"] = self.spans
+        result["stats"] = self.stats
+        return result
+
+def current_profile():
+    """Return the profile collecting spans on this thread, or None"""
+    return getattr(_local, "profile", None)
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Record a named span in the current request's profile
+
+    A no-op outside profiled requests, so stages can be tagged freely.
+    Offsets and durations are in milliseconds from the start of the request.
+    """
+    profile = current_profile()
+    if profile is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    entry = {"name": name, "depth": profile.depth, "offset_ms": (started - profile.started) * 1000}
+    if attrs:
+        entry["attrs"] = attrs
+    profile.spans.append(entry)
+    profile.depth += 1
+    try:
+        yield
+    finally:
+        profile.depth -= 1
+        entry["duration_ms"] = (time.perf_counter() - started) * 1000
+
+class RequestProfiler:
+    """
+    Opt-in per-request profiling middleware
+
+    Every request matching path_prefixes collects stage spans (cheap), and a
+    sample_rate fraction of them also runs under cProfile. With slow_ms set,
+    a request is kept if it took at least that long, so slow requests always
+    come with their spans; otherwise every cProfiled request is kept. The
+    last `keep` profiles are held in memory for the admin endpoint.
+
+    cProfile cannot run on two threads at once, so a sampled request that
+    arrives while another is being profiled only collects spans.
+    """
+
+    def __init__(self, sample_rate=0.0, slow_ms=None, keep=50, path_prefixes=("/atm/", "/analysis/")):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.path_prefixes = tuple(path_prefixes)
+        self.profiles = deque(maxlen=keep)
+        self._profiles_lock = threading.Lock()
+        self._cprofile_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a profiler from PROFILE_* env vars, or return None when disabled"""
+        if os.environ.get("PROFILE_REQUESTS", "").lower() not in ("1", "true", "yes", "on"):
+            return None
+        slow_ms = os.environ.get("PROFILE_SLOW_MS")
+        prefixes = os.environ.get("PROFILE_PATHS")
+        return cls(
+            sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", "0")),
+            slow_ms=float(slow_ms) if slow_ms else None,
+            keep=int(os.environ.get("PROFILE_KEEP", "50")),
+            path_prefixes=[p.strip() for p in prefixes.split(",") if p.strip()] if prefixes else ("/atm/", "/analysis/")
+        )
+
+    def init_app(self, app):
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+        app.extensions["request_profiler"] = self
+
+    def before_request(self):
+        from flask import request
+        if not request.path.startswith(self.path_prefixes):
+            return
+
+        profiler = None
+        if self.sample_rate and random.random() < self.sample_rate and self._cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        _local.profile = RequestProfile(request.method, request.full_path.rstrip("?"), profiler)
+
+    def after_request(self, response):
+        profile = current_profile()
+        if profile is not None:
+            profile.status = response.status_code
+        return response
+
+    def teardown_request(self, exc=None):
+        profile = current_profile()
+        if profile is None:
+            return
+        _local.profile = None
+
+        if profile.profiler is not None:
+            profile.profiler.disable()
+            self._cprofile_lock.release()
+
+        profile.duration_ms = (time.perf_counter() - profile.started) * 1000
+        if self.slow_ms is not None:
+            keep = profile.duration_ms >= self.slow_ms
+        else:
+            keep = profile.profiler is not None
+        if not keep:
+            return
+
+        if profile.status is None and exc is not None:
+            profile.status = 500
+        if profile.profiler is not None:
+            profile.stats = format_stats(profile.profiler)
+        profile.profiler = None
+
+        with self._profiles_lock:
+            self.profiles.append(profile)
+        logger.info(f"Stored profile {profile.id} for {profile.method} {profile.path} ({profile.duration_ms:.0f} ms)")
+
+    def recent(self):
+        """Return summaries of the stored profiles, newest first"""
+        with self._profiles_lock:
+            return [profile.summary() for profile in reversed(self.profiles)]
+
+    def get(self, profile_id):
+        with self._profiles_lock:
+            for profile in self.profiles:
+                if profile.id == profile_id:
+                    return profile
+        return None
+
+    def clear(self):
+        with self._profiles_lock:
+            self.profiles.clear()
+
+def format_stats(profiler, sort="cumulative", limit=PROFILE_STATS_LIMIT):
+    """Render the top functions of a cProfile run as pstats text"""
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return output.getvalue()
@@ -0,0 +1,182 @@
+import os
+import json
+import logging
+import threading
+from app.utils.location_record import LocationRecord
+from app.utils.geokey import quantize, dequantize
+
+try:
+    import redis
+except ImportError:  # optional dependency
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+class RedisLocationCache:
+    """
+    Second-level location cache shared by every node through Redis
+
+    Each location is stored as a JSON string under its fixed-point key and
+    added to a geo set, so proximity lookups are answered by GEOSEARCH
+    instead of a scan. Works against any server speaking the Redis protocol
+    (redis-server, KeyDB, fakeredis in tests).
+    """
+
+    def __init__(self, client, prefix="locacash", ttl=None):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.geo_key = f"{prefix}:geo"
+        self._hit_count = 0
+        self._miss_count = 0
+        self._error_count = 0
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """Create a cache connected to a redis:// URL"""
+        client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return cls(client, **kwargs)
+
+    @staticmethod
+    def member(key):
+        """Geo-set member name for a (lat, lng) key, from its canonical fixed-point form"""
+        lat, lng = quantize(key)
+        return f"{lat}:{lng}"
+
+    @staticmethod
+    def key_from_member(member):
+        if isinstance(member, bytes):
+            member = member.decode("ascii")
+        lat, lng = member.split(":")
+        return dequantize(int(lat), int(lng))
+
+    def value_key(self, member):
+        return f"{self.prefix}:loc:{member}"
+
+    def _decode(self, raw):
+        if raw is None:
+            self._miss_count += 1
+            return None
+        self._hit_count += 1
+        return LocationRecord.from_dict(json.loads(raw))
+
+    def get(self, key):
+        """Return the LocationRecord stored for a key, or None"""
+        try:
+            return self._decode(self.client.get(self.value_key(self.member(key))))
+        except Exception as e:
+            self._error_count += 1
+            logger.warning(f"Redis cache read failed: {str(e)}")
+            return None
+
+    def get_many(self, keys):
+        """Look up several keys in one pipelined round trip, returning a list aligned with keys"""
+        if not keys:
+            return []
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipe.get(self.value_key(self.member(key)))
+            return [self._decode(raw) for raw in pipe.execute()]
+        except Exception as e:
+            self._error_count += 1
+            logger.warning(f"Redis cache batch read failed: {str(e)}")
+            return [None] * len(keys)
+
+    def nearest(self, key, max_distance_meters):
+        """
+        Find the closest stored location within max_distance_meters
+
+        Returns:
+            tuple: (matched key, LocationRecord, distance in meters) or None
+        """
+        try:
+            matches = self.client.geosearch(
+                self.geo_key,
+                longitude=float(key[1]),
+                latitude=float(key[0]),
+                radius=max_distance_meters,
+                unit="m",
+                sort="ASC",
+                count=1,
+                withdist=True
+            )
+            if not matches:
+                return None
+
+            member, distance = matches[0]
+            record = self._decode(self.client.get(self.value_key(
+                member.decode("ascii") if isinstance(member, bytes) else member
+            )))
+            if record is None:
+                # The value expired but its geo entry is still indexed
+                self.client.zrem(self.geo_key, member)
+                return None
+            return self.key_from_member(member), record, float(distance)
+        except Exception as e:
+            self._error_count += 1
+            logger.warning(f"Redis proximity lookup failed: {str(e)}")
+            return None
+
+    def set(self, key, value):
+        """Store a location and index it for proximity lookups"""
+        self.set_many([(key, value)])
+
+    def set_many(self, items):
+        """Store several locations in one pipelined round trip"""
+        if not items:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, value in items:
+                if isinstance(value, LocationRecord):
+                    value = value.to_dict()
+                member = self.member(key)
+                pipe.set(self.value_key(member), json.dumps(value, default=str), ex=self.ttl)
+                pipe.geoadd(self.geo_key, (float(key[1]), float(key[0]), member))
+            pipe.execute()
+        except Exception as e:
+            self._error_count += 1
+            logger.warning(f"Redis cache write failed: {str(e)}")
+
+    def stats(self):
+        """Return hit/miss/error counters for this process"""
+        total = self._hit_count + self._miss_count
+        return {
+            "hits": self._hit_count,
+            "misses": self._miss_count,
+            "errors": self._error_count,
+            "hit_ratio": self._hit_count / total if total else 0
+        }
+
+_l2_cache = None
+_l2_lock = threading.Lock()
+_l2_checked = False
+
+def get_l2_cache():
+    """
+    Return the Redis second-level cache configured by REDIS_URL, or None
+
+    The tier is optional: without REDIS_URL, or without the redis package
+    installed, lookups go straight from the in-process cache to Overpass.
+    """
+    global _l2_cache, _l2_checked
+    if not _l2_checked:
+        with _l2_lock:
+            if not _l2_checked:
+                url = os.environ.get("REDIS_URL")
+                if url and redis is None:
+                    logger.warning("REDIS_URL is set but the redis package is not installed; L2 cache disabled")
+                elif url:
+                    ttl = os.environ.get("REDIS_CACHE_TTL")
+                    _l2_cache = RedisLocationCache.from_url(url, ttl=int(ttl) if ttl else None)
+                    logger.info(f"Redis L2 location cache enabled at {url}")
+                _l2_checked = True
+    return _l2_cache
+
+def set_l2_cache(cache):
+    """Replace the second-level cache (used by tests and benchmarks)"""
+    global _l2_cache, _l2_checked
+    with _l2_lock:
+        _l2_cache = cache
+        _l2_checked = True
@@ -0,0 +1,223 @@
+import os
+import time
+import heapq
+import logging
+import threading
+from datetime import datetime
+from app.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Entries older than this (seconds) are stale: still served, but refreshed first
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+# Popular entries are refreshed once this fraction of the max age has passed
+DEFAULT_REFRESH_AHEAD = 0.8
+# Decayed hit count an entry needs to be refreshed ahead of time
+DEFAULT_MIN_HITS = 3
+# Hit counts halve every this many seconds
+DEFAULT_HALF_LIFE = 3600
+# Overpass requests the refresher may make per minute
+DEFAULT_BUDGET_PER_MINUTE = 6
+# Locations whose hits are tracked; the coldest are forgotten beyond this
+DEFAULT_MAX_TRACKED = 10000
+
+refreshes = registry.counter(
+    "locacash_cache_refreshes",
+    "Background cache refreshes by trigger (stale, ahead) and outcome (ok, error)",
+    ("trigger", "result")
+)
+
+def age_seconds(timestamp, now):
+    """Age of a cache entry from its timestamp (epoch seconds or ISO 8601), or None if unknown"""
+    if isinstance(timestamp, (int, float)):
+        return now - timestamp
+    if isinstance(timestamp, str):
+        try:
+            return now - datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return None
+    return None
+
+class CacheRefresher:
+    """
+    Refresh-ahead and stale-while-revalidate for the location cache
+
+    Routes report every cache hit with observe(), which counts hits per
+    location, halving the counts every half_life seconds. Hits on entries
+    older than max_age are still served (flagged stale) and queued for a
+    refresh ahead of everything else; entries with at least min_hits hits are
+    queued once refresh_ahead of max_age has passed, so hot locations are
+    re-fetched before they ever go stale. Between hits, the worker also
+    rescans the tracked locations for entries due a refresh.
+
+    A single daemon thread per process drains the queue, most popular first,
+    through a token bucket of budget_per_minute Overpass requests. The thread
+    is started on first use, so it runs in each gunicorn worker rather than
+    in the preloading master.
+    """
+
+    def __init__(self, refresh, max_age=DEFAULT_MAX_AGE, refresh_ahead=DEFAULT_REFRESH_AHEAD,
+                 min_hits=DEFAULT_MIN_HITS, half_life=DEFAULT_HALF_LIFE,
+                 budget_per_minute=DEFAULT_BUDGET_PER_MINUTE, max_tracked=DEFAULT_MAX_TRACKED):
+        self.refresh = refresh
+        self.max_age = max_age
+        self.refresh_ahead = refresh_ahead
+        self.min_hits = min_hits
+        self.half_life = half_life
+        self.budget_per_minute = budget_per_minute
+        self.max_tracked = max_tracked
+        # coords -> [decayed hits, start of the current half-life period, entry timestamp]
+        self._stats = {}
+        self._queue = []
+        self._queued = {}
+        self._sequence = 0
+        self._tokens = float(budget_per_minute)
+        self._tokens_at = time.monotonic()
+        self._condition = threading.Condition()
+        self._pid = None
+        self._last_scan = 0.0
+
+    @classmethod
+    def from_env(cls, refresh):
+        """Build a refresher from CACHE_REFRESH* env vars, or None when disabled"""
+        if os.environ.get("CACHE_REFRESH", "").lower() not in ("1", "true", "yes", "on"):
+            return None
+        return cls(
+            refresh,
+            max_age=float(os.environ.get("CACHE_MAX_AGE", DEFAULT_MAX_AGE)),
+            refresh_ahead=float(os.environ.get("CACHE_REFRESH_AHEAD", DEFAULT_REFRESH_AHEAD)),
+            min_hits=float(os.environ.get("CACHE_REFRESH_MIN_HITS", DEFAULT_MIN_HITS)),
+            budget_per_minute=float(os.environ.get("CACHE_REFRESH_BUDGET", DEFAULT_BUDGET_PER_MINUTE))
+        )
+
+    def init_app(self, app):
+        app.extensions["cache_refresher"] = self
+
+    def observe(self, coords, timestamp):
+        """
+        Record a hit on the cache entry for coords, queueing a refresh when due
+
+        Args:
+            coords (tuple): Canonical key of the entry that was served
+            timestamp: The entry's timestamp (epoch seconds or ISO 8601)
+
+        Returns:
+            bool: True when the entry is stale and should be flagged as such
+        """
+        self._ensure_worker()
+        now = time.time()
+        with self._condition:
+            stats = self._stats.get(coords)
+            if stats is None:
+                if len(self._stats) >= self.max_tracked:
+                    self._forget_coldest(now)
+                stats = self._stats[coords] = [0.0, now, timestamp]
+            self._decay(stats, now)
+            stats[0] += 1
+            stats[2] = timestamp
+            return self._consider(coords, stats, now)
+
+    def _decay(self, stats, now):
+        """Halve the hit count once for every half-life period that has ended"""
+        periods = int((now - stats[1]) // self.half_life)
+        if periods:
+            stats[0] *= 0.5 ** periods
+            stats[1] += periods * self.half_life
+
+    def _consider(self, coords, stats, now):
+        """Queue coords if its entry is stale or hot and nearly stale; call with the lock held"""
+        age = age_seconds(stats[2], now)
+        if age is None:
+            return False
+        stale = age >= self.max_age
+        if stale:
+            self._enqueue(coords, "stale", stats[0])
+        elif age >= self.refresh_ahead * self.max_age and stats[0] >= self.min_hits:
+            self._enqueue(coords, "ahead", stats[0])
+        return stale
+
+    def _enqueue(self, coords, trigger, hits):
+        """Queue a refresh: stale entries first, then the most hit"""
+        if coords in self._queued:
+            return
+        self._sequence += 1
+        self._queued[coords] = trigger
+        heapq.heappush(self._queue, (trigger != "stale", -hits, self._sequence, coords))
+        self._condition.notify()
+
+    def _forget_coldest(self, now):
+        """Drop the coldest tenth of the tracked locations; call with the lock held"""
+        for stats in self._stats.values():
+            self._decay(stats, now)
+        coldest = sorted(self._stats, key=lambda coords: self._stats[coords][0])
+        for coords in coldest[:max(1, len(coldest) // 10)]:
+            if coords not in self._queued:
+                del self._stats[coords]
+
+    def _ensure_worker(self):
+        if self._pid == os.getpid():
+            return
+        with self._condition:
+            if self._pid != os.getpid():
+                # A forked worker inherits the queue but not the thread
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name="cache-refresher", daemon=True).start()
+
+    def _take_token(self):
+        """Wait until the Overpass budget allows another request"""
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                self._tokens = min(
+                    float(self.budget_per_minute),
+                    self._tokens + (now - self._tokens_at) * self.budget_per_minute / 60
+                )
+                self._tokens_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) * 60 / self.budget_per_minute
+            time.sleep(wait)
+
+    def _next(self):
+        """Block until a location is queued, rescanning for due entries periodically"""
+        with self._condition:
+            while not self._queue:
+                now = time.time()
+                if now - self._last_scan >= 60:
+                    self._last_scan = now
+                    for coords, stats in list(self._stats.items()):
+                        self._decay(stats, now)
+                        self._consider(coords, stats, now)
+                    if self._queue:
+                        break
+                self._condition.wait(timeout=60)
+            coords = heapq.heappop(self._queue)[-1]
+            return coords, self._queued[coords]
+
+    def _run(self):
+        while True:
+            coords, trigger = self._next()
+            self._take_token()
+            try:
+                result = self.refresh(coords)
+                refreshes.inc(trigger=trigger, result="ok")
+                logger.info(f"🔄 Refreshed cached location {coords} ({trigger})")
+            except Exception as e:
+                result = None
+                refreshes.inc(trigger=trigger, result="error")
+                logger.error(f"Failed to refresh cached location {coords}: {e}")
+            with self._condition:
+                del self._queued[coords]
+                stats = self._stats.get(coords)
+                if stats is not None and result is not None:
+                    stats[2] = result.get("timestamp")
+
+    def stats(self):
+        with self._condition:
+            return {
+                "tracked_locations": len(self._stats),
+                "queued_refreshes": len(self._queue),
+                "max_age_seconds": self.max_age,
+                "budget_per_minute": self.budget_per_minute
+            }
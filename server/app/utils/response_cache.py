@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from functools import wraps
+from collections import OrderedDict
+from flask import request, jsonify, make_response
+
+class UserResponseCache:
+    """
+    Per-user in-process cache of JSON response payloads
+
+    Entries are grouped by user so that every cached response belonging to a
+    user can be dropped at once when that user's data changes. Users are
+    evicted least-recently-used once max_users is reached, and entries expire
+    after ttl seconds as a safety net for writes made by other processes.
+    """
+
+    def __init__(self, max_users=1024, ttl=300):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self._hit_count = 0
+        self._miss_count = 0
+
+    @staticmethod
+    def make_etag(payload):
+        """Build a strong ETag from the canonical JSON form of a payload"""
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, user_id, key):
+        """Return (etag, payload) for a cached response, or None on a miss"""
+        with self._lock:
+            entries = self._users.get(user_id)
+            entry = entries.get(key) if entries else None
+
+            if entry is None or time.time() - entry[2] > self.ttl:
+                if entry is not None:
+                    del entries[key]
+                self._miss_count += 1
+                return None
+
+            self._users.move_to_end(user_id)
+            self._hit_count += 1
+            return entry[0], entry[1]
+
+    def set(self, user_id, key, payload):
+        """Cache a payload for a user and return its ETag"""
+        etag = self.make_etag(payload)
+        with self._lock:
+            entries = self._users.setdefault(user_id, {})
+            entries[key] = (etag, payload, time.time())
+            self._users.move_to_end(user_id)
+
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return etag
+
+    def invalidate(self, user_id):
+        """Drop every cached response for a user"""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        """Drop every cached response"""
+        with self._lock:
+            self._users.clear()
+
+    def stats(self):
+        """Return cache size and hit/miss counters"""
+        with self._lock:
+            total = self._hit_count + self._miss_count
+            return {
+                "cached_users": len(self._users),
+                "cached_responses": sum(len(entries) for entries in self._users.values()),
+                "hits": self._hit_count,
+                "misses": self._miss_count,
+                "hit_ratio": self._hit_count / total if total else 0
+            }
+
+# Create a shared instance
+analysis_cache = UserResponseCache(
+    max_users=int(os.environ.get("ANALYSIS_CACHE_MAX_USERS", 1024)),
+    ttl=float(os.environ.get("ANALYSIS_CACHE_TTL", 300))
+)
+
+def cached_per_user(f):
+    """
+    Decorator serving a GET route's JSON through the per-user response cache
+
+    The route must take a user_id URL parameter. Successful responses are
+    cached under the request path and query string, tagged with an ETag, and
+    answered with 304 Not Modified when the client sends a matching
+    If-None-Match header.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        user_id = kwargs.get('user_id')
+        cache_key = request.full_path
+
+        entry = analysis_cache.get(user_id, cache_key)
+        if entry is None:
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            etag = analysis_cache.set(user_id, cache_key, response.get_json())
+            response.headers['X-Cache'] = 'MISS'
+        else:
+            etag, payload = entry
+            response = jsonify(payload)
+            response.headers['X-Cache'] = 'HIT'
+
+        response.set_etag(etag)
+        # Let browsers keep the body but always revalidate with the ETag
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+
+    return decorated
@@ -1,4 +1,115 @@
+import os
 import math
+import threading
+from collections import OrderedDict
+from app.utils.metrics import registry
+
+# Default weights if none provided
+DEFAULT_WEIGHTS = {
+    "population_density": 25,
+    "competing_atms": 20,
+    "commercial_activity": 20, 
+    "traffic_flow": 15,
+    "public_transport": 10,
+    "land_rate": 10
+}
+
+class ScoreMemo:
+    """
+    Thread-safe LRU memo of scoring results
+
+    Values are shared between callers and must be treated as read-only.
+    Hits and misses are counted under the memo's own lock and exported as
+    locacash_score_memo_lookups_total. A max_size of 0 disables the memo.
+    """
+
+    def __init__(self, name, max_size):
+        self.name = name
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if not self.max_size:
+            return None
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if not self.max_size:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+# SCORE_MEMO_SIZE entries each (default 4096); 0 disables memoization
+score_memo = ScoreMemo("scores", int(os.environ.get("SCORE_MEMO_SIZE", 4096)))
+factor_memo = ScoreMemo("factors", int(os.environ.get("SCORE_MEMO_SIZE", 4096)))
+
+registry.counter_callback(
+    "locacash_score_memo_lookups",
+    "Scoring memo lookups by memo (scores, factors) and result (hit, miss)",
+    ("memo", "result"),
+    lambda: {
+        key: value
+        for memo in (score_memo, factor_memo)
+        for key, value in (((memo.name, "hit"), memo.hits), ((memo.name, "miss"), memo.misses))
+    }
+)
+
+def factors_key(location_data):
+    """
+    Memo key for the location data scoring reads
+
+    Factor values come from integer element counts (and land_rate is rounded
+    to cents), so equal inputs have equal values and need no further
+    quantizing. The radius is included because the competition
+    recommendation quotes it.
+    """
+    return (
+        location_data["population_density"], location_data["competing_atms"],
+        location_data["commercial_activity"], location_data["traffic_flow"],
+        location_data["public_transport"], location_data["land_rate"],
+        location_data.get("radius", 1500)
+    )
+
+def weights_key(normalized_weights):
+    """Memo key for normalized weights, so proportional weights in any order share it"""
+    return tuple(sorted(normalized_weights.items()))
+
+def valid_weights(weights):
+    """Whether custom weights give every factor a non-negative number and are not all zero"""
+    if not isinstance(weights, dict) or set(weights) != set(DEFAULT_WEIGHTS):
+        return False
+    values = weights.values()
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v) and v >= 0 for v in values):
+        return False
+    return sum(values) > 0
+
+def normalize_weights(weights=None):
+    """Normalize weights (0-100 each) so they sum to 100"""
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
+    
+    weight_sum = sum(weights.values())
+    return {k: (v / weight_sum) * 100 for k, v in weights.items()}
 
 def calculate_scores(location_data, weights=None):
     """
@@ -10,22 +121,97 @@ def calculate_scores(location_data, weights=None):
         
     Returns:
         dict: Comprehensive scoring data for the Results panel
+    
+    Results are memoized on the factor values and weights, so identical
+    requests (a slider dragged back and forth) skip scoring entirely. Each
+    call returns a new top-level dict, but the nested values are shared with
+    the memo and must not be mutated.
     """
-    # Default weights if none provided
-    if weights is None:
-        weights = {
-            "population_density": 25,
-            "competing_atms": 20,
-            "commercial_activity": 20, 
-            "traffic_flow": 15,
-            "public_transport": 10,
-            "land_rate": 10
-        }
-    
-    # Normalize weights to sum to 100
-    weight_sum = sum(weights.values())
-    normalized_weights = {k: (v / weight_sum) * 100 for k, v in weights.items()}
+    normalized_weights = normalize_weights(weights)
+    key = (factors_key(location_data), weights_key(normalized_weights))
+    result = score_memo.get(key)
+    if result is None:
+        result = score_location(location_data, normalized_weights)
+        score_memo.set(key, result)
+    return dict(result)
+
+def calculate_scores_batch(locations, weights=None):
+    """
+    Score many locations with the same weights, normalizing them only once
+    
+    Args:
+        locations (list): Raw metrics dicts from the factors API
+        weights (dict, optional): Custom weights for each factor (0-100)
+        
+    Returns:
+        list: Scoring data for each location, in input order
+    """
+    normalized_weights = normalize_weights(weights)
+    weights_part = weights_key(normalized_weights)
+    results = []
+    for location_data in locations:
+        key = (factors_key(location_data), weights_part)
+        result = score_memo.get(key)
+        if result is None:
+            result = score_location(location_data, normalized_weights)
+            score_memo.set(key, result)
+        results.append(dict(result))
+    return results
+
+def score_location(location_data, normalized_weights):
+    """Score one location with weights already normalized to sum to 100"""
+    factor_scores, formatted_scores, recommendations = analyze_factors(location_data)
+    
+    # Calculate overall score as weighted average
+    overall_score = 0
+    for factor, score in factor_scores.items():
+        overall_score += score * (normalized_weights[factor] / 100)
+    
+    overall_score = round(overall_score)
+    
+    # Format the response for the UI
+    result = {
+        "overall_score": overall_score,
+        "suitability": get_overall_suitability(overall_score),
+        "factor_scores": formatted_scores,
+        "recommendations": recommendations
+    }
+    
+    return result
+
+def analyze_factors(location_data):
+    """
+    Per-factor scores and recommendations, which do not depend on the weights
+    
+    Memoized separately from score_location, so a new set of weights for an
+    already scored location only redoes the weighted average.
     
+    Returns:
+        tuple: (raw factor scores, factor scores formatted for the UI, recommendations)
+    """
+    location_key = factors_key(location_data)
+    cached = factor_memo.get(location_key)
+    if cached is not None:
+        return cached
+    
+    factor_scores = calculate_factor_scores(location_data)
+    
+    # Generate recommendations based on scores
+    recommendations = generate_recommendations(factor_scores, location_data)
+    
+    formatted_scores = {
+        factor: {
+            "score": round(score),
+            "rating": get_rating(score)
+        } for factor, score in factor_scores.items()
+    }
+    
+    analysis = (factor_scores, formatted_scores, recommendations)
+    factor_memo.set(location_key, analysis)
+    return analysis
+
+def calculate_factor_scores(location_data):
+    """Score each factor of a location from 0 to 100"""
     # Calculate individual factor scores (0-100)
     factor_scores = {}
     
@@ -74,39 +260,16 @@ def calculate_scores(location_data, weights=None):
     else:
         factor_scores["land_rate"] = 90
     
-    # Calculate overall score as weighted average
-    overall_score = 0
-    for factor, score in factor_scores.items():
-        overall_score += score * (normalized_weights[factor] / 100)
-    
-    overall_score = round(overall_score)
-    
-    # Generate recommendations based on scores
-    recommendations = generate_recommendations(factor_scores, location_data)
-    
-    # Determine rating categories
-    def get_rating(score):
-        if score >= 80:
-            return "High"
-        elif score >= 60:
-            return "Medium"
-        else:
-            return "Low"
-    
-    # Format the response for the UI
-    result = {
-        "overall_score": overall_score,
-        "suitability": get_overall_suitability(overall_score),
-        "factor_scores": {
-            factor: {
-                "score": round(score),
-                "rating": get_rating(score)
-            } for factor, score in factor_scores.items()
-        },
-        "recommendations": recommendations
-    }
-    
-    return result
+    return factor_scores
+
+def get_rating(score):
+    """Rating category shown next to a factor score"""
+    if score >= 80:
+        return "High"
+    elif score >= 60:
+        return "Medium"
+    else:
+        return "Low"
 
 def get_overall_suitability(score):
     """Determine the overall suitability description based on score"""
@@ -137,7 +300,8 @@ def generate_recommendations(scores, raw_data):
     if raw_data["competing_atms"] == 0:
         recommendations.append("No competing ATMs in the area - opportunity to establish presence")
     elif raw_data["competing_atms"] <= 3:
-        recommendations.append(f"Consider the moderate competition from {raw_data['competing_atms']} existing ATM(s) in a 1.5km radius")
+        radius_km = raw_data.get("radius", 1500) / 1000
+        recommendations.append(f"Consider the moderate competition from {raw_data['competing_atms']} existing ATM(s) in a {radius_km:g}km radius")
     else:
         recommendations.append(f"High competition with {raw_data['competing_atms']} existing ATMs may limit transaction volume")
     
@@ -0,0 +1,388 @@
+"""
+Region-sharded location cache across several nodes
+
+The location cache is partitioned by spatial cell: the geohash of a
+location, truncated to SHARD_GEOHASH_PRECISION characters (5, about 5 km,
+by default). Cells are assigned to nodes by a consistent-hash ring, so
+adding or removing a node only moves the cells that node gains or loses.
+Any node can answer /fetch_details: it serves the cells it owns from its
+own cache and forwards the rest to the owner's internal lookup endpoint.
+
+Sharding is off unless SHARD_NODES lists the base URLs of every node.
+Nodes authenticate each other with the shared SHARD_SECRET, which is
+required whenever sharding is on.
+
+A node's current membership lives in a small state file (SHARD_STATE_PATH,
+in /dev/shm by default) that every worker process of the node checks on
+each request, so a membership change received by one worker reaches all
+of them. The file is reset from SHARD_NODES when the app starts.
+"""
+import os
+import json
+import hmac
+import time
+import bisect
+import hashlib
+import logging
+import tempfile
+import threading
+import requests
+from app.utils.metrics import registry
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; state updates are then unlocked
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Geohash characters per cell; 5 characters is about 4.9 x 4.9 km at the equator
+DEFAULT_GEOHASH_PRECISION = 5
+# Points each node is hashed to on the ring, evening out the share of cells
+DEFAULT_VIRTUAL_NODES = 64
+# Seconds to wait for the owning node, which may itself wait on Overpass
+DEFAULT_FORWARD_TIMEOUT = 60
+# Entries sent per request when handing cells over to their new owner
+HANDOFF_BATCH_SIZE = 500
+# Seconds between checks of the membership file by idle worker processes
+MEMBERSHIP_CHECK_INTERVAL = 2
+
+# Header marking a request already routed by another node, and the shared secret
+FORWARDED_HEADER = "X-Shard-Forwarded"
+TOKEN_HEADER = "X-Shard-Token"
+
+shard_requests = registry.counter(
+    "locacash_shard_requests",
+    "Location lookups by where they were served (local, forwarded, fallback)",
+    ("route",)
+)
+handoffs = registry.counter(
+    "locacash_shard_handoffs",
+    "Cache entries handed over to another node after a membership change, by result (ok, error)",
+    ("result",)
+)
+
+def geohash(lat, lng, precision=DEFAULT_GEOHASH_PRECISION):
+    """Standard base-32 geohash of a point"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = value = 0
+    return "".join(chars)
+
+def default_state_path(self_url):
+    """One state file per node, so several nodes can run on one host"""
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, f"locacash_shard_{hashlib.md5(self_url.encode('utf-8')).hexdigest()[:12]}.json")
+
+def ring_position(label):
+    """Stable 64-bit position of a label on the ring (hash() differs per process)"""
+    return int.from_bytes(hashlib.md5(label.encode("utf-8")).digest()[:8], "big")
+
+class HashRing:
+    """Consistent-hash ring mapping cell names to nodes"""
+
+    def __init__(self, nodes, virtual_nodes=DEFAULT_VIRTUAL_NODES):
+        self.virtual_nodes = virtual_nodes
+        self.nodes = sorted(set(nodes))
+        points = sorted(
+            (ring_position(f"{node}#{i}"), node)
+            for node in self.nodes
+            for i in range(virtual_nodes)
+        )
+        self._positions = [position for position, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owner(self, cell):
+        """Node owning a cell: the first node point clockwise of the cell's hash"""
+        if not self._owners:
+            return None
+        i = bisect.bisect(self._positions, ring_position(cell)) % len(self._positions)
+        return self._owners[i]
+
+class ShardRouter:
+    """
+    Routes location lookups to the node owning their cell
+
+    Args:
+        nodes (list): Base URLs of every node, e.g. http://10.0.0.5:8080
+        self_url (str): This node's base URL, as listed in nodes
+        precision (int): Geohash characters per cell
+        secret (str): Token nodes send each other in X-Shard-Token; without
+            one every internal request is refused
+        timeout (float): Seconds to wait for a forwarded lookup
+        state_path (str, optional): Membership file shared by the node's workers
+    """
+
+    def __init__(self, nodes, self_url, precision=DEFAULT_GEOHASH_PRECISION,
+                 secret=None, timeout=DEFAULT_FORWARD_TIMEOUT, virtual_nodes=DEFAULT_VIRTUAL_NODES,
+                 state_path=None):
+        self.self_url = self_url.rstrip("/")
+        self.precision = precision
+        self.secret = secret
+        self.timeout = timeout
+        self.virtual_nodes = virtual_nodes
+        self.ring = HashRing([node.rstrip("/") for node in nodes], virtual_nodes)
+        self.state_path = state_path or default_state_path(self.self_url)
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+        # (mtime, size, inode) of the state file this process last applied
+        self._state_version = None
+        self._write_state({"nodes": self.ring.nodes, "rebalance": {}})
+        self._state_version = self._state_file_version()
+
+    @classmethod
+    def from_env(cls):
+        """Build a router from SHARD_* env vars, or None when sharding is off"""
+        nodes = [node.strip() for node in os.environ.get("SHARD_NODES", "").split(",") if node.strip()]
+        if not nodes:
+            return None
+        self_url = os.environ.get("SHARD_SELF")
+        if not self_url:
+            raise RuntimeError("SHARD_SELF must name this node's URL when SHARD_NODES is set")
+        secret = os.environ.get("SHARD_SECRET")
+        if not secret:
+            # The internal endpoints rewrite the ring and fill the cache, so they are never left open
+            raise RuntimeError("SHARD_SECRET must be set when SHARD_NODES is set")
+        return cls(
+            nodes,
+            self_url,
+            precision=int(os.environ.get("SHARD_GEOHASH_PRECISION", DEFAULT_GEOHASH_PRECISION)),
+            secret=secret,
+            timeout=float(os.environ.get("SHARD_FORWARD_TIMEOUT", DEFAULT_FORWARD_TIMEOUT)),
+            state_path=os.environ.get("SHARD_STATE_PATH") or None
+        )
+
+    def cell(self, coords):
+        return geohash(coords[0], coords[1], self.precision)
+
+    def owner(self, coords):
+        return self.ring.owner(self.cell(coords))
+
+    def is_local(self, coords):
+        return self.owner(coords) == self.self_url
+
+    def headers(self):
+        headers = {FORWARDED_HEADER: self.self_url}
+        if self.secret:
+            headers[TOKEN_HEADER] = self.secret
+        return headers
+
+    def check_token(self, token):
+        """Whether a request's X-Shard-Token matches the shared secret"""
+        return bool(self.secret) and hmac.compare_digest(token or "", self.secret)
+
+    def post(self, node, path, payload):
+        """POST JSON to another node's internal endpoint; raises on network errors"""
+        return self._session.post(
+            f"{node}{path}", json=payload, headers=self.headers(), timeout=self.timeout
+        )
+
+    def _state_file_version(self):
+        try:
+            stat = os.stat(self.state_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _read_state(self):
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"nodes": self.ring.nodes, "rebalance": {}}
+
+    def _write_state(self, state):
+        """Replace the state file atomically, so workers never read half of it"""
+        temp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+    def _update_state(self, update):
+        """Read, update and write the state file under an inter-process lock"""
+        with open(f"{self.state_path}.lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                state = self._read_state()
+                update(state)
+                self._write_state(state)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def sync(self):
+        """
+        Apply a membership change another worker wrote to the state file
+
+        Rebalance progress also rewrites the file, so the nodes are compared
+        rather than trusting the file version alone.
+
+        Returns:
+            bool: Whether this process's ring changed
+        """
+        version = self._state_file_version()
+        if version is None or version == self._state_version:
+            return False
+        with self._lock:
+            if version == self._state_version:
+                return False
+            nodes = self._read_state().get("nodes")
+            self._state_version = version
+            if not nodes or sorted(nodes) == self.ring.nodes:
+                return False
+            self.ring = HashRing(nodes, self.virtual_nodes)
+            return True
+
+    def set_nodes(self, nodes):
+        """
+        Replace the ring's membership for every worker of this node
+
+        Returns:
+            bool: Whether the membership changed
+        """
+        nodes = sorted(set(node.rstrip("/") for node in nodes))
+        self.sync()
+        with self._lock:
+            if nodes == self.ring.nodes:
+                return False
+            self._update_state(lambda state: state.update(nodes=nodes, rebalance={}))
+            self._state_version = self._state_file_version()
+            self.ring = HashRing(nodes, self.virtual_nodes)
+            return True
+
+    def _set_rebalance_state(self, **progress):
+        key = str(os.getpid())
+        def update(state):
+            state.setdefault("rebalance", {}).setdefault(key, {"status": "running", "moved": 0, "failed": 0})
+            state["rebalance"][key].update(progress)
+        self._update_state(update)
+
+    def start_rebalance(self, cache):
+        """Run rebalance(cache) in a background thread"""
+        self._set_rebalance_state(status="running", moved=0, failed=0)
+        threading.Thread(target=self.rebalance, args=(cache,), name="shard-rebalance", daemon=True).start()
+
+    def rebalance(self, cache):
+        """
+        Hand every cached entry this node no longer owns to its new owner
+
+        Entries are sent to the owner's ingest endpoint in batches and only
+        dropped locally once the owner has stored them, so a failed handoff
+        leaves the entries where they were. Each worker process records its
+        progress in the state file under its pid.
+
+        Returns:
+            dict: Number of entries moved and failed
+        """
+        state = {"status": "running", "moved": 0, "failed": 0}
+        outgoing = {}
+        for coords, record in cache.get_all().items():
+            owner = self.owner(coords)
+            if owner != self.self_url and owner is not None:
+                outgoing.setdefault(owner, []).append((coords, record))
+
+        for owner, entries in outgoing.items():
+            for start in range(0, len(entries), HANDOFF_BATCH_SIZE):
+                batch = entries[start:start + HANDOFF_BATCH_SIZE]
+                payload = {"entries": [{"coords": list(coords), "data": record.to_dict()} for coords, record in batch]}
+                try:
+                    response = self.post(owner, "/internal/v1/shard/ingest", payload)
+                    response.raise_for_status()
+                except requests.exceptions.RequestException as e:
+                    logger.warning(f"Handing {len(batch)} cache entries to {owner} failed: {e}")
+                    handoffs.inc(len(batch), result="error")
+                    state["failed"] += len(batch)
+                else:
+                    cache.delete_many([coords for coords, _ in batch])
+                    handoffs.inc(len(batch), result="ok")
+                    state["moved"] += len(batch)
+                self._set_rebalance_state(**state)
+
+        state["status"] = "done"
+        self._set_rebalance_state(**state)
+        logger.info(f"Shard rebalance finished: {state['moved']} entries handed off, {state['failed']} failed")
+        return state
+
+    def stats(self):
+        """Membership and rebalance progress, the same whichever worker answers"""
+        self.sync()
+        return {
+            "self": self.self_url,
+            "nodes": self.ring.nodes,
+            "geohash_precision": self.precision,
+            "rebalance": self._read_state().get("rebalance", {})
+        }
+
+_router = None
+_router_lock = threading.Lock()
+_router_checked = False
+
+def get_shard_router():
+    """
+    Return the shard router configured by SHARD_NODES, or None when sharding is off
+
+    Picks up membership changes made through another worker first. With a
+    per-process location cache, this worker then hands off the entries it
+    no longer owns; a shared cache is rebalanced by the worker that took
+    the change.
+    """
+    global _router, _router_checked
+    if not _router_checked:
+        with _router_lock:
+            if not _router_checked:
+                _router = ShardRouter.from_env()
+                if _router is not None:
+                    logger.info(f"Location cache sharded over {len(_router.ring.nodes)} nodes as {_router.self_url}")
+                _router_checked = True
+    if _router is not None and _router.sync():
+        from app.utils.bptree import bptree
+        logger.info(f"Shard membership changed to {_router.ring.nodes} by another worker")
+        if not getattr(bptree, "shared", False):
+            _router.start_rebalance(bptree)
+    return _router
+
+def set_shard_router(router):
+    """Replace the shard router (used by tests and benchmarks)"""
+    global _router, _router_checked
+    with _router_lock:
+        _router = router
+        _router_checked = True
+
+def start_membership_watcher(interval=MEMBERSHIP_CHECK_INTERVAL):
+    """
+    Check the membership file in the background of this worker process
+
+    Requests already pick up membership changes, but a worker that serves
+    none would otherwise keep the entries it should hand off. Call once per
+    worker process after the fork; does nothing when sharding is off.
+    """
+    if get_shard_router() is None:
+        return
+
+    def watch():
+        while True:
+            time.sleep(interval)
+            try:
+                get_shard_router()
+            except Exception as e:
+                logger.warning(f"Checking shard membership failed: {e}")
+
+    threading.Thread(target=watch, name="shard-membership", daemon=True).start()
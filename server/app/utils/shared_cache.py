@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+from app.utils.location_record import LocationRecord
+from app.utils.geokey import KEY_SCALE, quantize, dequantize
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS location_cache (
+    lat_key INTEGER NOT NULL,
+    lng_key INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (lat_key, lng_key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS cache_meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def default_cache_path():
+    """Prefer the RAM-backed /dev/shm so the shared file never touches disk"""
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "locacash_location_cache.db")
+
+class SharedLocationCache:
+    """
+    Location cache shared by every worker process on a host
+
+    Entries live in one memory-mapped SQLite file (in /dev/shm where
+    available), so N gunicorn workers hold a single copy of the cache and
+    see each other's inserts immediately. The file runs in WAL mode, which
+    suits this read-mostly workload: readers never block and never wait for
+    the single writer. The public methods mirror BPlusTree, so routes and
+    loaders work unchanged.
+
+    Connections are opened lazily per thread and per process, since SQLite
+    connections must not be carried across a fork.
+    """
+
+    # Lets the warmup skip reloading a cache another worker already filled
+    shared = True
+
+    def __init__(self, path=None, mmap_size=256 * 2**20):
+        self.path = path or default_cache_path()
+        self.mmap_size = mmap_size
+        self.created_at = time.time()
+        self._hit_count = 0
+        self._miss_count = 0
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        if getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    # Keys are stored as the canonical fixed-point integers from app.utils.geokey
+    to_int_key = staticmethod(quantize)
+    from_int_key = staticmethod(dequantize)
+
+    def insert(self, key, value):
+        """Insert or replace a location; visible to every worker immediately"""
+        if isinstance(value, dict):
+            value = LocationRecord.from_dict(value)
+
+        lat_key, lng_key = self.to_int_key(key)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO location_cache (lat_key, lng_key, data) VALUES (?, ?, ?)",
+            (lat_key, lng_key, json.dumps(value.to_dict(), default=str))
+        )
+
+    def insert_many(self, items, chunk_size=1000):
+        """
+        Insert (key, value) pairs in a single write transaction
+
+        Returns:
+            int: Number of pairs inserted
+        """
+        conn = self.connection
+        count = 0
+        rows = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key, value in items:
+                # Stored exactly as insert stores them, without response-only keys
+                if isinstance(value, dict):
+                    value = LocationRecord.from_dict(value)
+                rows.append((*self.to_int_key(key), json.dumps(value.to_dict(), default=str)))
+
+                if len(rows) >= chunk_size:
+                    self._write_rows(rows)
+                    count += len(rows)
+                    rows = []
+
+            self._write_rows(rows)
+            count += len(rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return count
+
+    def _write_rows(self, rows):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO location_cache (lat_key, lng_key, data) VALUES (?, ?, ?)",
+            rows
+        )
+
+    def delete_many(self, keys):
+        """Remove keys for every worker, returning how many were present"""
+        cursor = self.connection.executemany(
+            "DELETE FROM location_cache WHERE lat_key = ? AND lng_key = ?",
+            [self.to_int_key(key) for key in keys]
+        )
+        return cursor.rowcount
+
+    def search(self, key):
+        """Return the LocationRecord stored for a key, or None"""
+        row = self.connection.execute(
+            "SELECT data FROM location_cache WHERE lat_key = ? AND lng_key = ?",
+            self.to_int_key(key)
+        ).fetchone()
+
+        if row is None:
+            self._miss_count += 1
+            return None
+
+        self._hit_count += 1
+        return LocationRecord.from_dict(json.loads(row[0]))
+
+    def nearest(self, key, max_distance):
+        """
+        Find the stored location closest to key within max_distance degrees
+
+        Returns:
+            tuple: (matched key, LocationRecord, distance) or None
+        """
+        lat_key, lng_key = self.to_int_key(key)
+        limit = max_distance * KEY_SCALE + 1e-9
+        span = int(limit)
+        rows = self.connection.execute(
+            "SELECT lat_key, lng_key, data FROM location_cache "
+            "WHERE lat_key BETWEEN ? AND ? AND lng_key BETWEEN ? AND ?",
+            (lat_key - span, lat_key + span, lng_key - span, lng_key + span)
+        ).fetchall()
+
+        best = None
+        for row_lat, row_lng, data in rows:
+            dist = ((row_lat - lat_key) ** 2 + (row_lng - lng_key) ** 2) ** 0.5
+            if dist <= limit and (best is None or dist < best[2]):
+                best = (self.from_int_key(row_lat, row_lng), data, dist)
+
+        if best is None:
+            return None
+        return best[0], LocationRecord.from_dict(json.loads(best[1])), best[2] / KEY_SCALE
+
+    def keys(self):
+        """Return every key in sorted order"""
+        return [
+            self.from_int_key(lat_key, lng_key)
+            for lat_key, lng_key in self.connection.execute(
+                "SELECT lat_key, lng_key FROM location_cache ORDER BY lat_key, lng_key"
+            )
+        ]
+
+    def get_all(self):
+        """Return all key-value pairs in the cache"""
+        return {
+            self.from_int_key(lat_key, lng_key): LocationRecord.from_dict(json.loads(data))
+            for lat_key, lng_key, data in self.connection.execute(
+                "SELECT lat_key, lng_key, data FROM location_cache ORDER BY lat_key, lng_key"
+            )
+        }
+
+    def size(self):
+        """Return the number of keys in the cache"""
+        return self.connection.execute("SELECT COUNT(*) FROM location_cache").fetchone()[0]
+
+    def get_meta(self, name):
+        """Return a value stored alongside the cache (such as the warmup marker), or None"""
+        row = self.connection.execute("SELECT value FROM cache_meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, name, value):
+        if value is None:
+            self.connection.execute("DELETE FROM cache_meta WHERE name = ?", (name,))
+        else:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cache_meta (name, value) VALUES (?, ?)", (name, value)
+            )
+
+    def clear(self):
+        """Remove every entry for all workers and reset this worker's statistics"""
+        self.connection.execute("DELETE FROM location_cache")
+        self.connection.execute("DELETE FROM cache_meta")
+        self.created_at = time.time()
+        self._hit_count = 0
+        self._miss_count = 0
+
+    def memory_usage(self):
+        """Return the bytes used by the shared cache file and its WAL"""
+        total = 0
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                total += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return total
+
+    def get_hit_ratio(self):
+        """Calculate this worker's cache hit ratio"""
+        total = self._hit_count + self._miss_count
+        if total == 0:
+            return 0
+        return self._hit_count / total
+
+    def print_structure(self):
+        """Print a summary of the shared cache"""
+        logging.info(f"Shared cache file: {self.path}")
+        logging.info(f"Total Keys: {self.size()}")
+        logging.info(f"Hit Count: {self._hit_count}")
+        logging.info(f"Miss Count: {self._miss_count}")
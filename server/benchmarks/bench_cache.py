@@ -0,0 +1,52 @@
+"""Benchmarks for the location cache: insert, search, warmup and proximity lookup"""
+import random
+
+from app.utils.bptree import BPlusTree
+from benchmarks.fixtures import synthetic_locations
+from benchmarks.harness import bench
+
+def filled_tree(locations):
+    tree = BPlusTree()
+    tree.insert_many((tuple(location["coords"]), location) for location in locations)
+    return tree
+
+def run(sizes):
+    results = []
+    for size in sizes:
+        locations = synthetic_locations(size)
+        probes = [tuple(location["coords"]) for location in random.Random(1).sample(locations, min(size, 200))]
+        new_locations = synthetic_locations(20, seed=7)
+
+        results.append(bench(
+            "bptree.warmup_insert_many",
+            lambda: filled_tree(locations),
+            repeat=3, size=size
+        ))
+
+        tree = filled_tree(locations)
+        results.append(bench(
+            "bptree.search_hit",
+            lambda: [tree.search(probe) for probe in probes],
+            number=1, repeat=5, size=size, probes=len(probes)
+        ))
+        results.append(bench(
+            "bptree.search_miss",
+            lambda: [tree.search((probe[0] + 1, probe[1])) for probe in probes],
+            number=1, repeat=5, size=size, probes=len(probes)
+        ))
+        results.append(bench(
+            "bptree.nearest",
+            lambda: [tree.nearest((probe[0] + 0.00003, probe[1]), 0.0001) for probe in probes[:20]],
+            number=1, repeat=3, size=size, probes=min(len(probes), 20)
+        ))
+
+        # Single inserts into a tree that already holds size entries
+        def insert_new():
+            for location in new_locations:
+                tree.insert(tuple(location["coords"]), location)
+        results.append(bench(
+            "bptree.insert_single",
+            insert_new,
+            repeat=3, size=size, inserts=len(new_locations)
+        ))
+    return results
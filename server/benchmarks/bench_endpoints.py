@@ -0,0 +1,58 @@
+"""
+End-to-end benchmark of /atm/v1/fetch_details through the Flask test client
+
+Overpass is stubbed in-process with a synthetic payload and storage uses a
+throwaway SQLite database, so the numbers cover routing, cache lookup,
+element classification and serialization without any network.
+"""
+import os
+import logging
+import tempfile
+import contextlib
+
+from benchmarks.fixtures import synthetic_overpass_payload
+from benchmarks.harness import bench
+
+def run(requests=200, elements=2000):
+    from app import create_app
+    from app.utils import factors
+    from app.utils.bptree import bptree
+    from app.services.storage import set_storage
+    from app.services.sqlite_service import SQLiteStorage
+
+    # Route and factor logging is part of the request cost, but not its output
+    logging.disable(logging.INFO)
+    devnull = open(os.devnull, "w")
+    tmpdir = tempfile.mkdtemp(prefix="locacash-bench-")
+    set_storage(SQLiteStorage(os.path.join(tmpdir, "bench.db")))
+
+    payload = synthetic_overpass_payload(elements=elements)
+    original_executor = factors.overpass_query_executor
+    factors.overpass_query_executor = lambda query, priority=None: payload
+
+    try:
+        app = create_app(warmup="off")
+        client = app.test_client()
+        locations = [[12.9 + i * 0.001, 80.1 + i * 0.001] for i in range(requests)]
+
+        def fetch_all():
+            with contextlib.redirect_stdout(devnull):
+                for location in locations:
+                    client.post("/atm/v1/fetch_details", json={"Location": location})
+
+        return [
+            bench(
+                "endpoint.fetch_details_miss",
+                fetch_all,
+                setup=bptree.clear, repeat=3, requests=requests, elements=elements
+            ),
+            bench(
+                "endpoint.fetch_details_hit",
+                fetch_all,
+                repeat=3, requests=requests, elements=elements
+            )
+        ]
+    finally:
+        factors.overpass_query_executor = original_executor
+        logging.disable(logging.NOTSET)
+        devnull.close()
@@ -0,0 +1,38 @@
+"""Benchmarks for classifying Overpass elements into location factors"""
+import json
+
+from app.utils import factors
+from benchmarks.fixtures import synthetic_overpass_payload
+from benchmarks.harness import bench
+
+def run(element_counts=(500, 5000, 20000), payload_path=None):
+    """
+    Time summarize_elements, single and multi-radius, on synthetic payloads,
+    or on a recorded Overpass response saved as JSON when payload_path is given
+    """
+    payloads = []
+    if payload_path:
+        with open(payload_path) as payload_file:
+            payloads.append(("recorded", json.load(payload_file)))
+    else:
+        payloads = [(count, synthetic_overpass_payload(elements=count)) for count in element_counts]
+
+    results = []
+    for label, payload in payloads:
+        elements = payload["elements"]
+        results.append(bench(
+            "factors.summarize_elements",
+            lambda: factors.summarize_elements(elements, 13.0639, 80.2416, 1500),
+            number=5, repeat=5, elements=len(elements) if label != "recorded" else "recorded"
+        ))
+        results.append(bench(
+            "factors.summarize_elements_by_radius",
+            lambda: factors.summarize_elements_by_radius(elements, 13.0639, 80.2416, factors.FACTOR_RADII),
+            number=5, repeat=5, elements=len(elements) if label != "recorded" else "recorded"
+        ))
+        results.append(bench(
+            "factors.parse_payload_json",
+            lambda: json.loads(json.dumps(payload)),
+            number=1, repeat=5, elements=len(elements) if label != "recorded" else "recorded"
+        ))
+    return results
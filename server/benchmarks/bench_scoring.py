@@ -0,0 +1,42 @@
+"""Benchmarks for calculate_scores: single versus batched, cold versus memoized"""
+from app.utils.score import calculate_scores, calculate_scores_batch, score_memo, factor_memo
+from benchmarks.fixtures import synthetic_locations
+from benchmarks.harness import bench
+
+WEIGHTS = {
+    "population_density": 30,
+    "competing_atms": 25,
+    "commercial_activity": 20,
+    "traffic_flow": 15,
+    "public_transport": 10,
+    "land_rate": 15
+}
+
+def clear_memos():
+    score_memo.clear()
+    factor_memo.clear()
+
+def run(count=1000):
+    locations = synthetic_locations(count)
+
+    def cold_single():
+        clear_memos()
+        return [calculate_scores(location, WEIGHTS) for location in locations]
+
+    def cold_batch():
+        clear_memos()
+        return calculate_scores_batch(locations, WEIGHTS)
+
+    results = [
+        bench("score.calculate_scores_single", cold_single, repeat=5, locations=count),
+        bench("score.calculate_scores_batch", cold_batch, repeat=5, locations=count)
+    ]
+
+    # Repeated requests for the same locations and weights
+    calculate_scores_batch(locations, WEIGHTS)
+    results.append(bench(
+        "score.calculate_scores_memoized",
+        lambda: [calculate_scores(location, WEIGHTS) for location in locations],
+        repeat=5, locations=count
+    ))
+    return results
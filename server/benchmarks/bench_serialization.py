@@ -0,0 +1,72 @@
+"""
+Bytes and encoding time for large analysis histories
+
+Compares the stdlib JSON encoder (pretty, as the debug server used to send
+it, and compact) with orjson and MessagePack, then gzip and brotli on the
+compact JSON. Encoders whose optional package is not installed are skipped.
+"""
+import json
+import random
+
+from app.utils import serialization
+from benchmarks.fixtures import synthetic_location
+from benchmarks.harness import bench
+
+def synthetic_history(count, seed=7):
+    """Build a /user-analyses response body with count analyses"""
+    rng = random.Random(seed)
+    data = []
+    for i in range(count):
+        location = synthetic_location(rng)
+        data.append({
+            "id": f"{rng.getrandbits(128):032x}",
+            "number": i + 1,
+            "location": {"lat": location["coords"][0], "lng": location["coords"][1]},
+            "metrics": {
+                "score": location["overall_score"],
+                "landRate": 50000 + (i * 10000),
+                "populationDensity": location["population_density"],
+                "competingATMs": location["competing_atms"],
+                "commercialActivity": location["commercial_activity"],
+                "trafficFlow": location["traffic_flow"],
+                "publicTransport": location["public_transport"]
+            },
+            "isSelected": False,
+            "created_at": location["timestamp"],
+            "is_favorite": rng.random() < 0.1
+        })
+    return {"success": True, "data": data}
+
+def measured(name, encode, count, **params):
+    """Benchmark encode() and record the size of what it produced"""
+    result = bench(name, encode, repeat=5, analyses=count, **params)
+    result["bytes"] = len(encode())
+    print(f"{'':<40} {'':<28} {result['bytes']:>10} bytes")
+    return result
+
+def run(sizes=(1000, 10000)):
+    results = []
+    for count in sizes:
+        history = synthetic_history(count)
+        compact = json.dumps(history, separators=(",", ":")).encode("utf-8")
+
+        results.append(measured(
+            "serialize.json_pretty",
+            lambda: json.dumps(history, indent=2, sort_keys=True).encode("utf-8"), count
+        ))
+        results.append(measured(
+            "serialize.json_compact",
+            lambda: json.dumps(history, separators=(",", ":")).encode("utf-8"), count
+        ))
+        if serialization.orjson is not None:
+            results.append(measured(
+                "serialize.orjson",
+                lambda: serialization.orjson.dumps(history, option=serialization.OrjsonProvider.options), count
+            ))
+        if serialization.msgpack is not None:
+            results.append(measured("serialize.msgpack", lambda: serialization.packb(history), count))
+
+        results.append(measured("compress.gzip", lambda: serialization.compress(compact, "gzip"), count))
+        if serialization.brotli is not None:
+            results.append(measured("compress.brotli", lambda: serialization.compress(compact, "br"), count))
+    return results
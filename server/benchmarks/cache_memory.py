@@ -0,0 +1,49 @@
+"""
+Compare the memory cost of cached location entries stored as plain dicts
+versus compact LocationRecord objects
+
+Usage (from the server directory):
+    python benchmarks/cache_memory.py [--count 100000]
+"""
+import os
+import sys
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.location_record import LocationRecord
+from benchmarks.fixtures import synthetic_location
+
+def measure(build, count):
+    """Return bytes allocated while building count entries with build()"""
+    rng = random.Random(42)
+    sources = [synthetic_location(rng) for _ in range(count)]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    entries = [build(source) for source in sources]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    del entries
+    return after - before
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=100000)
+    args = parser.parse_args()
+
+    # dict(source) copies the dict; the coords list is copied too, as the
+    # loader builds a fresh one for every record
+    dict_bytes = measure(lambda source: {**source, "coords": list(source["coords"])}, args.count)
+    record_bytes = measure(LocationRecord.from_dict, args.count)
+
+    print(f"entries:          {args.count}")
+    print(f"dict entries:     {dict_bytes / args.count:8.1f} bytes/entry  ({dict_bytes / 2**20:8.1f} MiB)")
+    print(f"LocationRecord:   {record_bytes / args.count:8.1f} bytes/entry  ({record_bytes / 2**20:8.1f} MiB)")
+    print(f"saving:           {1 - record_bytes / dict_bytes:8.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Check the Redis second-level cache against fakeredis, without a Redis server
+
+Exercises RedisLocationCache the way the routes use it: exact and
+pipelined lookups, proximity matches through GEOSEARCH, expired values
+whose geo entries are still indexed, and a broken connection, which must
+degrade to cache misses rather than errors. Exits with status 1 if any
+check fails.
+
+Usage (from the server directory, after pip install -r requirements-optional.txt):
+    python benchmarks/check_redis_cache.py
+"""
+import os
+import sys
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.redis_cache import RedisLocationCache
+from app.utils.location_record import LocationRecord
+
+try:
+    import fakeredis
+except ImportError:  # development dependency
+    fakeredis = None
+
+def location(lat, lng, density):
+    return {
+        "coords": [lat, lng],
+        "population_density": density,
+        "competing_atms": 3,
+        "commercial_activity": 12,
+        "traffic_flow": 40,
+        "public_transport": 2,
+        "land_rate": 5200.0,
+        "cache_source": "api",
+        "timestamp": time.time()
+    }
+
+class BrokenClient:
+    """Redis client whose every call fails, like a server that went away"""
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise ConnectionError("connection refused")
+        return fail
+
+def run_checks():
+    failures = []
+
+    def check(name, condition):
+        print(f"{'ok  ' if condition else 'FAIL'}  {name}")
+        if not condition:
+            failures.append(name)
+
+    client = fakeredis.FakeRedis()
+    cache = RedisLocationCache(client, prefix="check")
+
+    cache.set((13.0827, 80.2707), location(13.0827, 80.2707, 21.5))
+    record = cache.get((13.0827, 80.2707))
+    check("get returns the stored record", isinstance(record, LocationRecord) and record.population_density == 21.5)
+    check("get misses an unknown key", cache.get((13.5, 80.5)) is None)
+
+    cache.set_many([((12.9 + i / 100, 77.6), location(12.9 + i / 100, 77.6, i)) for i in range(10)])
+    records = cache.get_many([(12.9, 77.6), (12.95, 77.6), (0.0, 0.0)])
+    check(
+        "get_many stays aligned with its keys",
+        [r.population_density if r else None for r in records] == [0, 5, None]
+    )
+    check("get_many of no keys is empty", cache.get_many([]) == [])
+
+    match = cache.nearest((13.08275, 80.27075), 50)
+    check("nearest finds a location within the radius", match is not None and match[0] == (13.0827, 80.2707))
+    check("nearest reports the distance in meters", match is not None and 0 < match[2] < 50)
+    check("nearest ignores locations beyond the radius", cache.nearest((13.1, 80.3), 50) is None)
+
+    client.delete(cache.value_key(cache.member((13.0827, 80.2707))))
+    check("nearest skips a value that expired", cache.nearest((13.08275, 80.27075), 50) is None)
+    check(
+        "the expired value's geo entry is removed",
+        client.zscore(cache.geo_key, cache.member((13.0827, 80.2707))) is None
+    )
+
+    expiring = RedisLocationCache(client, prefix="ttl", ttl=60)
+    expiring.set((10.0, 76.0), location(10.0, 76.0, 1))
+    check("ttl is applied to stored values", 0 < client.ttl(expiring.value_key(expiring.member((10.0, 76.0)))) <= 60)
+
+    stats = cache.stats()
+    check("stats count hits and misses", stats["hits"] >= 3 and stats["misses"] >= 2 and stats["errors"] == 0)
+
+    broken = RedisLocationCache(BrokenClient(), prefix="broken")
+    broken.set((13.0, 80.0), location(13.0, 80.0, 1))
+    check("a failed get is a miss", broken.get((13.0, 80.0)) is None)
+    check("a failed get_many is all misses", broken.get_many([(13.0, 80.0), (13.1, 80.1)]) == [None, None])
+    check("a failed nearest is no match", broken.nearest((13.0, 80.0), 50) is None)
+    check("failures are counted as errors", broken.stats()["errors"] == 4)
+
+    return failures
+
+def main():
+    if fakeredis is None:
+        sys.exit("fakeredis is not installed (pip install -r requirements-optional.txt)")
+    # The broken-connection checks log a warning per failure on purpose
+    logging.getLogger("app.utils.redis_cache").setLevel(logging.ERROR)
+
+    failures = run_checks()
+    print(f"\n{len(failures)} check(s) failed" if failures else "\nAll checks passed")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Measure cold-start time of a server worker
+
+Each sample runs in a fresh interpreter so nothing is already imported,
+and times importing the app package and calling create_app() with the
+cache warmup turned off (warmup is measured separately).
+
+Usage (from the server directory):
+    python benchmarks/cold_start.py [--runs 5]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import time, json
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app(warmup="off")
+created = time.perf_counter()
+print(json.dumps({"import": imported - started, "create_app": created - imported}))
+"""
+
+def measure_once():
+    """Run one cold start in a subprocess and return its timings in seconds"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=SERVER_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    
+    samples = [measure_once() for _ in range(args.runs)]
+    for stage in ("import", "create_app"):
+        values = [sample[stage] for sample in samples]
+        print(f"{stage:<12} median {statistics.median(values) * 1000:8.1f} ms   "
+              f"max {max(values) * 1000:8.1f} ms")
+    totals = [sample["import"] + sample["create_app"] for sample in samples]
+    print(f"{'total':<12} median {statistics.median(totals) * 1000:8.1f} ms   "
+          f"max {max(totals) * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
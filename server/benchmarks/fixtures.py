@@ -0,0 +1,71 @@
+"""
+Deterministic synthetic inputs shared by the benchmarks and the load tester
+
+Overpass payloads mimic the shape of real responses to the query built by
+fetch_all_location_data: nodes with lat/lon and ways with a center, tagged with
+amenity, shop, highway and public_transport values in realistic proportions.
+"""
+import math
+import random
+
+# (tag key, values) weighted roughly like a dense Indian city centre
+TAG_CHOICES = (
+    (0.30, "highway", ("residential", "footway", "service", "tertiary", "primary", "bus_stop")),
+    (0.25, "amenity", ("restaurant", "school", "place_of_worship", "bank", "hospital", "cafe", "parking")),
+    (0.05, "amenity", ("atm",)),
+    (0.30, "shop", ("supermarket", "clothes", "convenience", "bakery", "mobile_phone")),
+    (0.10, "public_transport", ("platform", "stop_position", "station")),
+)
+
+def synthetic_overpass_payload(lat=13.0639, lng=80.2416, radius=1500, elements=2000, seed=0):
+    """Build an Overpass-style JSON payload with elements spread over the radius"""
+    rng = random.Random(seed)
+    weights = [choice[0] for choice in TAG_CHOICES]
+    result = []
+
+    for i in range(elements):
+        _, key, values = rng.choices(TAG_CHOICES, weights)[0]
+        element = {"type": "node", "id": seed * 10**7 + i, "tags": {key: rng.choice(values)}}
+        if key == "amenity" and rng.random() < 0.2:
+            element["tags"]["shop"] = rng.choice(TAG_CHOICES[3][2])
+
+        # Uniform point in the search circle
+        distance = radius * math.sqrt(rng.random())
+        bearing = rng.uniform(0, 2 * math.pi)
+        point = {
+            "lat": lat + (distance * math.cos(bearing)) / 111320,
+            "lon": lng + (distance * math.sin(bearing)) / (111320 * math.cos(math.radians(lat)))
+        }
+        if key == "highway" and rng.random() < 0.7:
+            # Ways carry their center, as requested with "out center"
+            element["type"] = "way"
+            element["center"] = point
+            element["nodes"] = [rng.randrange(10**9) for _ in range(rng.randint(2, 8))]
+        else:
+            element.update(point)
+        result.append(element)
+
+    return {"version": 0.6, "generator": "LocaCash synthetic fixture", "elements": result}
+
+def synthetic_location(rng):
+    """Build a location data dict shaped like the ones loaded from storage"""
+    lat = round(rng.uniform(12.8, 13.3), 6)
+    lng = round(rng.uniform(80.0, 80.4), 6)
+    return {
+        "coords": [lat, lng],
+        "population_density": rng.uniform(0, 60),
+        "competing_atms": rng.randint(0, 12),
+        "commercial_activity": rng.randint(0, 80),
+        "traffic_flow": rng.randint(0, 2000),
+        "public_transport": rng.randint(0, 40),
+        "land_rate": round(rng.uniform(2000, 90000), 2),
+        "overall_score": rng.randint(20, 95),
+        "cached": True,
+        "cache_source": "database_startup",
+        "timestamp": f"2025-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}T10:00:00.{rng.randint(0, 999999):06d}+00:00"
+    }
+
+def synthetic_locations(count, seed=42):
+    """Build count location data dicts with a fixed seed"""
+    rng = random.Random(seed)
+    return [synthetic_location(rng) for _ in range(count)]
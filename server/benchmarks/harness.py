@@ -0,0 +1,110 @@
+"""Timing, result storage and regression comparison for the benchmark suite"""
+import os
+import gc
+import sys
+import json
+import time
+import platform
+import statistics
+import subprocess
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def bench(name, fn, number=1, repeat=5, setup=None, **params):
+    """
+    Time fn() the way timeit does, returning a result record
+
+    fn runs number times per sample and repeat samples are taken; setup(), if
+    given, runs untimed before every sample. Times are per call, in seconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            for _ in range(number):
+                fn()
+            samples.append((time.perf_counter() - started) / number)
+        finally:
+            gc.enable()
+
+    result = {
+        "name": name,
+        "params": params,
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "max": max(samples),
+        "number": number,
+        "repeat": repeat
+    }
+    print(f"{name:<40} {format_params(params):<28} median {format_seconds(result['median']):>10}   "
+          f"min {format_seconds(result['min']):>10}")
+    return result
+
+def format_params(params):
+    return " ".join(f"{key}={value}" for key, value in params.items())
+
+def format_seconds(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+def result_key(result):
+    return f"{result['name']} {format_params(result['params'])}".strip()
+
+def environment():
+    """Describe the machine and code version the results were taken on"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+def save_results(results, path=None):
+    """Write results as JSON, by default to results/<timestamp>.json"""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(path, "w") as output:
+        json.dump({"environment": environment(), "results": results}, output, indent=2)
+    return path
+
+def compare(results, baseline_path, threshold=0.10):
+    """
+    Print each benchmark's change against a saved baseline
+
+    Returns:
+        list: Keys of benchmarks whose median got slower by more than threshold
+    """
+    with open(baseline_path) as baseline_file:
+        baseline = {result_key(result): result for result in json.load(baseline_file)["results"]}
+
+    regressions = []
+    print(f"\nComparison against {baseline_path} (threshold {threshold:.0%}):")
+    for result in results:
+        key = result_key(result)
+        previous = baseline.get(key)
+        if previous is None:
+            print(f"  {key:<68} new")
+            continue
+        change = result["median"] / previous["median"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"  {key:<68} {change:+7.1%}{flag}")
+    return regressions
@@ -0,0 +1,263 @@
+"""
+Closed-loop load generator for a running LocaCash server
+
+Each of --concurrency workers sends requests back to back for --duration
+seconds, picking an operation from --mix every time, then throughput,
+error counts and p50/p95/p99 latency are reported per operation:
+
+    python -m benchmarks.loadtest --base-url http://127.0.0.1:5000 \\
+        --concurrency 32 --duration 60 \\
+        --mix fetch_details=60,get_score=25,history=10,save=5 --hot-ratio 0.8
+
+--hot-ratio is the share of fetch_details requests drawn from a small set of
+hot locations, which sets how often the location cache hits. Run the server
+against benchmarks.stub_overpass (via OVERPASS_ENDPOINTS) so misses never
+reach the public Overpass API. Pass --with-stub to start a stub in-process.
+
+The analysis routes require a bearer token for the user they serve; pass
+one with --token and every analysis request is made as that token's user.
+"""
+import os
+import json
+import time
+import random
+import argparse
+import threading
+import statistics
+
+import requests
+
+from benchmarks.fixtures import synthetic_location
+
+# Operation name -> (method, path template)
+OPERATIONS = {
+    "fetch_details": ("POST", "/atm/v1/fetch_details"),
+    "fetch_details_batch": ("POST", "/atm/v1/fetch_details_batch"),
+    "get_score": ("POST", "/atm/v1/get_score"),
+    "save": ("POST", "/analysis/v1/save"),
+    "history": ("GET", "/analysis/v1/history/{user_id}"),
+    "user_analyses": ("GET", "/analysis/v1/user-analyses/{user_id}"),
+    "cache_status": ("GET", "/atm/v1/cache-status")
+}
+
+DEFAULT_MIX = "fetch_details=60,get_score=25,history=10,save=5"
+
+# Bounding box the random locations are drawn from (Chennai)
+LAT_RANGE = (12.85, 13.25)
+LNG_RANGE = (80.05, 80.35)
+
+def parse_mix(mix):
+    """Parse "name=weight,..." into a list of (operation, weight)"""
+    weights = []
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}', expected one of: {', '.join(OPERATIONS)}")
+        weights.append((name, float(weight or 1)))
+    return weights
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+class RequestFactory:
+    """Builds randomised request bodies for each operation"""
+
+    def __init__(self, user_ids, hot_ratio=0.5, hot_locations=50, batch_size=10, seed=None):
+        self.rng = random.Random(seed)
+        self.user_ids = user_ids
+        self.hot_ratio = hot_ratio
+        self.batch_size = batch_size
+        self.hot = [self.random_location() for _ in range(hot_locations)]
+
+    def random_location(self):
+        return [round(self.rng.uniform(*LAT_RANGE), 6), round(self.rng.uniform(*LNG_RANGE), 6)]
+
+    def location(self):
+        if self.hot and self.rng.random() < self.hot_ratio:
+            return self.rng.choice(self.hot)
+        return self.random_location()
+
+    def build(self, operation):
+        """Return (path parameters, JSON body) for one request"""
+        user_id = self.rng.choice(self.user_ids)
+        if operation == "fetch_details":
+            return {}, {"Location": self.location()}
+        if operation == "fetch_details_batch":
+            return {}, {"Locations": [self.location() for _ in range(self.batch_size)]}
+        if operation == "get_score":
+            return {}, {"location_data": synthetic_location(self.rng)}
+        if operation == "save":
+            location = synthetic_location(self.rng)
+            return {}, {
+                "user_id": user_id,
+                "location_lat": location["coords"][0],
+                "location_lng": location["coords"][1],
+                **{key: value for key, value in location.items() if key not in ("coords", "cached", "cache_source", "timestamp")}
+            }
+        return {"user_id": user_id}, None
+
+class LoadTest:
+    """Runs the workers and collects per-operation latencies"""
+
+    def __init__(self, base_url, mix, concurrency, duration, factory, token=None, timeout=60):
+        self.base_url = base_url.rstrip("/")
+        self.operations = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.concurrency = concurrency
+        self.duration = duration
+        self.factory = factory
+        self.token = token
+        self.timeout = timeout
+        self.latencies = {name: [] for name in self.operations}
+        self.statuses = {name: {} for name in self.operations}
+        self._lock = threading.Lock()
+        self._factory_lock = threading.Lock()
+
+    def worker(self, deadline):
+        session = requests.Session()
+        if self.token:
+            session.headers["Authorization"] = f"Bearer {self.token}"
+
+        while time.perf_counter() < deadline:
+            with self._factory_lock:
+                operation = self.factory.rng.choices(self.operations, self.weights)[0]
+                path_params, body = self.factory.build(operation)
+
+            method, template = OPERATIONS[operation]
+            url = self.base_url + template.format(**path_params)
+            started = time.perf_counter()
+            try:
+                response = session.request(method, url, json=body, timeout=self.timeout)
+                response.content
+                status = str(response.status_code)
+            except requests.exceptions.Timeout:
+                status = "timeout"
+            except requests.exceptions.RequestException:
+                status = "connection_error"
+            elapsed = time.perf_counter() - started
+
+            with self._lock:
+                self.latencies[operation].append(elapsed)
+                self.statuses[operation][status] = self.statuses[operation].get(status, 0) + 1
+
+    def run(self):
+        started = time.perf_counter()
+        deadline = started + self.duration
+        threads = [threading.Thread(target=self.worker, args=(deadline,)) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed):
+        """Summarise the run as a JSON-ready dict"""
+        def summarise(latencies, statuses):
+            latencies = sorted(latencies)
+            errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "3")))
+            return {
+                "requests": len(latencies),
+                "errors": errors,
+                "statuses": dict(sorted(statuses.items())),
+                "throughput_rps": len(latencies) / elapsed if elapsed else 0,
+                "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0,
+                "p50_ms": percentile(latencies, 0.50) * 1000,
+                "p95_ms": percentile(latencies, 0.95) * 1000,
+                "p99_ms": percentile(latencies, 0.99) * 1000,
+                "max_ms": latencies[-1] * 1000 if latencies else 0
+            }
+
+        all_latencies = [value for values in self.latencies.values() for value in values]
+        all_statuses = {}
+        for statuses in self.statuses.values():
+            for status, count in statuses.items():
+                all_statuses[status] = all_statuses.get(status, 0) + count
+
+        return {
+            "base_url": self.base_url,
+            "concurrency": self.concurrency,
+            "duration_s": elapsed,
+            "operations": {
+                name: summarise(self.latencies[name], self.statuses[name]) for name in self.operations
+            },
+            "total": summarise(all_latencies, all_statuses)
+        }
+
+def print_report(report):
+    print(f"\n{report['concurrency']} workers for {report['duration_s']:.1f}s against {report['base_url']}\n")
+    print(f"{'operation':<22}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    rows = list(report["operations"].items()) + [("total", report["total"])]
+    for name, stats in rows:
+        print(f"{name:<22}{stats['requests']:>9}{stats['errors']:>8}{stats['throughput_rps']:>9.1f}"
+              f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+    statuses = report["total"]["statuses"]
+    print("\nStatuses: " + ", ".join(f"{status}={count}" for status, count in statuses.items()))
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive a running LocaCash server and report latency percentiles")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run for")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"operation weights (default {DEFAULT_MIX})")
+    parser.add_argument("--hot-ratio", type=float, default=0.5, help="share of lookups hitting hot locations")
+    parser.add_argument("--hot-locations", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=10, help="locations per fetch_details_batch request")
+    parser.add_argument("--users", type=int, default=20, help="distinct user ids for analysis requests (ignored with --token)")
+    parser.add_argument("--token", help="bearer token sent with every request")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="write the report as JSON to this path")
+    parser.add_argument("--with-stub", action="store_true",
+                        help="start an in-process Overpass stub on --stub-port for a server using it")
+    parser.add_argument("--stub-port", type=int, default=8765)
+    parser.add_argument("--stub-latency", type=float, default=300, help="stub latency in ms")
+    parser.add_argument("--stub-rate-limit", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub_server = None
+    if args.with_stub:
+        from benchmarks.stub_overpass import OverpassStub, serve
+        stub_server = serve(
+            OverpassStub(latency_ms=args.stub_latency, rate_limit=args.stub_rate_limit, seed=args.seed),
+            port=args.stub_port
+        )
+        print(f"Overpass stub listening on http://127.0.0.1:{args.stub_port}/api/interpreter")
+
+    user_ids = [f"loadtest-user-{i}" for i in range(args.users)]
+    if args.token:
+        # The server only serves a token's own user
+        import jwt
+        user_ids = [jwt.decode(args.token, options={"verify_signature": False})["sub"]]
+
+    factory = RequestFactory(
+        user_ids=user_ids,
+        hot_ratio=args.hot_ratio,
+        hot_locations=args.hot_locations,
+        batch_size=args.batch_size,
+        seed=args.seed
+    )
+    load_test = LoadTest(
+        args.base_url, parse_mix(args.mix), args.concurrency, args.duration, factory,
+        token=args.token, timeout=args.timeout
+    )
+
+    try:
+        report = load_test.run()
+    finally:
+        if stub_server is not None:
+            stub_server.shutdown()
+
+    print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"Saved report to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Run the LocaCash benchmark suite and save the results for regression tracking
+
+Usage (from the server directory):
+    python -m benchmarks.run                      # quick sizes (1k-100k keys)
+    python -m benchmarks.run --full               # adds 1M-key cache benchmarks
+    python -m benchmarks.run --only cache scoring
+    python -m benchmarks.run --payload recorded_overpass.json
+    python -m benchmarks.run --compare benchmarks/results/baseline.json
+
+Results are written to benchmarks/results/<timestamp>.json (or --output).
+With --compare, the exit status is 1 if any median regressed by more than
+--threshold.
+"""
+import sys
+import argparse
+
+from benchmarks import bench_cache, bench_scoring, bench_factors, bench_endpoints, bench_serialization
+from benchmarks.harness import save_results, compare
+
+SUITES = ("cache", "scoring", "factors", "endpoints", "serialization")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the LocaCash benchmark suite")
+    parser.add_argument("--only", nargs="+", choices=SUITES, default=SUITES)
+    parser.add_argument("--full", action="store_true", help="include 1M-key cache benchmarks")
+    parser.add_argument("--payload", help="recorded Overpass JSON response to classify")
+    parser.add_argument("--output", help="where to save results")
+    parser.add_argument("--compare", help="baseline results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    results = []
+    if "cache" in args.only:
+        sizes = (1000, 10000, 100000) + ((1000000,) if args.full else ())
+        results += bench_cache.run(sizes)
+    if "scoring" in args.only:
+        results += bench_scoring.run()
+    if "factors" in args.only:
+        results += bench_factors.run(payload_path=args.payload)
+    if "endpoints" in args.only:
+        results += bench_endpoints.run()
+    if "serialization" in args.only:
+        results += bench_serialization.run()
+
+    path = save_results(results, args.output)
+    print(f"\nSaved {len(results)} results to {path}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
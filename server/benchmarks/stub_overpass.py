@@ -0,0 +1,224 @@
+"""
+Local stand-in for the Overpass API, for load testing without the public servers
+
+Point the server at it with OVERPASS_ENDPOINTS and every cache miss is
+answered locally:
+
+    python -m benchmarks.stub_overpass --port 8765 --latency 400 --rate-limit 0.05
+    OVERPASS_ENDPOINTS=http://127.0.0.1:8765/api/interpreter python run.py
+
+Responses are replayed from a directory of recorded Overpass JSON files
+(--responses). A query recorded earlier is answered with its own response;
+anything else gets a recorded response chosen by the query hash, or a
+synthetic payload centred on the queried point when nothing was recorded.
+With --record and --upstream the stub instead forwards every query to a
+real Overpass endpoint and saves the responses for later replays.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, urlencode
+from urllib.request import Request, urlopen
+
+from benchmarks.fixtures import synthetic_overpass_payload
+
+# Matches the first around:radius,lat,lng filter of a query
+AROUND_PATTERN = re.compile(r"around:\s*([\d.]+)\s*,\s*(-?[\d.]+)\s*,\s*(-?[\d.]+)")
+
+def query_digest(query):
+    """Stable file name for a query, ignoring whitespace differences"""
+    return hashlib.sha1(" ".join(query.split()).encode("utf-8")).hexdigest()
+
+class OverpassStub:
+    """Chooses the response, latency and status for each stub request"""
+
+    def __init__(self, responses_dir=None, latency_ms=0, jitter_ms=0, rate_limit=0.0,
+                 error_rate=0.0, retry_after=1, elements=2000, record_dir=None,
+                 upstream=None, seed=None):
+        self.responses_dir = responses_dir
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.elements = elements
+        self.record_dir = record_dir
+        self.upstream = upstream
+        self.random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.recorded = {}
+        self.counts = {"200": 0, "429": 0, "504": 0, "recorded": 0, "synthetic": 0}
+        self._counts_lock = threading.Lock()
+
+        if responses_dir:
+            for name in sorted(os.listdir(responses_dir)):
+                if name.endswith(".json"):
+                    with open(os.path.join(responses_dir, name), "rb") as response_file:
+                        self.recorded[name[:-len(".json")]] = response_file.read()
+            print(f"Loaded {len(self.recorded)} recorded responses from {responses_dir}")
+
+    def count(self, key):
+        with self._counts_lock:
+            self.counts[key] += 1
+
+    def roll(self):
+        with self._random_lock:
+            return self.random.random()
+
+    def delay(self):
+        """Sleep for the configured latency, uniformly jittered"""
+        with self._random_lock:
+            jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+        seconds = max(0, self.latency_ms + jitter) / 1000
+        if seconds:
+            time.sleep(seconds)
+
+    def respond(self, query):
+        """
+        Build the stub response for an Overpass query
+
+        Returns:
+            tuple: (HTTP status, extra headers, body bytes)
+        """
+        self.delay()
+
+        outcome = self.roll()
+        if outcome < self.rate_limit:
+            self.count("429")
+            return 429, {"Retry-After": str(self.retry_after)}, b"rate_limited"
+        if outcome < self.rate_limit + self.error_rate:
+            self.count("504")
+            return 504, {}, b"gateway_timeout"
+
+        if self.record_dir:
+            return self.record(query)
+
+        digest = query_digest(query)
+        if self.recorded:
+            self.count("recorded")
+            body = self.recorded.get(digest)
+            if body is None:
+                keys = sorted(self.recorded)
+                body = self.recorded[keys[int(digest, 16) % len(keys)]]
+        else:
+            self.count("synthetic")
+            body = json.dumps(self.synthetic(query, digest)).encode("utf-8")
+
+        self.count("200")
+        return 200, {}, body
+
+    def synthetic(self, query, digest):
+        """Synthetic payload around the queried point, identical for repeated queries"""
+        match = AROUND_PATTERN.search(query)
+        if match:
+            radius, lat, lng = (float(value) for value in match.groups())
+        else:
+            radius, lat, lng = 1500, 13.0639, 80.2416
+        return synthetic_overpass_payload(
+            lat=lat, lng=lng, radius=radius, elements=self.elements, seed=int(digest[:8], 16)
+        )
+
+    def record(self, query):
+        """Forward a query to the real Overpass endpoint and save its response"""
+        request = Request(
+            self.upstream,
+            data=urlencode({"data": query}).encode("utf-8"),
+            headers={"User-Agent": "LocaCash ATM Analysis Tool"}
+        )
+        with urlopen(request, timeout=60) as response:
+            body = response.read()
+
+        os.makedirs(self.record_dir, exist_ok=True)
+        with open(os.path.join(self.record_dir, query_digest(query) + ".json"), "wb") as output:
+            output.write(body)
+        self.count("200")
+        return 200, {}, body
+
+def make_handler(stub):
+    class OverpassStubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            params = parse_qs(urlparse(self.path).query)
+            self.answer(params.get("data", [""])[0])
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length).decode("utf-8")
+            params = parse_qs(body)
+            self.answer(params["data"][0] if "data" in params else body)
+
+        def answer(self, query):
+            try:
+                status, headers, body = stub.respond(query)
+            except Exception as e:
+                status, headers, body = 502, {}, f"stub error: {e}".encode("utf-8")
+
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json" if status == 200 else "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return OverpassStubHandler
+
+def serve(stub, host="127.0.0.1", port=8765):
+    """Start the stub in a background thread and return the server"""
+    server = ThreadingHTTPServer((host, port), make_handler(stub))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Overpass API stand-in for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--responses", help="directory of recorded Overpass JSON responses to replay")
+    parser.add_argument("--latency", type=float, default=0, help="response latency in ms")
+    parser.add_argument("--jitter", type=float, default=0, help="uniform latency jitter in ms")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 504")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--elements", type=int, default=2000, help="elements per synthetic response")
+    parser.add_argument("--record", help="forward queries to --upstream and save responses here")
+    parser.add_argument("--upstream", default="https://overpass-api.de/api/interpreter")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    stub = OverpassStub(
+        responses_dir=args.responses,
+        latency_ms=args.latency,
+        jitter_ms=args.jitter,
+        rate_limit=args.rate_limit,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+        elements=args.elements,
+        record_dir=args.record,
+        upstream=args.upstream if args.record else None,
+        seed=args.seed
+    )
+    server = serve(stub, args.host, args.port)
+    print(f"Overpass stub listening on http://{args.host}:{args.port}/api/interpreter")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"Served: {json.dumps(stub.counts)}")
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+gunicorn settings for serving LocaCash in production
+
+Every setting can be overridden from the environment:
+
+    PORT / BIND            address to listen on (default 0.0.0.0:8080)
+    WEB_CONCURRENCY        worker processes (default: CPU count, at most 4)
+    GUNICORN_THREADS       threads per worker (default 8)
+    GUNICORN_TIMEOUT       seconds before a silent worker is restarted (default 120)
+    GRACEFUL_TIMEOUT       seconds workers get to finish requests on shutdown (default 30)
+    CACHE_SNAPSHOT_PATH    file the location cache is snapshotted to on shutdown
+"""
+import os
+import gc
+import multiprocessing
+
+bind = os.environ.get("BIND") or f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+
+# Threaded workers: requests mostly wait on Overpass and storage I/O, and
+# threads within a worker share its location cache
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", min(4, multiprocessing.cpu_count())))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+# A miss can try three Overpass endpoints with a 30 second timeout each
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.environ.get("GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# Load the app (and warm the cache) once in the master, then fork
+preload_app = True
+
+accesslog = "-"
+errorlog = "-"
+
+def when_ready(server):
+    # Move the warmed cache out of the collector's generations so the
+    # workers' garbage collections don't write to, and un-share, its pages
+    gc.freeze()
+    server.log.info(f"Preloaded app frozen for copy-on-write sharing ({gc.get_freeze_count()} objects)")
+
+def post_fork(server, worker):
+    # Membership changes made through a sibling reach this worker even when idle
+    from app.utils.sharding import start_membership_watcher
+    start_membership_watcher()
+
+def worker_exit(server, worker):
+    # Each worker merges the locations it fetched into the shared snapshot
+    from app.utils.db_loader import get_snapshot_path, save_cache_snapshot
+    if get_snapshot_path():
+        try:
+            save_cache_snapshot()
+        except Exception as e:
+            server.log.error(f"Failed to snapshot the location cache: {e}")
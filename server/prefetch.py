@@ -0,0 +1,299 @@
+"""
+Warm the location cache for a region ahead of use
+
+    python prefetch.py --bbox 12.90,80.15,13.15,80.30 --step 500
+    python prefetch.py --polygon chennai.geojson --step 400 --workers 4
+
+Grid points step meters apart are enumerated over the bounding box
+(south,west,north,east) or GeoJSON polygon. Points already in the cache are
+skipped, and the rest are fetched through the rate-limited Overpass
+scheduler at background priority. Every point's outcome, with its data, is
+appended to a checkpoint file, so an interrupted run resumes where it
+stopped without losing the points it had fetched.
+
+Results go wherever the server reads cached locations from: the location
+cache (a LOCATION_CACHE=shared file is visible to running workers at once),
+the Redis tier when REDIS_URL is set, and the CACHE_SNAPSHOT_PATH snapshot,
+which servers restore on startup or merge on POST /atm/v1/merge-snapshot.
+
+Run servers with LOCATION_CACHE=shared or REDIS_URL to serve prefetched
+locations as soon as they are fetched. With the default per-process cache,
+merge-snapshot only reaches the worker that serves it, so each worker
+otherwise picks the results up on its next start.
+"""
+import os
+import sys
+import json
+import math
+import time
+import hashlib
+import logging
+import signal
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.utils import factors
+from app.utils.bptree import bptree
+from app.utils.geokey import canonical_coords
+from app.utils.overpass import BACKGROUND, UpstreamBusy
+from app.utils.redis_cache import get_l2_cache
+from app.utils.db_loader import initialize_cache, get_snapshot_path, save_cache_snapshot
+from app.routes.atm_routes import cache_location, PROXIMITY_DEGREES
+
+logger = logging.getLogger("prefetch")
+
+# Refuse to enumerate more points than this without --max-points
+DEFAULT_MAX_POINTS = 5000
+# Merge results into the snapshot after this many fetches, and at the end
+SNAPSHOT_EVERY = 100
+
+def load_polygon(path):
+    """
+    Read the outer ring of a GeoJSON Polygon (bare, Feature or first feature
+    of a FeatureCollection) as a list of (lat, lng) pairs
+    """
+    with open(path) as polygon_file:
+        geometry = json.load(polygon_file)
+    if geometry.get("type") == "FeatureCollection":
+        geometry = geometry["features"][0]
+    if geometry.get("type") == "Feature":
+        geometry = geometry["geometry"]
+    if geometry.get("type") != "Polygon":
+        raise ValueError(f"{path} is not a GeoJSON Polygon")
+    # GeoJSON positions are [longitude, latitude]
+    return [(lat, lng) for lng, lat, *_ in geometry["coordinates"][0]]
+
+def point_in_polygon(lat, lng, polygon):
+    """Ray casting test of a point against a ring of (lat, lng) pairs"""
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        lat_i, lng_i = polygon[i]
+        lat_j, lng_j = polygon[j]
+        if (lat_i > lat) != (lat_j > lat):
+            crossing = lng_i + (lat - lat_i) / (lat_j - lat_i) * (lng_j - lng_i)
+            if lng < crossing:
+                inside = not inside
+        j = i
+    return inside
+
+def grid_points(bbox, step, polygon=None):
+    """
+    Yield canonical grid points step meters apart covering a bounding box
+
+    Rows are step meters apart in latitude; within a row, points are step
+    meters apart in longitude at that row's latitude.
+    """
+    south, west, north, east = bbox
+    lat_step = step / factors.METERS_PER_DEGREE
+    lat = south
+    while lat <= north + 1e-9:
+        lng_step = step / (factors.METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        lng = west
+        while lng <= east + 1e-9:
+            if polygon is None or point_in_polygon(lat, lng, polygon):
+                yield canonical_coords((lat, lng))
+            lng += lng_step
+        lat += lat_step
+
+def default_checkpoint_path(bbox, step, polygon):
+    """Checkpoint file named after the region and step, so reruns find it"""
+    digest = hashlib.sha1(json.dumps([bbox, step, polygon]).encode()).hexdigest()[:12]
+    return f"prefetch-{digest}.jsonl"
+
+class Checkpoint:
+    """
+    Append-only JSON lines record of the points a job has finished
+
+    Fetched points are recorded with their location data, which a resumed
+    run puts back in the cache, so results never depend on a snapshot having
+    been written before the job stopped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.results = {}
+        self.failed = set()
+        self._file = None
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as checkpoint:
+                for line in checkpoint:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    key = tuple(entry["key"])
+                    if entry["status"] == "failed":
+                        self.failed.add(key)
+                    else:
+                        self.results[key] = entry["data"]
+                        self.failed.discard(key)
+
+    def record(self, key, data=None):
+        """Record a fetched point with its data, or a failed one when data is None"""
+        entry = {"key": list(key), "status": "failed" if data is None else "done", "data": data}
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a")
+            self._file.write(json.dumps(entry, default=str) + "\n")
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+def is_cached(coords, l2_cache):
+    """Whether coords, or a location within the proximity radius, is cached"""
+    if bptree.search(coords) is not None or bptree.nearest(coords, PROXIMITY_DEGREES) is not None:
+        return True
+    return l2_cache is not None and l2_cache.get(coords) is not None
+
+def prefetch_point(coords, stopping=None):
+    """
+    Fetch one location at background priority and store it in every tier
+
+    Args:
+        coords (tuple): (lat, lng) to fetch
+        stopping (threading.Event, optional): Set on interruption; stops
+            waiting for a saturated scheduler
+
+    Returns:
+        dict: The location data, or None when Overpass had no data or the
+        run was interrupted while waiting
+    """
+    stopping = stopping or threading.Event()
+    while True:
+        try:
+            result = factors.calculate_location_data(coords[0], coords[1], priority=BACKGROUND)
+            break
+        except UpstreamBusy as e:
+            # The scheduler is saturated; wait for it rather than giving up,
+            # unless the run is interrupted meanwhile
+            if stopping.wait(e.retry_after or 5):
+                return None
+    if result.get("fallback"):
+        return None
+    result["cache_source"] = "prefetch"
+    result["timestamp"] = time.time()
+    cache_location(coords, result)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm the LocaCash location cache for a region")
+    region = parser.add_mutually_exclusive_group(required=True)
+    region.add_argument("--bbox", help="south,west,north,east in degrees")
+    region.add_argument("--polygon", help="GeoJSON file with the region's polygon")
+    parser.add_argument("--step", type=float, default=500, help="grid spacing in meters")
+    parser.add_argument("--workers", type=int, default=2, help="concurrent fetches")
+    parser.add_argument("--checkpoint", help="checkpoint file (default derived from the region)")
+    parser.add_argument("--snapshot", help="snapshot file to merge results into (default CACHE_SNAPSHOT_PATH)")
+    parser.add_argument("--retry-failed", action="store_true", help="fetch points that failed in an earlier run")
+    parser.add_argument("--max-points", type=int, default=DEFAULT_MAX_POINTS)
+    parser.add_argument("--dry-run", action="store_true", help="count the points to fetch and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.step <= 0:
+        parser.error("--step must be positive")
+    polygon = None
+    if args.polygon:
+        polygon = load_polygon(args.polygon)
+        lats = [lat for lat, _ in polygon]
+        lngs = [lng for _, lng in polygon]
+        bbox = (min(lats), min(lngs), max(lats), max(lngs))
+    else:
+        try:
+            bbox = tuple(float(value) for value in args.bbox.split(","))
+        except ValueError:
+            bbox = ()
+        if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+            parser.error("--bbox must be south,west,north,east")
+
+    points = list(dict.fromkeys(grid_points(bbox, args.step, polygon)))
+    if len(points) > args.max_points:
+        print(f"{len(points)} grid points exceed --max-points {args.max_points}; raise it or increase --step")
+        sys.exit(1)
+
+    snapshot_path = args.snapshot or get_snapshot_path()
+    l2_cache = get_l2_cache()
+    if not snapshot_path and l2_cache is None and not getattr(bptree, "shared", False):
+        print("Nowhere to keep results: set CACHE_SNAPSHOT_PATH (or --snapshot), REDIS_URL or LOCATION_CACHE=shared")
+        sys.exit(1)
+
+    checkpoint_path = args.checkpoint or default_checkpoint_path(bbox, args.step, args.polygon)
+    checkpoint = Checkpoint(checkpoint_path)
+    finished = set(checkpoint.results)
+    if not args.retry_failed:
+        finished |= checkpoint.failed
+
+    # Load what the servers already have, and what earlier runs fetched
+    initialize_cache()
+    bptree.insert_many(checkpoint.results.items())
+    pending = [coords for coords in points if coords not in finished and not is_cached(coords, l2_cache)]
+    print(
+        f"{len(points)} grid points, {len(points) - len(pending)} already cached or checkpointed, "
+        f"{len(pending)} to fetch (checkpoint: {checkpoint_path})"
+    )
+    if args.dry_run or not pending:
+        checkpoint.close()
+        return
+
+    progress = {"fetched": 0, "failed": 0}
+    progress_lock = threading.Lock()
+    stopping = threading.Event()
+    started = time.time()
+
+    def run(coords):
+        try:
+            data = prefetch_point(coords, stopping)
+        except Exception as e:
+            logger.error(f"Failed to prefetch {coords}: {e}")
+            data = None
+        if data is None and stopping.is_set():
+            # Cut short by the interruption; leave it for the next run
+            return
+        checkpoint.record(coords, data)
+        ok = data is not None
+        with progress_lock:
+            progress["fetched" if ok else "failed"] += 1
+            finished_count = progress["fetched"] + progress["failed"]
+            if snapshot_path and ok and progress["fetched"] % SNAPSHOT_EVERY == 0:
+                save_cache_snapshot(snapshot_path)
+        if finished_count % 10 == 0 or finished_count == len(pending):
+            rate = finished_count / (time.time() - started)
+            print(f"{finished_count}/{len(pending)} points ({progress['failed']} failed, {rate * 60:.1f}/min)")
+
+    def interrupt(signum, frame):
+        # A second SIGTERM stops at once; the checkpoint already holds every result
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, interrupt)
+
+    pool = ThreadPoolExecutor(max_workers=args.workers)
+    try:
+        for _ in pool.map(run, pending):
+            pass
+    except KeyboardInterrupt:
+        print("Interrupted; finishing in-flight points. Rerun the same command to resume")
+        stopping.set()
+        pool.shutdown(cancel_futures=True)
+    finally:
+        pool.shutdown()
+        if snapshot_path:
+            save_cache_snapshot(snapshot_path)
+        checkpoint.close()
+
+    print(
+        f"Fetched {progress['fetched']} points, {progress['failed']} failed, in {time.time() - started:.0f}s. "
+        "Servers with LOCATION_CACHE=shared or REDIS_URL already see the results; "
+        "others merge the snapshot on POST /atm/v1/merge-snapshot."
+    )
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,7 @@
 from app import create_app
+import os
 import logging
-from flask_cors import CORS
 from dotenv import load_dotenv
-from app.utils.db_loader import initialize_cache
 
 # Load environment variables
 load_dotenv()
@@ -16,15 +15,10 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
-    # Initialize the cache system
-    initialize_cache()
-    
-    # Create and run the Flask app
+    # Development server only; production runs under gunicorn (see wsgi.py).
+    # The reloader re-imports the app in a child process and would warm the
+    # cache twice, so it only runs with FLASK_DEBUG=1.
+    debug = os.environ.get("FLASK_DEBUG") == "1"
     app = create_app()
-    CORS(app, resources={
-        r"/*": {
-            "origins": ["http://localhost:5173", "http://localhost:3000"]
-        }
-    })
-    logger.info("Starting Flask server...")
-    app.run(host="0.0.0.0", port=8080, debug=True)
\ No newline at end of file
+    logger.info("Starting Flask development server...")
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 8080)), debug=debug, threaded=True)
@@ -0,0 +1,110 @@
+"""
+Run a sharded LocaCash cluster as local processes, and change its membership
+
+    python shard_cluster.py start --nodes 3 --base-port 5001
+    python shard_cluster.py set-nodes --nodes http://127.0.0.1:5001,http://127.0.0.1:5002 \\
+        --leaving http://127.0.0.1:5003
+
+start launches one run.py process per node on consecutive ports, each with
+SHARD_NODES listing every node and SHARD_SELF naming itself, and stops them
+all on Ctrl-C. Nodes share SHARD_SECRET from the environment; when it is
+unset, start generates one and prints it for set-nodes to use. Every other setting (storage, Overpass endpoints, ...) is
+inherited from the environment; each node keeps its own in-process cache.
+
+set-nodes sends a new membership to every node in it, and to the nodes
+leaving it, which then hand their entries over to the new owners. To add a
+node, start it with the new SHARD_NODES list first, then run set-nodes with
+the same list.
+"""
+import os
+import sys
+import time
+import secrets
+import argparse
+import subprocess
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def wait_until_up(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{url}/healthz", timeout=1).ok:
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    return False
+
+def start(args):
+    urls = [f"http://127.0.0.1:{args.base_port + i}" for i in range(args.nodes)]
+    secret = os.environ.get("SHARD_SECRET")
+    if not secret:
+        secret = secrets.token_hex(16)
+        print(f"Generated a shard secret; run set-nodes with SHARD_SECRET={secret}")
+    processes = []
+    for i, url in enumerate(urls):
+        env = dict(
+            os.environ,
+            PORT=str(args.base_port + i),
+            SHARD_NODES=",".join(urls),
+            SHARD_SELF=url,
+            SHARD_SECRET=secret,
+            LOCATION_CACHE="local"
+        )
+        processes.append(subprocess.Popen([sys.executable, "run.py"], env=env))
+
+    try:
+        for url in urls:
+            print(f"{url} {'up' if wait_until_up(url) else 'NOT RESPONDING'}")
+        print("Cluster running; Ctrl-C stops every node")
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+        print("A node exited; stopping the cluster")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+def set_nodes(args):
+    nodes = [node.strip().rstrip("/") for node in args.nodes.split(",") if node.strip()]
+    leaving = [node.strip().rstrip("/") for node in (args.leaving or "").split(",") if node.strip()]
+    if not os.environ.get("SHARD_SECRET"):
+        sys.exit("SHARD_SECRET must be set to the cluster's shard secret")
+    headers = {"X-Shard-Token": os.environ["SHARD_SECRET"]}
+
+    failed = False
+    for node in dict.fromkeys(nodes + leaving):
+        try:
+            response = requests.put(f"{node}/internal/v1/shard/nodes", json={"nodes": nodes}, headers=headers, timeout=10)
+            print(f"{node}: {response.status_code} {response.json().get('data', response.text)}")
+            failed |= not response.ok
+        except requests.exceptions.RequestException as e:
+            print(f"{node}: unreachable ({e})")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run and reconfigure a local sharded LocaCash cluster")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    start_parser = commands.add_parser("start", help="start nodes as local processes")
+    start_parser.add_argument("--nodes", type=int, default=3)
+    start_parser.add_argument("--base-port", type=int, default=5001)
+    start_parser.set_defaults(run=start)
+
+    nodes_parser = commands.add_parser("set-nodes", help="change the ring's membership")
+    nodes_parser.add_argument("--nodes", required=True, help="comma-separated URLs of every node in the new ring")
+    nodes_parser.add_argument("--leaving", help="comma-separated URLs of nodes being removed")
+    nodes_parser.set_defaults(run=set_nodes)
+
+    args = parser.parse_args()
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+Production WSGI entry point
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+gunicorn.conf.py preloads this module in the master process, so the cache
+is warmed once (eagerly, by default) before the workers are forked and
+every worker starts with it already loaded, shared copy-on-write.
+"""
+import os
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+    format='%(asctime)s - %(process)d - %(name)s - %(levelname)s - %(message)s'
+)
+
+from app import create_app
+
+# A background warmup thread would not survive the fork into workers
+app = create_app(warmup=os.environ.get("CACHE_WARMUP", "eager"))